@@ -4,8 +4,10 @@ from typing import Literal
 from IPython.display import Image, display
 
 from lang_graph_project.schemas.state import State
+from lang_graph_project.schemas import router
 from lang_graph_project.constants.prompt_templates import triage_system_prompt_template, triage_user_prompt_template
 from lang_graph_project.constants.variables import profile, prompt_instructions
+from lang_graph_project.agent.triage import route_batch
 from lang_graph_project.agent.memory import new_in_store_memory
 
 import triage_agent
@@ -30,10 +32,33 @@ class EmailAgent():
     def triage_router(self, state: State) -> Command[
         Literal["response_agent", "__end__"]
     ]:
-        author = state['email_input']['author']
-        to = state['email_input']['to']
-        subject = state['email_input']['subject']
-        email_thread = state['email_input']['email_thread']
+        result = self.triage_agent.llm_router.invoke(
+            self.triage_messages(state['email_input'])
+        )
+        return self.route(result, state['email_input'])
+
+    def triage_batch(self, 
+                     emails: list[dict], 
+                     max_concurrency: int = 8, 
+                     pack_size: int = 1) -> list[router.Router]:
+        """Classify a backlog of emails, see `lang_graph_project.agent.triage.route_batch`.
+
+        Returns:
+            list[Router]: One classification per email, in the same order as `emails`.
+        """
+        return route_batch(
+            self.triage_agent.llm_router,
+            [self.triage_messages(email_input) for email_input in emails],
+            max_concurrency=max_concurrency,
+            llm_batch_router=self.triage_agent.llm_batch_router,
+            pack_size=pack_size,
+        )
+
+    def triage_messages(self, email_input: dict) -> list[dict]:
+        author = email_input['author']
+        to = email_input['to']
+        subject = email_input['subject']
+        email_thread = email_input['email_thread']
         user_prompt = triage_user_prompt_template.format(
             author=author, 
             to=to, 
@@ -58,13 +83,14 @@ class EmailAgent():
             examples=None
             )
         
-        result = self.triage_agent.llm_router.invoke(
-            [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
-        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
 
+    def route(self, result: router.Router, email_input: dict) -> Command[
+        Literal["response_agent", "__end__"]
+    ]:
         if result.classification == "respond":
             print("📧 Classification: RESPOND - This email requires a response")
             goto = "response_agent"
@@ -72,7 +98,7 @@ class EmailAgent():
                 "messages": [
                     {
                         "role": "user",
-                        "content": f"Respond to the email {state['email_input']}",
+                        "content": f"Respond to the email {email_input}",
                     }
                 ]
             }
@@ -2,7 +2,7 @@ from langgraph.prebuilt import create_react_agent
 
 from lang_graph_project.agent.tools import write_email, schedule_meeting, check_calendar_availability
 from lang_graph_project.agent.prompt import create_prompt_with_memory
-from lang_graph_project.agent.memory import new_manage_memory_tool, new_search_memory_tool, new_in_store_memory
+from lang_graph_project.agent.memory import new_manage_memory_tool, new_search_memory_tool, new_store
 from lang_graph_project.utils.open_ai import create_model
 
 class ReactAgent:
@@ -12,7 +12,7 @@ class ReactAgent:
         # so we use default model_provider="openai" instead
         # llm = create_model(model=model, model_provider="ollama")
         self.chat = create_model(model=model)
-        self.store = new_in_store_memory(model=model)
+        self.store = new_store(model=model)
         self.manage_memory_tool = new_manage_memory_tool()
         self.search_memory_tool = new_search_memory_tool()
         self.tools = [
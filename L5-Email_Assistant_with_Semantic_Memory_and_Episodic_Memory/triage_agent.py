@@ -1,18 +1,31 @@
 
 from lang_graph_project.schemas import router
 from lang_graph_project.utils.open_ai import create_model
+from lang_graph_project.agent.triage import new_triage_router, tiered_router
+from lang_graph_project.config import triage as triage_config
 
 from lang_graph_project.constants.prompt_templates import triage_system_prompt_template, triage_user_prompt_template
 from lang_graph_project.constants.variables import profile, prompt_instructions
 
 class TriageAgent:
-    def __init__(self, model:str):
+    def __init__(self, model:str, escalation_model: str | None = triage_config.ESCALATION_MODEL):
         self.model = model
+        self.escalation_model = escalation_model
         # with_structured_output is not implemented for this model and model_provider="ollama"
         # so we use default model_provider="openai" instead
         # llm = create_model(model=model, model_provider="ollama")
         self.chat = create_model(model=model)
-        self.llm_router = self.chat.with_structured_output(router.Router)
+        # answers of `model` the cascade doesn't trust are asked again to escalation_model
+        self.escalation_chat = create_model(model=escalation_model) if escalation_model else None
+        # cached when config/open_ai.py:RESPONSE_CACHE is set
+        self.llm_router = new_triage_router(self.chat, self.escalation_chat)
+        # several emails packed into one request, see EmailAgent.triage_batch
+        self.llm_batch_router = self.chat.with_structured_output(router.BatchRouter)
+
+    def stats(self) -> dict:
+        """Per-tier latency and escalation rate of the cascade, empty without escalation_model."""
+        tiered = tiered_router(self.llm_router)
+        return tiered.stats() if tiered is not None else {}
 
 if __name__ == "__main__":
 
@@ -1,15 +1,44 @@
+import asyncio
 import json
+import weakref
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Command
+from langgraph.types import Command, StateSnapshot
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from typing import Literal
 from IPython.display import Image, display
-from langgraph.config import get_store
+from langgraph.config import get_store, get_stream_writer
+from langgraph.utils.runnable import RunnableCallable
 from langmem import create_multi_prompt_optimizer
 
 from lang_graph_project.schemas.state import State
-from lang_graph_project.constants.prompt_templates import triage_system_prompt_template, triage_user_prompt_template
-from lang_graph_project.constants.variables import profile, prompt_instructions
-from lang_graph_project.utils.formator import format_few_shot_examples_v1
+from lang_graph_project.schemas import router
+from lang_graph_project.schemas.events import (
+    DraftEvent,
+    EmailEvent,
+    TokenEvent,
+    ToolCallFinished,
+    ToolCallStarted,
+    TriageEvent,
+)
+from lang_graph_project.constants.prompt_templates import triage_user_prompt_template
+from lang_graph_project.agent.triage import route_batch
+from lang_graph_project.agent.memory import search_many
+from lang_graph_project.agent.near_duplicates import NearDuplicateCache, email_id, email_text
+from lang_graph_project.agent.local_classifier import LocalTriageClassifier, new_local_classifier
+from lang_graph_project.agent.pre_triage import PreTriage, new_pre_triage
+from lang_graph_project.agent.speculation import RespondPredictor, SpeculationGate, new_respond_predictor
+from lang_graph_project.agent.sqlite_checkpointer import new_checkpointer
+from lang_graph_project.config import open_ai as open_ai_config
+from lang_graph_project.config import triage as triage_config
+from lang_graph_project.config import prompt as prompt_config
+from lang_graph_project.config import store as store_config
+from lang_graph_project.utils.open_ai import new_embbedings
+from lang_graph_project.utils.aio import bounded_as_completed
+from lang_graph_project.utils.inbox import stream_inbox
+from lang_graph_project.utils.token_budget import TokenBudget, new_token_budget
 
 import triage_agent
 import main_agent
@@ -17,116 +46,601 @@ import main_agent
 class EmailAgent():
     def __init__(self, 
                  triage_agent: triage_agent.TriageAgent, 
-                 main_agent: main_agent.ReactAgent):
+                 main_agent: main_agent.ReactAgent,
+                 max_concurrency: int = 8,
+                 near_duplicate_threshold: float | None = open_ai_config.NEAR_DUPLICATE_THRESHOLD,
+                 pre_triage: PreTriage | None = None,
+                 local_classifier: LocalTriageClassifier | None = None,
+                 token_budget: TokenBudget | None = None,
+                 speculation: RespondPredictor | None = None,
+                 checkpointer: BaseCheckpointSaver | None = None):
         self.triage_agent = triage_agent
         self.main_agent = main_agent
+        # keeps long threads and examples within a token budget, see config/prompt.py
+        self.token_budget = token_budget
+        if self.token_budget is None and prompt_config.TOKEN_BUDGET:
+            self.token_budget = new_token_budget()
+        # rules that settle the obvious emails before the triage model, see config/triage.py
+        self.pre_triage = pre_triage
+        if self.pre_triage is None and triage_config.PRE_TRIAGE:
+            self.pre_triage = new_pre_triage()
+        # likely respond emails start the response agent while triage runs, see config/triage.py
+        self.speculation = speculation
+        if self.speculation is None and triage_config.SPECULATION:
+            self.speculation = new_respond_predictor()
+        # every step of an email is checkpointed on its own thread, see `resume` and config/store.py
+        self.checkpointer = checkpointer
+        if self.checkpointer is None and store_config.CHECKPOINTER:
+            self.checkpointer = new_checkpointer()
+        # upper bound of emails processed at the same time by the async API
+        self.max_concurrency = max_concurrency
+        # event loop -> its semaphore, an asyncio semaphore is bound to the loop that uses it
+        self.semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # embeddings of the incoming emails, the store's own so that the few-shot search reuses them
+        self.embeddings = (
+            getattr(self.main_agent.store, "embeddings", None) 
+            or new_embbedings(model=self.main_agent.model)
+        )
+        # emails nearly identical to a recently classified one skip the triage model
+        self.near_duplicates = None
+        if near_duplicate_threshold is not None:
+            self.near_duplicates = NearDuplicateCache(
+                threshold=near_duplicate_threshold,
+                window=open_ai_config.NEAR_DUPLICATE_WINDOW,
+            )
+        # so do the emails a classifier trained on the user's examples is sure about
+        self.local_classifier = local_classifier
+        if self.local_classifier is None and triage_config.LOCAL_CLASSIFIER:
+            self.local_classifier = new_local_classifier(self.embeddings)
         email_agent = StateGraph(State)
-        email_agent = email_agent.add_node("triage_router", self.triage_router)
+        # sync and async implementations of the same node, picked by invoke/ainvoke
+        email_agent = email_agent.add_node(
+            "triage_router", 
+            RunnableCallable(self.triage_router, self.atriage_router), 
+            destinations=("response_agent", END),
+        )
         email_agent = email_agent.add_node("response_agent", self.main_agent.agent)
-        email_agent = email_agent.add_edge(START, "triage_router")
+        if self.pre_triage is not None:
+            email_agent = email_agent.add_node(
+                "pre_triage_router",
+                RunnableCallable(self.pre_triage_router, self.apre_triage_router),
+                destinations=("triage_router", END),
+            )
+            email_agent = email_agent.add_edge(START, "pre_triage_router")
+        else:
+            email_agent = email_agent.add_edge(START, "triage_router")
         # langgraph.StateGraph.compile has some changes on compile parameters
         # so the following code commented below cannot be run correctly.
         # email_agent = email_agent.compile(store)
-        email_agent = email_agent.compile(store=self.main_agent.store)
+        email_agent = email_agent.compile(store=self.main_agent.store, checkpointer=self.checkpointer)
         self.email_agent = email_agent
 
+    def pre_triage_router(self, state: State, config) -> Command[
+        Literal["triage_router", "__end__"]
+    ]:
+        labels = None
+        if self.pre_triage.reputation is not None:
+            labels = self.pre_triage.reputation.get(
+                get_store(), config['configurable']['langgraph_user_id']
+            )
+        return self.pre_route(state['email_input'], labels)
+
+    async def apre_triage_router(self, state: State, config) -> Command[
+        Literal["triage_router", "__end__"]
+    ]:
+        labels = None
+        if self.pre_triage.reputation is not None:
+            labels = await self.pre_triage.reputation.aget(
+                get_store(), config['configurable']['langgraph_user_id']
+            )
+        return self.pre_route(state['email_input'], labels)
+
+    def pre_route(self, email_input: dict, labels) -> Command[
+        Literal["triage_router", "__end__"]
+    ]:
+        result = self.pre_triage.classify(email_input, labels)
+        if result is None:
+            # not obvious, the triage model decides
+            return Command(goto="triage_router")
+        return self.route(result, email_input)
+
     def triage_router(self, state: State, config) -> Command[
         Literal["response_agent", "__end__"]
     ]:
         store = get_store()
-        author = state['email_input']['author']
-        to = state['email_input']['to']
-        subject = state['email_input']['subject']
-        email_thread = state['email_input']['email_thread']
-        user_prompt = triage_user_prompt_template.format(
-            author=author, 
-            to=to, 
-            subject=subject, 
-            email_thread=email_thread
+        email_input = state['email_input']
+        if self.near_duplicates is None and self.local_classifier is None:
+            result = self.triage_agent.llm_router.invoke(
+                self.triage_messages(email_input, config, store)
             )
-        
+            return self.route(result, email_input)
+
+        langgraph_user_id = config['configurable']['langgraph_user_id']
+        version, _ = self.main_agent.prompts.entry(store, langgraph_user_id)
+        if self.local_classifier is not None:
+            self.local_classifier.refresh(store, langgraph_user_id)
+        vector = self.embed_emails([email_input])[0]
+        results, local = self.shortcut(langgraph_user_id, version, [email_input], [vector])
+        result = results[0]
+        if result is None:
+            result = self.triage_agent.llm_router.invoke(
+                self.triage_messages(email_input, config, store)
+            )
+            self.learn(langgraph_user_id, version, email_input, vector, local[0], result)
+        return self.route(result, email_input)
+
+    async def atriage_router(self, state: State, config) -> Command[
+        Literal["response_agent", "__end__"]
+    ]:
+        email_input = state['email_input']
+        if self.speculation is not None and self.speculation.likely(email_input):
+            return await self.speculate(email_input, config)
+        return self.route(await self.aclassify(email_input, config), email_input)
+
+    async def aclassify(self, email_input: dict, config) -> router.Router:
+        store = get_store()
+        if self.near_duplicates is None and self.local_classifier is None:
+            return await self.triage_agent.llm_router.ainvoke(
+                await self.atriage_messages(email_input, config, store)
+            )
+
+        langgraph_user_id = config['configurable']['langgraph_user_id']
+        (version, _), vectors, _ = await asyncio.gather(
+            self.main_agent.prompts.aentry(store, langgraph_user_id),
+            self.aembed_emails([email_input]),
+            self.local_classifier.arefresh(store, langgraph_user_id)
+            if self.local_classifier is not None else asyncio.sleep(0),
+        )
+        results, local = self.shortcut(langgraph_user_id, version, [email_input], vectors)
+        result = results[0]
+        if result is None:
+            result = await self.triage_agent.llm_router.ainvoke(
+                await self.atriage_messages(email_input, config, store)
+            )
+            self.learn(langgraph_user_id, version, email_input, vectors[0], local[0], result)
+        return result
+
+    async def speculate(self, email_input: dict, config) -> Command[
+        Literal["response_agent", "__end__"]
+    ]:
+        """Triage and the response agent at the same time, for an email predicted as respond.
+
+        The side-effecting tools of the agent wait for triage (see `SpeculationGate`): a
+        respond classification lets them through and the draft is kept, anything else
+        cancels the agent before it had any effect.
+        """
+        gate = SpeculationGate()
+        agent_config = {
+            **config,
+            "configurable": {**config.get("configurable", {}), "speculation_gate": gate},
+        }
+        draft = asyncio.create_task(
+            self.main_agent.agent.ainvoke({"messages": self.respond_messages(email_input)}, agent_config)
+        )
+        try:
+            result = await self.aclassify(email_input, config)
+        except BaseException:
+            gate.cancel()
+            draft.cancel()
+            await asyncio.gather(draft, return_exceptions=True)
+            raise
+        if result.classification != "respond":
+            gate.cancel()
+            draft.cancel()
+            # absorbs the end of the draft, not a cancellation of this node
+            await asyncio.gather(draft, return_exceptions=True)
+            self.speculation.record(gate)
+            return self.route(result, email_input)
+
+        print("📧 Classification: RESPOND - This email requires a response (drafted ahead)")
+        self.publish(result)
+        gate.confirm()
+        self.speculation.record(gate)
+        response = await draft
+        # the response agent already ran, its messages are the ones the node would have added
+        return Command(goto=END, update={"messages": response["messages"]})
+
+    def embed_emails(self, emails: list[dict]) -> list[list[float]]:
+        return self.embeddings.embed_documents([email_text(email_input) for email_input in emails])
+
+    async def aembed_emails(self, emails: list[dict]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents([email_text(email_input) for email_input in emails])
+
+    def shortcut(self, 
+                 langgraph_user_id: str, 
+                 version: int, 
+                 emails: list[dict], 
+                 vectors: list[list[float]]) -> tuple[list[router.Router | None], list[router.Router | None]]:
+        """Classify the emails that don't need the triage model.
+
+        Near-duplicates of recently classified emails come first, then the emails the
+        local classifier is confident about.
+
+        Returns:
+            tuple[list, list]: The result of each email, None when the model has to
+                decide, and the local classifier's answer of each email, for `learn`.
+        """
+        results: list[router.Router | None] = [None] * len(emails)
+        local: list[router.Router | None] = [None] * len(emails)
+        if self.near_duplicates is not None:
+            results = [
+                self.near_duplicates.match(langgraph_user_id, version, email_input, vector)
+                for email_input, vector in zip(emails, vectors)
+            ]
+        todo = [i for i, result in enumerate(results) if result is None]
+        if todo and self.local_classifier is not None:
+            predictions = self.local_classifier.predict(langgraph_user_id, [vectors[i] for i in todo])
+            for i, (answer, confident) in zip(todo, predictions):
+                local[i] = answer
+                if confident:
+                    results[i] = answer
+        return results, local
+
+    def learn(self, 
+              langgraph_user_id: str, 
+              version: int, 
+              email_input: dict, 
+              vector: list[float], 
+              local: router.Router | None, 
+              result: router.Router) -> None:
+        # the triage model's answer for an email that needed it
+        if self.near_duplicates is not None:
+            self.near_duplicates.add(langgraph_user_id, version, email_input, vector, result)
+        if self.local_classifier is not None:
+            self.local_classifier.record(local, result)
+
+    def thread_config(self, email_id: str, config) -> dict:
+        """`config` on the thread of an email, one per user and email id.
+
+        The thread keys the checkpoints of the email and the journal of its tool calls
+        (see `agent.tool_journal.ToolJournal`).
+        """
+        configurable = config.get("configurable", {})
+        langgraph_user_id = configurable.get("langgraph_user_id")
+        thread_id = f"{langgraph_user_id}:{email_id}" if langgraph_user_id else email_id
+        return {**config, "configurable": {**configurable, "thread_id": thread_id}}
+
+    def graph_input(self, email_input: dict, state: StateSnapshot | None) -> dict | None:
+        """Input of the run of an email: None to resume it from its last checkpoint."""
+        if state is not None and state.next:
+            return None
+        return {"email_input": email_input}
+
+    def process(self, email_input: dict, config) -> dict:
+        """Run the graph over one email.
+
+        With a checkpointer, an email whose run was interrupted resumes from its last step,
+        and one that already went through the graph returns its final state without any
+        model call.
+
+        Returns:
+            dict: The final graph state.
+        """
+        config = self.thread_config(email_id(email_input), config)
+        state = self.email_agent.get_state(config) if self.checkpointer is not None else None
+        if state is not None and state.values and not state.next:
+            return state.values
+        return self.email_agent.invoke(self.graph_input(email_input, state), config=config)
+
+    async def aprocess(self, email_input: dict, config) -> dict:
+        config = self.thread_config(email_id(email_input), config)
+        state = await self.email_agent.aget_state(config) if self.checkpointer is not None else None
+        if state is not None and state.values and not state.next:
+            return state.values
+        return await self.email_agent.ainvoke(self.graph_input(email_input, state), config=config)
+
+    def resume(self, email_id: str, config) -> dict:
+        """Finish the run of an email from its last checkpoint, e.g. after a crash or a deploy.
+
+        The steps already checkpointed (triage, the response agent's model calls and tool
+        results) are not run again.
+
+        Args:
+            email_id (str): `id` of the email input, see `agent.near_duplicates.email_id`.
+            config (dict): Same configuration as the interrupted run.
+
+        Returns:
+            dict: The final graph state.
+
+        Raises:
+            KeyError: The email has no checkpoint.
+        """
+        config = self.resumable_config(email_id, config)
+        state = self.email_agent.get_state(config)
+        if not state.values:
+            raise KeyError(f"no checkpoint of email {email_id}")
+        if not state.next:
+            return state.values
+        return self.email_agent.invoke(None, config=config)
+
+    async def aresume(self, email_id: str, config) -> dict:
+        config = self.resumable_config(email_id, config)
+        state = await self.email_agent.aget_state(config)
+        if not state.values:
+            raise KeyError(f"no checkpoint of email {email_id}")
+        if not state.next:
+            return state.values
+        return await self.email_agent.ainvoke(None, config=config)
+
+    def resumable_config(self, email_id: str, config) -> dict:
+        if self.checkpointer is None:
+            raise ValueError("resume needs a checkpointer, see config/store.py:CHECKPOINTER")
+        return self.thread_config(email_id, config)
+
+    async def aprocess_stream(self, 
+                              emails: AsyncIterable[dict], 
+                              config) -> AsyncIterator[tuple[dict, dict]]:
+        """Run the whole graph over a stream of emails, keeping several of them in flight.
+
+        At most `max_concurrency` emails (see `__init__`) run at the same time across all
+        callers, and the stream is only read as fast as emails complete.
+
+        Yields:
+            tuple[dict, dict]: The email input and the final graph state, in completion order.
+        """
+        async def process(email_input: dict) -> tuple[dict, dict]:
+            async with self.semaphore():
+                response = await self.aprocess(email_input, config)
+            return email_input, response
+
+        async for result in bounded_as_completed(emails, process, self.max_concurrency):
+            yield result
+
+    def semaphore(self) -> asyncio.Semaphore:
+        """The `max_concurrency` semaphore of the running event loop, shared by its callers."""
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self.semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def aprocess_inbox(self, 
+                             path: str, 
+                             config, 
+                             read_ahead: int = 64) -> AsyncIterator[tuple[dict, dict]]:
+        """`aprocess_stream` over a mailbox: an mbox file, a Maildir or a JSON Lines file.
+
+        The mailbox is read in a worker thread at most `read_ahead` emails ahead of the
+        graph, see `lang_graph_project.utils.inbox.stream_inbox`.
+        """
+        async for result in self.aprocess_stream(stream_inbox(path, read_ahead), config):
+            yield result
+
+    def triage_batch(self, 
+                     emails: list[dict], 
+                     config, 
+                     max_concurrency: int = 8, 
+                     pack_size: int = 1) -> list[router.Router]:
+        """Classify a backlog of emails, see `lang_graph_project.agent.triage.route_batch`.
+
+        Returns:
+            list[Router]: One classification per email, in the same order as `emails`.
+        """
+        store = self.main_agent.store
+        langgraph_user_id = config['configurable']['langgraph_user_id']
+        version, prompts = self.main_agent.prompts.entry(store, langgraph_user_id)
+        results: list[router.Router | None] = [None] * len(emails)
+        if self.pre_triage is not None:
+            labels = None
+            if self.pre_triage.reputation is not None:
+                labels = self.pre_triage.reputation.get(store, langgraph_user_id)
+            results = [self.pre_triage.classify(email_input, labels) for email_input in emails]
+        todo = [i for i, result in enumerate(results) if result is None]
+        vectors, local = {}, {}
+        if todo and (self.near_duplicates is not None or self.local_classifier is not None):
+            if self.local_classifier is not None:
+                self.local_classifier.refresh(store, langgraph_user_id)
+            # one embedding request for the whole batch
+            vectors = dict(zip(todo, self.embed_emails([emails[i] for i in todo])))
+            shortcut, local_answers = self.shortcut(
+                langgraph_user_id, version, [emails[i] for i in todo], [vectors[i] for i in todo]
+            )
+            for i, result, answer in zip(todo, shortcut, local_answers):
+                results[i], local[i] = result, answer
+            todo = [i for i in todo if results[i] is None]
+        if not todo:
+            return results
+
+        # few-shot examples of the whole batch in one store round-trip
+        examples = search_many(
+            store,
+            ("email_assistant", langgraph_user_id, "examples"),
+            [str({"email": emails[i]}) for i in todo]
+        )
+        routed = route_batch(
+            self.triage_agent.llm_router,
+            [
+                self.format_triage_messages(
+                    emails[i], email_examples, langgraph_user_id, version, prompts
+                )
+                for i, email_examples in zip(todo, examples)
+            ],
+            max_concurrency=max_concurrency,
+            llm_batch_router=self.triage_agent.llm_batch_router,
+            pack_size=pack_size,
+        )
+        for i, result in zip(todo, routed):
+            results[i] = result
+            if i in vectors:
+                self.learn(langgraph_user_id, version, emails[i], vectors[i], local[i], result)
+        return results
+
+    def triage_stream(self, 
+                      emails: Iterable[dict], 
+                      config, 
+                      batch_size: int = 64, 
+                      **kwargs) -> Iterator[tuple[dict, router.Router]]:
+        """`triage_batch` over an iterable of any size, `batch_size` emails at a time.
+
+        E.g. `triage_stream(email_inputs(open_inbox(path)), config)` classifies a whole
+        mailbox without ever holding more than one batch in memory.
+
+        Yields:
+            tuple[dict, Router]: The email input and its classification, in order.
+        """
+        iterator = iter(emails)
+        while batch := list(islice(iterator, batch_size)):
+            yield from zip(batch, self.triage_batch(batch, config, **kwargs))
+
+    def triage_messages(self, email_input: dict, config, store) -> list[dict]:
         namespace = (
             "email_assistant",
             config['configurable']['langgraph_user_id'],
             "examples"
         )
-        examples = self.main_agent.store.search(
+        examples = store.search(
             namespace, 
-            query=str({"email": state['email_input']})
+            query=str({"email": email_input})
         ) 
-        examples=format_few_shot_examples_v1(examples)
 
         langgraph_user_id = config['configurable']['langgraph_user_id']
-        namespace = (langgraph_user_id, )
-
-        triag_rules = prompt_instructions['triage_rules']
-        triage_ignore = triag_rules['ignore']
-        triage_notify = triag_rules['notify']
-        traige_email = triag_rules['respond']
-        
-        result = store.get(namespace, "triage_ignore")
-        if result is None:
-            store.put(
-                namespace, 
-                "triage_ignore", 
-                {"prompt": triage_ignore}
-            )
-            ignore_prompt = triage_ignore
-        else:
-            ignore_prompt = result.value['prompt']
-        result = store.get(namespace, "triage_notify")
-        if result is None:
-            store.put(
-                namespace, 
-                "triage_notify", 
-                {"prompt": triage_notify}
-            )
-            notify_prompt = triage_notify
-        else:
-            notify_prompt = result.value['prompt']
+        # the triage rules come from the per-user prompt cache, not from the store
+        version, prompts = self.main_agent.prompts.entry(store, langgraph_user_id)
 
-        result = store.get(namespace, "triage_respond")
-        if result is None:
-            store.put(
-                namespace, 
-                "triage_respond", 
-                {"prompt": traige_email}
+        return self.format_triage_messages(
+            email_input, examples, langgraph_user_id, version, prompts
+        )
+
+    async def atriage_messages(self, email_input: dict, config, store) -> list[dict]:
+        langgraph_user_id = config['configurable']['langgraph_user_id']
+        # the store round-trips don't depend on each other, so issue them together
+        examples, (version, prompts) = await asyncio.gather(
+            store.asearch(
+                ("email_assistant", langgraph_user_id, "examples"),
+                query=str({"email": email_input})
+            ),
+            self.main_agent.prompts.aentry(store, langgraph_user_id),
+        )
+        return self.format_triage_messages(
+            email_input, examples, langgraph_user_id, version, prompts
+        )
+
+    def format_triage_messages(self, 
+                               email_input: dict, 
+                               examples, 
+                               langgraph_user_id: str, 
+                               version: int, 
+                               prompts: dict[str, str]) -> list[dict]:
+        max_chars = 400
+        if self.token_budget is not None:
+            email_input, examples, _ = self.token_budget.fit(email_input, examples)
+            max_chars = None
+        author = email_input['author']
+        to = email_input['to']
+        subject = email_input['subject']
+        email_thread = email_input['email_thread']
+        user_prompt = triage_user_prompt_template.format(
+            author=author, 
+            to=to, 
+            subject=subject, 
+            email_thread=email_thread
             )
-            respond_prompt = traige_email
-        else:
-            respond_prompt = result.value['prompt']
-        
-        full_name = profile['full_name']
-        name = profile['name']
-        user_profile_background = profile['user_profile_background']
-
-        system_prompt = triage_system_prompt_template.format(
-            full_name=full_name,
-            name=name,
-            user_profile_background=user_profile_background,
-            triage_no=ignore_prompt,
-            triage_notify=notify_prompt,
-            triage_email=respond_prompt,
-            examples=examples
+
+        # profile and rules are rendered once per prompt version, only the examples change
+        system_prompt = self.main_agent.renderer.triage_system_prompt(
+            langgraph_user_id,
+            version,
+            prompts["triage_ignore"],
+            prompts["triage_notify"],
+            prompts["triage_respond"],
+            examples,
+            max_chars
             )
-        result = self.triage_agent.llm_router.invoke(
-            [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]
-        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def publish(self, result: router.Router) -> None:
+        """Send the triage decision to the custom stream, see `stream`."""
+        get_stream_writer()({"triage": result})
+
+    def stream(self, email_input: dict, config) -> Iterator[EmailEvent]:
+        """Run the graph over one email, yielding typed events as they happen.
+
+        Built on the "updates", "messages" and "custom" stream modes of the graph and its
+        subgraphs: the triage decision, the tokens of the response agent's model, its tool
+        calls and results, and its final answer. With speculation (see `speculate`), tokens
+        of a draft may come before the `TriageEvent` that confirms or discards it. With a
+        checkpointer, an interrupted run resumes and only streams its remaining steps, and
+        an email that already went through the graph streams nothing.
+
+        Yields:
+            EmailEvent: `TriageEvent`, `TokenEvent`, `ToolCallStarted`, `ToolCallFinished`, `DraftEvent`.
+        """
+        config = self.thread_config(email_id(email_input), config)
+        state = self.email_agent.get_state(config) if self.checkpointer is not None else None
+        if state is not None and state.values and not state.next:
+            # already went through the graph
+            return
+        for namespace, mode, payload in self.email_agent.stream(
+            self.graph_input(email_input, state),
+            config=config,
+            stream_mode=["updates", "messages", "custom"],
+            subgraphs=True,
+        ):
+            yield from self.events(namespace, mode, payload)
+
+    async def astream(self, email_input: dict, config) -> AsyncIterator[EmailEvent]:
+        config = self.thread_config(email_id(email_input), config)
+        state = await self.email_agent.aget_state(config) if self.checkpointer is not None else None
+        if state is not None and state.values and not state.next:
+            return
+        async for namespace, mode, payload in self.email_agent.astream(
+            self.graph_input(email_input, state),
+            config=config,
+            stream_mode=["updates", "messages", "custom"],
+            subgraphs=True,
+        ):
+            for event in self.events(namespace, mode, payload):
+                yield event
+
+    def events(self, namespace: tuple, mode: str, payload) -> Iterator[EmailEvent]:
+        """Typed events of one item of the graph stream."""
+        if mode == "custom":
+            if isinstance(payload, dict) and isinstance(payload.get("triage"), router.Router):
+                yield TriageEvent(**payload["triage"].model_dump())
+        elif mode == "messages":
+            chunk, metadata = payload
+            # tokens of the response agent, not of the triage model
+            if metadata.get("langgraph_node") == "agent" and isinstance(chunk, AIMessageChunk) \
+                    and isinstance(chunk.content, str) and chunk.content:
+                yield TokenEvent(delta=chunk.content)
+        elif mode == "updates" and namespace:
+            # nodes of the response agent's subgraph
+            for node, update in payload.items():
+                for message in (update or {}).get("messages", []) if isinstance(update, dict) else []:
+                    if node == "agent" and isinstance(message, AIMessage):
+                        for call in message.tool_calls:
+                            yield ToolCallStarted(id=call["id"], name=call["name"], args=call["args"])
+                        if not message.tool_calls:
+                            yield DraftEvent(content=str(message.content))
+                    elif node == "tools" and isinstance(message, ToolMessage):
+                        yield ToolCallFinished(
+                            id=message.tool_call_id,
+                            name=message.name or "",
+                            content=str(message.content),
+                            status=message.status,
+                        )
+
+    def respond_messages(self, email_input: dict) -> list[dict]:
+        if self.token_budget is not None:
+            email_input = self.token_budget.fit_email(email_input)
+        return [
+            {
+                "role": "user",
+                "content": f"Respond to the email {email_input}",
+            }
+        ]
 
+    def route(self, result: router.Router, email_input: dict) -> Command[
+        Literal["response_agent", "__end__"]
+    ]:
+        self.publish(result)
         if result.classification == "respond":
             print("📧 Classification: RESPOND - This email requires a response")
             goto = "response_agent"
-            update = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": f"Respond to the email {state['email_input']}",
-                    }
-                ]
-            }
+            update = {"messages": self.respond_messages(email_input)}
         elif result.classification == "ignore":
             print("🚫 Classification: IGNORE - This email can be safely ignored")
             update = None
@@ -140,6 +654,10 @@ class EmailAgent():
             raise ValueError(f"Invalid classification: {result.classification}")
         return Command(goto=goto, update=update)
 
+def new_email_agent(model: str) -> EmailAgent:
+    """The agent of a worker process, shared by all its users, see `agent.runtime.WorkerPool`."""
+    return EmailAgent(triage_agent.TriageAgent(model), main_agent.ReactAgent(model=model))
+
 if __name__ == "__main__":
     model = "qwen2.5-it:3b"
     agent = EmailAgent(
@@ -245,10 +763,11 @@ if __name__ == "__main__":
             name = old_prompt['name']
             print(f"updated {name}")
             if name == "main_agent":
-                store.put(
-                    ("lance",),
-                    "agent_instructions",
-                    {"prompt":updated_prompt['prompt']}
+                # goes through the prompt cache so that the cached copy is invalidated
+                agent.main_agent.prompts.update(
+                    store,
+                    "lance",
+                    {"agent_instructions": updated_prompt['prompt']}
                 )
             else:
                 #raise ValueError
@@ -326,16 +845,16 @@ if __name__ == "__main__":
             name = old_prompt['name']
             print(f"updated {name}")
             if name == "main_agent":
-                store.put(
-                    ("lance",),
-                    "agent_instructions",
-                    {"prompt":updated_prompt['prompt']}
+                agent.main_agent.prompts.update(
+                    store,
+                    "lance",
+                    {"agent_instructions": updated_prompt['prompt']}
                 )
             if name == "triage-ignore":
-                store.put(
-                    ("lance",),
-                    "triage_ignore",
-                    {"prompt":updated_prompt['prompt']}
+                agent.main_agent.prompts.update(
+                    store,
+                    "lance",
+                    {"triage_ignore": updated_prompt['prompt']}
                 )
             else:
                 #raise ValueError
@@ -1,59 +1,74 @@
 from langgraph.prebuilt import create_react_agent
+from langgraph.utils.runnable import RunnableCallable
 
-from lang_graph_project.agent.tools import write_email, schedule_meeting, check_calendar_availability
-from lang_graph_project.agent.prompt import create_prompt_with_memory
-from lang_graph_project.agent.memory import new_manage_memory_tool, new_search_memory_tool, new_in_store_memory
+from lang_graph_project.agent.tools import write_email, schedule_meeting, check_calendar_availability, with_journal, with_timeouts, with_side_effects_deferred
+from lang_graph_project.agent.prompt import create_prompt_with_memory, PromptRenderer
+from lang_graph_project.agent.memory import new_manage_memory_tool, new_search_memory_tool, new_store
+from lang_graph_project.agent.prompt_cache import ProceduralPromptCache
+from lang_graph_project.agent.compaction import MessageCompactor, new_message_compactor
+from lang_graph_project.config import prompt as prompt_config
 from lang_graph_project.utils.open_ai import create_model
-from lang_graph_project.constants.variables import prompt_instructions, profile
-from lang_graph_project.constants.prompt_templates import agent_system_prompt_memory_template_without_profile
 
 class ReactAgent:
-    def __init__(self, model:str):
+    def __init__(self, model:str, compactor: MessageCompactor | None = None):
         self.model = model
         # with_structured_output is not implemented for this model and model_provider="ollama"
         # so we use default model_provider="openai" instead
         # llm = create_model(model=model, model_provider="ollama")
         self.chat = create_model(model=model)
-        self.store = new_in_store_memory(model=model)
+        self.store = new_store(model=model)
+        # procedural memory of every user, read from the store once and kept until updated
+        # here or for the ttl of config/prompt.py, for updates made by other worker processes
+        self.prompts = ProceduralPromptCache(ttl=prompt_config.PROMPT_CACHE_TTL)
+        # system prompts rendered once per (user, prompt version), in the layout of config/prompt.py
+        self.renderer = PromptRenderer()
+        # old tool results are cut out of long histories, see config/prompt.py
+        self.compactor = compactor
+        if self.compactor is None and prompt_config.COMPACTION:
+            self.compactor = new_message_compactor(summarizer=self.chat)
         self.manage_memory_tool = new_manage_memory_tool()
         self.search_memory_tool = new_search_memory_tool()
-        self.tools = [
+        # the tool calls of a turn run concurrently, each under its timeout of config/tools.py;
+        # side-effecting ones wait for triage when the response is speculative (the wait isn't timed)
+        # and are journaled, so a retry or a resume doesn't make them twice
+        self.tools = with_side_effects_deferred(with_timeouts(with_journal([
             write_email, 
             schedule_meeting, 
             check_calendar_availability,
             self.manage_memory_tool,
             self.search_memory_tool,
-            ]
+            ])))
         self.agent = create_react_agent(
             model=self.chat,
             tools=self.tools,
-            prompt=self.create_prompt,
+            # sync and async prompt construction, picked by invoke/ainvoke
+            prompt=RunnableCallable(self.create_prompt, self.acreate_prompt),
             # Use this to ensure the store is passed to the agent 
             store = self.store,
         )
     def create_prompt(self, state, config, store):
         langgraph_user_id = config['configurable']['langgraph_user_id']
-        namespace = (langgraph_user_id, )
-        result = store.get(namespace, "agent_instructions")
-        if result is None:
-            store.put(
-                namespace, 
-                "agent_instructions", 
-                {"prompt": prompt_instructions["agent_instructions"]}
-            )
-            prompt = prompt_instructions["agent_instructions"]
-        else:
-            prompt = result.value['prompt']
-        
+        version, prompts = self.prompts.entry(store, langgraph_user_id)
+        messages = state['messages']
+        if self.compactor is not None:
+            messages = self.compactor.compact(messages)
+        return self.format_prompt(messages, langgraph_user_id, version, prompts["agent_instructions"])
+
+    async def acreate_prompt(self, state, config, store):
+        langgraph_user_id = config['configurable']['langgraph_user_id']
+        version, prompts = await self.prompts.aentry(store, langgraph_user_id)
+        messages = state['messages']
+        if self.compactor is not None:
+            messages = await self.compactor.acompact(messages)
+        return self.format_prompt(messages, langgraph_user_id, version, prompts["agent_instructions"])
+
+    def format_prompt(self, messages: list, langgraph_user_id: str, version: int, prompt: str):
         return [
             {
                 "role": "system", 
-                "content": agent_system_prompt_memory_template_without_profile.format(
-                    instructions=prompt, 
-                    **profile
-                )
+                "content": self.renderer.agent_system_prompt(langgraph_user_id, version, prompt)
             }
-        ] + state['messages']
+        ] + messages
 # Codes below are moved to class ReactAgent
 # llm = create_model(model=model)
 
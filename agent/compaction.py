@@ -0,0 +1,175 @@
+import json
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.runnables import Runnable
+
+from lang_graph_project.config import prompt as prompt_config
+from lang_graph_project.utils.token_budget import TokenCounter
+
+SUMMARY_PROMPT = """Summarize this result of the tool `{name}` in at most {tokens} tokens. \
+Keep names, dates, times, addresses and decisions, drop everything else.
+
+{content}"""
+
+# summaries are internal, kept out of the token stream of the agent (see email_agent.py:events)
+_SUMMARY_CONFIG = {"tags": ["nostream"]}
+
+class MessageCompactor:
+    """Keeps the message history sent to the response agent's model under a token threshold.
+
+    `create_react_agent` re-sends every tool call and result on every step. Once the
+    history is over `max_tokens`, the tool results older than the last `keep_turns` model
+    turns are replaced by a summary of at most `summary_tokens` tokens, then, if that is not
+    enough, dropped oldest first. Messages keep their order, ids and tool call ids, and
+    the graph state itself is never changed: only the prompt is compacted.
+
+    Summaries are made once per tool call and cached: by `summarizer` (a chat model) when
+    given, else by truncating the result.
+
+    Args:
+        max_tokens (int): Tokens of history above which it is compacted.
+        keep_turns (int): Last model turns (an AI message and its tool results) kept verbatim.
+        summary_tokens (int): Size of the summary of an old tool result.
+        summarizer (Runnable | None): Chat model writing the summaries, None to truncate.
+        counter (TokenCounter | None): Tokenizer, tiktoken's o200k_base if None.
+        maxsize (int): Number of summaries cached.
+    """
+
+    def __init__(self,
+                 max_tokens: int = 2000,
+                 keep_turns: int = 2,
+                 summary_tokens: int = 60,
+                 summarizer: Runnable | None = None,
+                 counter: TokenCounter | None = None,
+                 maxsize: int = 4096):
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.counter = counter or TokenCounter()
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        # tool call id -> summary
+        self.summaries: OrderedDict[str, str] = OrderedDict()
+        self.compacted = 0
+        self.tokens_saved = 0
+
+    def compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """`messages` with their old tool results summarized or dropped, if over `max_tokens`."""
+        old = self._old_results(messages)
+        if old is None:
+            return messages
+        missing = [messages[i] for i in old if self._cached(messages[i]) is None]
+        if missing and self.summarizer is not None:
+            answers = self.summarizer.batch(
+                [self._summary_prompt(m) for m in missing], config=_SUMMARY_CONFIG
+            )
+            self._remember(missing, [answer.content for answer in answers])
+        return self._replace(messages, old)
+
+    async def acompact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        old = self._old_results(messages)
+        if old is None:
+            return messages
+        missing = [messages[i] for i in old if self._cached(messages[i]) is None]
+        if missing and self.summarizer is not None:
+            answers = await self.summarizer.abatch(
+                [self._summary_prompt(m) for m in missing], config=_SUMMARY_CONFIG
+            )
+            self._remember(missing, [answer.content for answer in answers])
+        return self._replace(messages, old)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "compacted": self.compacted,
+                "tokens_saved": self.tokens_saved,
+                "summaries": len(self.summaries),
+            }
+
+    # Helpers
+
+    def _tokens(self, message: BaseMessage) -> int:
+        tokens = self.counter.count(str(message.content))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            tokens += self.counter.count(json.dumps([call["args"] for call in message.tool_calls]))
+        return tokens
+
+    def _old_results(self, messages: list[BaseMessage]) -> list[int] | None:
+        """Positions of the tool results that may be compacted, None when under the threshold."""
+        if sum(self._tokens(message) for message in messages) <= self.max_tokens:
+            return None
+        # start of the last keep_turns turns
+        boundary, turns = len(messages), 0
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], AIMessage):
+                turns += 1
+                if turns > self.keep_turns:
+                    break
+                boundary = i
+        old = [i for i in range(boundary) if isinstance(messages[i], ToolMessage)]
+        return old or None
+
+    def _summary_prompt(self, message: ToolMessage) -> list[dict]:
+        return [{"role": "user", "content": SUMMARY_PROMPT.format(
+            name=message.name or "tool", tokens=self.summary_tokens, content=message.content
+        )}]
+
+    def _cached(self, message: ToolMessage) -> str | None:
+        with self.lock:
+            summary = self.summaries.get(message.tool_call_id)
+            if summary is not None:
+                self.summaries.move_to_end(message.tool_call_id)
+            return summary
+
+    def _remember(self, messages: list[ToolMessage], summaries: list[str]) -> None:
+        with self.lock:
+            for message, summary in zip(messages, summaries):
+                self.summaries[message.tool_call_id] = summary
+                self.summaries.move_to_end(message.tool_call_id)
+            while len(self.summaries) > self.maxsize:
+                self.summaries.popitem(last=False)
+
+    def _summary(self, message: ToolMessage) -> str:
+        summary = self._cached(message)
+        if summary is None:
+            content = str(message.content)
+            summary = self.counter.truncate(content, self.summary_tokens)
+            if summary != content:
+                summary += " [...]"
+            self._remember([message], [summary])
+        return summary
+
+    def _replace(self, messages: list[BaseMessage], old: list[int]) -> list[BaseMessage]:
+        compacted = list(messages)
+        before = total = sum(self._tokens(message) for message in messages)
+        for i in old:
+            summary = self._summary(messages[i])
+            tokens = self._tokens(messages[i])
+            summary_tokens = self.counter.count(summary)
+            if summary_tokens < tokens:
+                compacted[i] = messages[i].model_copy(update={"content": f"[summary] {summary}"})
+                total -= tokens - summary_tokens
+        for i in old:
+            # oldest first, until under the threshold
+            if total <= self.max_tokens:
+                break
+            tokens = self._tokens(compacted[i])
+            compacted[i] = messages[i].model_copy(update={"content": f"[result of {messages[i].name} omitted]"})
+            total -= tokens - self._tokens(compacted[i])
+        with self.lock:
+            self.compacted += 1
+            self.tokens_saved += before - total
+        return compacted
+
+def new_message_compactor(summarizer: Runnable | None = None) -> MessageCompactor:
+    """The compaction configured in config/prompt.py, `summarizer` only used if enabled there."""
+    return MessageCompactor(
+        max_tokens=prompt_config.COMPACTION_MAX_TOKENS,
+        keep_turns=prompt_config.COMPACTION_KEEP_TURNS,
+        summary_tokens=prompt_config.COMPACTION_SUMMARY_TOKENS,
+        summarizer=summarizer if prompt_config.COMPACTION_SUMMARIZE else None,
+        counter=TokenCounter(prompt_config.TOKENIZER_ENCODING),
+    )
@@ -0,0 +1,153 @@
+from collections import defaultdict
+
+from langgraph.store.base import IndexConfig, PutOp, Result, SearchItem, SearchOp
+from langgraph.store.memory import InMemoryStore
+
+from lang_graph_project.agent.vector_index import VectorIndexes
+
+class IndexedInMemoryStore(InMemoryStore):
+    """`InMemoryStore` whose semantic search goes through per-namespace vector indexes.
+
+    `InMemoryStore` scores every stored vector on each query. Here every namespace
+    keeps a `FlatIndex` (an `IVFIndex` once large), updated on put/delete, and
+    unfiltered queries are answered from it. Search ops sent in the same batch are
+    embedded with one request and scored together, see `search_many` in
+    agent/memory.py. Searches with a `filter` scan the matching items, scored exactly
+    from their rows in the index. The vectors are only kept there, as float32 rows,
+    not also as the float lists of `InMemoryStore`.
+
+    Args:
+        index (IndexConfig | None): Same as `InMemoryStore(index=...)`.
+        nprobe (int): Recall/latency knob of the indexes, see `IVFIndex`.
+        train_threshold (int): Namespace size from which the index stops being an exact scan.
+    """
+
+    __slots__ = ("vector_indexes",)
+
+    def __init__(self,
+                 *,
+                 index: IndexConfig | None = None,
+                 nprobe: int = 8,
+                 train_threshold: int = 2048) -> None:
+        super().__init__(index=index)
+        self.vector_indexes = VectorIndexes(nprobe=nprobe, train_threshold=train_threshold)
+
+    # Helpers
+
+    def _use_index(self, op: SearchOp) -> bool:
+        return bool(op.query and not op.filter and self.embeddings)
+
+    def _filter_items(self, op: SearchOp):
+        if self._use_index(op):
+            # answered by _batch_search from the indexes, skip the scan of every item
+            return None
+        return super()._filter_items(op)
+
+    def _embed_search_queries(self, search_ops) -> dict[str, list[float]]:
+        queries = list({op.query for (op, _) in search_ops.values() if op.query})
+        if not (queries and self.index_config and self.embeddings):
+            return {}
+        # one request for the whole batch instead of one per query
+        return dict(zip(queries, self.embeddings.embed_documents(queries)))
+
+    async def _aembed_search_queries(self, search_ops) -> dict[str, list[float]]:
+        queries = list({op.query for (op, _) in search_ops.values() if op.query})
+        if not (queries and self.index_config and self.embeddings):
+            return {}
+        return dict(zip(queries, await self.embeddings.aembed_documents(queries)))
+
+    def _batch_search(self, ops, queryinmem_store, results: list[Result]) -> None:
+        scanned = {}
+        # queries over the same namespaces are scored together, one GEMM per namespace
+        grouped = defaultdict(list)
+        for i, (op, candidates) in ops.items():
+            if candidates is None:
+                grouped[(op.namespace_prefix, op.offset + op.limit)].append(i)
+            elif op.query and queryinmem_store:
+                # filtered: the matching items, scored from their rows in the indexes
+                results[i] = self._scored_items(op, candidates, queryinmem_store[op.query])
+            else:
+                scanned[i] = (op, candidates)
+        for (namespace_prefix, k), indices in grouped.items():
+            namespaces = [
+                namespace for namespace in list(self._data)
+                if namespace[:len(namespace_prefix)] == namespace_prefix
+            ]
+            found = self.vector_indexes.search_many(
+                namespaces, [queryinmem_store[ops[i][0].query] for i in indices], k
+            )
+            for i, query_found in zip(indices, found):
+                results[i] = self._found_items(ops[i][0], namespaces, query_found)
+        if scanned:
+            super()._batch_search(scanned, queryinmem_store, results)
+
+    def _scored_items(self, op: SearchOp, candidates, query) -> list[SearchItem]:
+        scored, scoreless = [], []
+        for item, _ in candidates:
+            score = self.vector_indexes.score(item.namespace, item.key, query)
+            if score is None:
+                scoreless.append(item)
+            else:
+                scored.append((score, item))
+        scored.sort(key=lambda found: found[0], reverse=True)
+        kept = scored[op.offset:op.offset + op.limit]
+        if len(kept) < op.limit:
+            kept.extend((None, item) for item in scoreless[:op.limit - len(kept)])
+        return self._search_items(kept)
+
+    def _found_items(self, op: SearchOp, namespaces, found) -> list[SearchItem]:
+        kept = [
+            (score, self._data[namespace][key])
+            for score, namespace, key in found[op.offset:]
+            if key in self._data[namespace]
+        ]
+        if len(kept) < op.limit:
+            # same corner case as InMemoryStore: fill with items that were never embedded
+            for namespace in namespaces:
+                embedded = self.vector_indexes.keys(namespace)
+                kept.extend(
+                    (None, item) for key, item in self._data[namespace].items()
+                    if key not in embedded
+                )
+            kept = kept[:op.limit]
+        return self._search_items(kept)
+
+    def _search_items(self, kept) -> list[SearchItem]:
+        return [
+            SearchItem(
+                namespace=item.namespace,
+                key=item.key,
+                value=item.value,
+                created_at=item.created_at,
+                updated_at=item.updated_at,
+                score=score,
+            )
+            for score, item in kept
+        ]
+
+    def _insertinmem_store(self, to_embed, embeddings) -> None:
+        # the indexes replace InMemoryStore._vectors, which stays empty
+        indices = [index for indices in to_embed.values() for index in indices]
+        if len(indices) != len(embeddings):
+            raise ValueError(
+                f"Number of embeddings ({len(embeddings)}) does not"
+                f" match number of indices ({len(indices)})"
+            )
+        rows = defaultdict(list)
+        for embedding, (namespace, key, path) in zip(embeddings, indices):
+            rows[namespace].append((key, path, embedding))
+        for namespace, namespace_rows in rows.items():
+            # a put replaces every vector of the item
+            for key in {key for key, _, _ in namespace_rows}:
+                self.vector_indexes.remove(namespace, key)
+            self.vector_indexes.add(
+                namespace,
+                [(key, path) for key, path, _ in namespace_rows],
+                [embedding for _, _, embedding in namespace_rows],
+            )
+
+    def _apply_put_ops(self, put_ops: dict[tuple[tuple[str, ...], str], PutOp]) -> None:
+        super()._apply_put_ops(put_ops)
+        for (namespace, key), op in put_ops.items():
+            if op.value is None:
+                self.vector_indexes.remove(namespace, key)
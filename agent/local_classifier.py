@@ -0,0 +1,243 @@
+import random
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langgraph.store.base import BaseStore
+
+from lang_graph_project.agent.near_duplicates import email_text
+from lang_graph_project.config import triage as triage_config
+from lang_graph_project.agent.vector_index import normalize
+from lang_graph_project.schemas.router import Router
+
+CLASSES = ("ignore", "notify", "respond")
+
+class SoftmaxRegression:
+    """Multinomial logistic regression trained with full-batch gradient descent.
+
+    `fit` starts from the current weights, so refitting after a few new examples only
+    takes a few epochs.
+
+    Args:
+        classes (int): Number of classes.
+        l2 (float): Weight decay.
+        learning_rate (float): Step size.
+    """
+
+    def __init__(self, classes: int, l2: float = 1e-3, learning_rate: float = 4.0):
+        self.classes = classes
+        self.l2 = l2
+        self.learning_rate = learning_rate
+        self.weights: np.ndarray | None = None
+        self.bias = np.zeros(classes, dtype=np.float32)
+        self.mean: np.ndarray | None = None
+
+    def fit(self, x: np.ndarray, y: np.ndarray, epochs: int = 50) -> None:
+        if self.weights is None or self.weights.shape[0] != x.shape[1]:
+            self.weights = np.zeros((x.shape[1], self.classes), dtype=np.float32)
+        # embeddings of emails share a large common direction, centering them speeds up descent a lot
+        self.mean = x.mean(axis=0)
+        x = x - self.mean
+        targets = np.eye(self.classes, dtype=np.float32)[y]
+        for _ in range(epochs):
+            error = (self._softmax(x @ self.weights + self.bias) - targets) / len(x)
+            self.weights -= self.learning_rate * (x.T @ error + self.l2 * self.weights)
+            self.bias -= self.learning_rate * error.sum(axis=0)
+
+    def predict_proba(self, x: np.ndarray) -> np.ndarray:
+        return self._softmax((x - self.mean) @ self.weights + self.bias)
+
+    def _softmax(self, logits: np.ndarray) -> np.ndarray:
+        logits -= logits.max(axis=1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+class _UserModel:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # example key -> (updated_at, unit vector, class index)
+        self.examples: dict[str, tuple[str, np.ndarray, int]] = {}
+        self.model = SoftmaxRegression(len(CLASSES))
+        self.trained = False
+        # time.monotonic() of the last read of the examples, None before the first
+        self.loaded_at: float | None = None
+
+class LocalTriageClassifier:
+    """Per-user triage classifier over email embeddings, trained from the few-shot examples.
+
+    Each user's examples namespace `("email_assistant", user, "examples")` is read at most
+    once every `ttl` seconds; only examples not seen before are embedded, then the model is
+    refit from its previous weights. An email is classified locally when the model has been
+    trained on `min_examples` examples and its top probability reaches `confidence`,
+    otherwise the caller defers to the triage model and reports its answer with `record`.
+
+    Args:
+        embeddings (Embeddings): Embeddings of the examples, the ones the emails are embedded with.
+        confidence (float): Minimum probability to classify locally.
+        min_examples (int): Examples a user needs before the model is used.
+        ttl (float): Seconds between two reads of a user's examples.
+        shadow_rate (float): Share of the confident emails still sent to the triage model,
+            to measure the agreement of the local answers.
+    """
+
+    def __init__(self,
+                 embeddings: Embeddings,
+                 confidence: float = 0.9,
+                 min_examples: int = 30,
+                 ttl: float = 300.0,
+                 shadow_rate: float = 0.0):
+        self.embeddings = embeddings
+        self.confidence = confidence
+        self.min_examples = min_examples
+        self.ttl = ttl
+        self.shadow_rate = shadow_rate
+        self.lock = threading.Lock()
+        self.users: dict[str, _UserModel] = {}
+        self.served = 0
+        self.deferred = 0
+        self.checked = 0
+        self.agreed = 0
+
+    def refresh(self, store: BaseStore, langgraph_user_id: str) -> None:
+        """Train on the examples changed since the last read, if `ttl` has passed."""
+        user = self._user(langgraph_user_id)
+        if self._fresh(user):
+            return
+        items = self._list(store, langgraph_user_id)
+        new_items = self._new_items(user, items)
+        texts = [email_text(item.value["email"]) for item in new_items]
+        self._train(user, items, new_items, self.embeddings.embed_documents(texts) if texts else [])
+
+    async def arefresh(self, store: BaseStore, langgraph_user_id: str) -> None:
+        user = self._user(langgraph_user_id)
+        if self._fresh(user):
+            return
+        items = await self._alist(store, langgraph_user_id)
+        new_items = self._new_items(user, items)
+        texts = [email_text(item.value["email"]) for item in new_items]
+        self._train(user, items, new_items, await self.embeddings.aembed_documents(texts) if texts else [])
+
+    def predict(self, langgraph_user_id: str, vectors: list[list[float]]) -> list[tuple[Router | None, bool]]:
+        """The local (answer, confident) of each email, confident meaning the model isn't needed.
+
+        The answer is None while the user's model is not trained.
+        """
+        user = self._user(langgraph_user_id)
+        if not vectors:
+            return []
+        with user.lock:
+            probabilities = user.model.predict_proba(normalize(vectors)) if user.trained else None
+        predictions = []
+        for row in range(len(vectors)):
+            if probabilities is None:
+                predictions.append((None, False))
+                continue
+            best = int(np.argmax(probabilities[row]))
+            confident = probabilities[row][best] >= self.confidence
+            if confident and self.shadow_rate and random.random() < self.shadow_rate:
+                # answered by the triage model too, see record
+                confident = False
+            predictions.append((
+                Router(
+                    reasoning=f"Local classifier: {CLASSES[best]} with probability {probabilities[row][best]:.2f}",
+                    classification=CLASSES[best],
+                    confidence=float(probabilities[row][best]),
+                ),
+                bool(confident),
+            ))
+        with self.lock:
+            served = sum(1 for _, confident in predictions if confident)
+            self.served += served
+            self.deferred += len(predictions) - served
+        return predictions
+
+    def record(self, local: Router | None, result: Router) -> None:
+        """Compare the local answer of a deferred email with the triage model's."""
+        if local is None:
+            return
+        with self.lock:
+            self.checked += 1
+            self.agreed += local.classification == result.classification
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.served + self.deferred
+            return {
+                "served": self.served,
+                "deferred": self.deferred,
+                "deferral_rate": self.deferred / total if total else 0.0,
+                "checked": self.checked,
+                "agreed": self.agreed,
+                "agreement": self.agreed / self.checked if self.checked else 0.0,
+            }
+
+    # Helpers
+
+    def _fresh(self, user: _UserModel) -> bool:
+        return user.loaded_at is not None and time.monotonic() - user.loaded_at <= self.ttl
+
+    def _user(self, langgraph_user_id: str) -> _UserModel:
+        with self.lock:
+            if langgraph_user_id not in self.users:
+                self.users[langgraph_user_id] = _UserModel()
+            return self.users[langgraph_user_id]
+
+    def _list(self, store: BaseStore, langgraph_user_id: str) -> list:
+        namespace, items = ("email_assistant", langgraph_user_id, "examples"), []
+        while True:
+            page = store.search(namespace, limit=1000, offset=len(items))
+            items.extend(page)
+            if len(page) < 1000:
+                return items
+
+    async def _alist(self, store: BaseStore, langgraph_user_id: str) -> list:
+        namespace, items = ("email_assistant", langgraph_user_id, "examples"), []
+        while True:
+            page = await store.asearch(namespace, limit=1000, offset=len(items))
+            items.extend(page)
+            if len(page) < 1000:
+                return items
+
+    def _new_items(self, user: _UserModel, items: list) -> list:
+        with user.lock:
+            return [
+                item for item in items
+                if item.value.get("label") in CLASSES
+                and isinstance(item.value.get("email"), dict)
+                and user.examples.get(item.key, (None,))[0] != item.updated_at.isoformat()
+            ]
+
+    def _train(self, user: _UserModel, items: list, new_items: list, vectors: list[list[float]]) -> None:
+        with user.lock:
+            changed = bool(new_items)
+            listed = {item.key for item in items}
+            for key in [key for key in user.examples if key not in listed]:
+                # deleted from the store
+                del user.examples[key]
+                changed = True
+            for item, vector in zip(new_items, normalize(vectors) if vectors else []):
+                user.examples[item.key] = (
+                    item.updated_at.isoformat(), vector, CLASSES.index(item.value["label"])
+                )
+            if changed and len(user.examples) >= self.min_examples:
+                examples = list(user.examples.values())
+                # warm start: a full fit the first time, a few epochs after
+                user.model.fit(
+                    np.stack([vector for _, vector, _ in examples]),
+                    np.array([label for _, _, label in examples]),
+                    epochs=30 if user.trained else 200,
+                )
+                user.trained = True
+            elif len(user.examples) < self.min_examples:
+                user.trained = False
+            user.loaded_at = time.monotonic()
+
+def new_local_classifier(embeddings: Embeddings) -> LocalTriageClassifier:
+    """The local classifier configured in config/triage.py."""
+    return LocalTriageClassifier(
+        embeddings,
+        confidence=triage_config.LOCAL_CLASSIFIER_CONFIDENCE,
+        min_examples=triage_config.LOCAL_CLASSIFIER_MIN_EXAMPLES,
+        shadow_rate=triage_config.LOCAL_CLASSIFIER_SHADOW_RATE,
+    )
@@ -1,7 +1,11 @@
+from langgraph.store.base import BaseStore, SearchItem, SearchOp
 from langgraph.store.memory import InMemoryStore
 from langmem import create_manage_memory_tool, create_search_memory_tool
 
 from lang_graph_project.utils import open_ai
+from lang_graph_project.agent.sqlite_store import SqliteStore
+from lang_graph_project.agent.indexed_store import IndexedInMemoryStore
+from lang_graph_project.config import store as store_config
 
 def new_manage_memory_tool():
     return create_manage_memory_tool(
@@ -28,10 +32,60 @@ def new_in_store_memory(model:str) -> InMemoryStore:
     # store = InMemoryStore(
     #     index={"embed": "openai:text-embedding-3-small"},
     # )
-    return InMemoryStore(
+    # IndexedInMemoryStore: an InMemoryStore that searches through per-namespace vector indexes
+    return IndexedInMemoryStore(
         index={
             "embed": open_ai.new_embbedings(model=model),
-        }
+        },
+        nprobe=store_config.VECTOR_INDEX_NPROBE,
+        train_threshold=store_config.VECTOR_INDEX_TRAIN_THRESHOLD,
+    )
+
+def new_sqlite_store_memory(model:str, path: str = store_config.STORE_PATH) -> SqliteStore:
+    # same index as new_in_store_memory, but items and their embeddings survive a restart
+    return SqliteStore(
+        path,
+        index={
+            "embed": open_ai.new_embbedings(model=model),
+        },
+        nprobe=store_config.VECTOR_INDEX_NPROBE,
+        train_threshold=store_config.VECTOR_INDEX_TRAIN_THRESHOLD,
+    )
+
+def new_store(model:str, 
+              kind: str = store_config.STORE_KIND, 
+              path: str = store_config.STORE_PATH) -> BaseStore:
+    """Create the memory store used by the agents.
+
+    Args:
+        model (str): Embedding model used for semantic search.
+        kind (str): "memory" for a process-local InMemoryStore, "sqlite" for a SqliteStore.
+        path (str): Database file, only used by "sqlite".
+
+    Returns:
+        BaseStore: The store, with semantic search enabled.
+    """
+    if kind == "memory":
+        return new_in_store_memory(model=model)
+    if kind == "sqlite":
+        return new_sqlite_store_memory(model=model, path=path)
+    raise ValueError(f"Invalid store kind: {kind}")
+
+def search_many(store: BaseStore, 
+                namespace: tuple, 
+                queries: list[str], 
+                limit: int = 10) -> list[list[SearchItem]]:
+    """Semantic search of several queries in one namespace, with a single store round-trip.
+
+    With the stores of new_store, the queries are embedded in one request and scored
+    against the namespace together, e.g. all the emails of a triage batch against the
+    few-shot examples.
+
+    Returns:
+        list[list[SearchItem]]: The results of each query, in the same order as `queries`.
+    """
+    return store.batch(
+        [SearchOp(namespace_prefix=namespace, limit=limit, query=query) for query in queries]
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from lang_graph_project.agent.vector_index import FlatIndex
+from lang_graph_project.schemas.router import Router
+
+logger = logging.getLogger(__name__)
+
+def email_id(email_input: dict) -> str:
+    """The `id` of the email, or a hash of its content when it has none."""
+    if email_input.get("id") is not None:
+        return str(email_input["id"])
+    return hashlib.sha256(
+        json.dumps(email_input, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+
+def email_text(email_input: dict) -> str:
+    # the query of the few-shot example search, so a cached embedding serves both
+    return str({"email": email_input})
+
+class NearDuplicateCache:
+    """Reuses the triage result of a recently classified email that is nearly the same.
+
+    The last `window` emails classified for each user are kept with their embedding and
+    their `Router`. An email whose cosine similarity with one of them reaches `threshold`
+    gets the same classification without calling the model, provided the procedural
+    prompts of the user are still at the version it was classified with. Every reuse is
+    logged with the matched email id and the score.
+
+    Emails are embedded by the caller, as `email_text(email_input)`.
+
+    Args:
+        threshold (float): Minimum cosine similarity to reuse a classification.
+        window (int): Number of classified emails remembered per user.
+    """
+
+    def __init__(self, threshold: float = 0.97, window: int = 1000):
+        self.threshold = threshold
+        self.window = window
+        self.lock = threading.Lock()
+        # user id -> prompt version, index and (email id -> Router) of its recent emails
+        self.versions: dict[str, int] = {}
+        self.indexes: dict[str, FlatIndex] = {}
+        self.results: dict[str, OrderedDict[str, Router]] = {}
+
+    def match(self,
+              langgraph_user_id: str,
+              version: int,
+              email_input: dict,
+              vector: list[float]) -> Router | None:
+        """The classification of the closest recent email if it is close enough, else None."""
+        with self.lock:
+            if self.versions.get(langgraph_user_id) != version:
+                return None
+            index = self.indexes[langgraph_user_id]
+            found = index.search(vector, 1) if len(index) else []
+            if not found or found[0][1] < self.threshold:
+                return None
+            matched_id, score = found[0]
+            result = self.results[langgraph_user_id][matched_id]
+        logger.info(
+            "triage reused for email %s of %s: matched email %s, score %.4f, classification %s",
+            email_id(email_input), langgraph_user_id, matched_id, score, result.classification,
+        )
+        return result
+
+    def add(self,
+            langgraph_user_id: str,
+            version: int,
+            email_input: dict,
+            vector: list[float],
+            result: Router) -> None:
+        with self.lock:
+            current = self.versions.get(langgraph_user_id)
+            if current is not None and version < current:
+                # classified with prompts that were updated in the meantime
+                return
+            if current != version:
+                # results under older prompts can't be reused any more
+                self.versions[langgraph_user_id] = version
+                self.indexes[langgraph_user_id] = FlatIndex()
+                self.results[langgraph_user_id] = OrderedDict()
+            index, results = self.indexes[langgraph_user_id], self.results[langgraph_user_id]
+            id = email_id(email_input)
+            index.add([id], [vector])
+            results[id] = result
+            results.move_to_end(id)
+            while len(results) > self.window:
+                oldest, _ = results.popitem(last=False)
+                index.remove(oldest)
+
+    def invalidate(self, langgraph_user_id: str | None = None) -> None:
+        with self.lock:
+            for entries in (self.versions, self.indexes, self.results):
+                if langgraph_user_id is None:
+                    entries.clear()
+                else:
+                    entries.pop(langgraph_user_id, None)
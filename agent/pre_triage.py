@@ -0,0 +1,245 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+from langgraph.store.base import BaseStore
+
+from lang_graph_project.config import triage as triage_config
+from lang_graph_project.constants.variables import pre_triage_rules
+from lang_graph_project.schemas.router import Router
+
+class AhoCorasick:
+    """Case-insensitive multi-keyword matcher, one pass over the text whatever the number of keywords.
+
+    Args:
+        keywords (list[str]): Phrases to find, only matched on word boundaries.
+    """
+
+    def __init__(self, keywords: list[str]):
+        # trie as a list of nodes: transitions, failure link, keywords ending here
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[list[str]] = [[]]
+        for keyword in keywords:
+            node = 0
+            for char in keyword.lower():
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node].append(keyword)
+        # breadth-first, so the failure link of a node is known before its children;
+        # children of the root fail to the root
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text: str) -> set[str]:
+        """The keywords found in `text`."""
+        text = text.lower()
+        found = set()
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for keyword in self.output[node]:
+                start = end - len(keyword) + 1
+                if (start == 0 or not text[start - 1].isalnum()) and \
+                        (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    found.add(keyword)
+        return found
+
+def sender_address(author: str) -> str:
+    """`jane@x.com` out of `Jane Doe <Jane@x.com>`."""
+    match = re.search(r"<([^>]+)>", author)
+    return (match.group(1) if match else author).strip().lower()
+
+class SenderReputation:
+    """How each sender's emails were labelled in the few-shot examples of a user.
+
+    The examples namespace `("email_assistant", user, "examples")` is read at most once
+    every `ttl` seconds per user.
+
+    Args:
+        min_count (int): Number of examples of a sender needed to trust its reputation.
+        min_share (float): Share of those examples that must carry the same label.
+        ttl (float): Seconds the reputations of a user are kept before being read again.
+    """
+
+    def __init__(self, min_count: int = 3, min_share: float = 0.9, ttl: float = 300.0):
+        self.min_count = min_count
+        self.min_share = min_share
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # user id -> (sender -> label counts, loaded at)
+        self.entries: dict[str, tuple[dict[str, Counter], float]] = {}
+
+    def get(self, store: BaseStore, langgraph_user_id: str) -> dict[str, Counter]:
+        labels = self._fresh(langgraph_user_id)
+        if labels is None:
+            namespace, items, offset = self._namespace(langgraph_user_id), [], 0
+            while True:
+                page = store.search(namespace, limit=1000, offset=offset)
+                items.extend(page)
+                offset += len(page)
+                if len(page) < 1000:
+                    break
+            labels = self._count(langgraph_user_id, items)
+        return labels
+
+    async def aget(self, store: BaseStore, langgraph_user_id: str) -> dict[str, Counter]:
+        labels = self._fresh(langgraph_user_id)
+        if labels is None:
+            namespace, items, offset = self._namespace(langgraph_user_id), [], 0
+            while True:
+                page = await store.asearch(namespace, limit=1000, offset=offset)
+                items.extend(page)
+                offset += len(page)
+                if len(page) < 1000:
+                    break
+            labels = self._count(langgraph_user_id, items)
+        return labels
+
+    def verdict(self, labels: dict[str, Counter], author: str) -> tuple[str, float] | None:
+        """The (label, share) of a sender with a trusted reputation, else None."""
+        counts = labels.get(sender_address(author))
+        if not counts:
+            return None
+        label, count = counts.most_common(1)[0]
+        total = sum(counts.values())
+        if total < self.min_count or count / total < self.min_share:
+            return None
+        return label, count / total
+
+    def invalidate(self, langgraph_user_id: str | None = None) -> None:
+        with self.lock:
+            if langgraph_user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(langgraph_user_id, None)
+
+    # Helpers
+
+    def _namespace(self, langgraph_user_id: str) -> tuple[str, ...]:
+        return ("email_assistant", langgraph_user_id, "examples")
+
+    def _fresh(self, langgraph_user_id: str) -> dict[str, Counter] | None:
+        with self.lock:
+            entry = self.entries.get(langgraph_user_id)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def _count(self, langgraph_user_id: str, items) -> dict[str, Counter]:
+        labels: dict[str, Counter] = defaultdict(Counter)
+        for item in items:
+            email, label = item.value.get("email"), item.value.get("label")
+            if isinstance(email, dict) and email.get("author") and label:
+                labels[sender_address(email["author"])][label] += 1
+        with self.lock:
+            self.entries[langgraph_user_id] = (dict(labels), time.monotonic())
+        return labels
+
+class PreTriage:
+    """Rule-based triage of the obvious emails, run before the triage model.
+
+    Every rule that fires adds evidence to a category: a header, author or subject rule
+    counts for 1, each distinct keyword of the thread for 0.5, and a trusted sender
+    reputation (see `SenderReputation`) for its share. An email is only classified when
+    one category reaches `threshold` and no other category has any evidence, and only
+    as ignore or notify: anything else is left to the model.
+
+    Args:
+        rules (dict | None): Rules per category, `constants.variables.pre_triage_rules` if None.
+        reputation (SenderReputation | None): Sender reputations, None to not use them.
+        threshold (float): Evidence needed to classify an email.
+    """
+
+    categories = ("ignore", "notify")
+
+    def __init__(self,
+                 rules: dict | None = None,
+                 reputation: SenderReputation | None = None,
+                 threshold: float = 1.0):
+        rules = rules or pre_triage_rules
+        self.reputation = reputation
+        self.threshold = threshold
+        self.headers = {
+            category: {
+                name.lower(): re.compile(pattern, re.IGNORECASE)
+                for name, pattern in rules[category].get("headers", {}).items()
+            }
+            for category in self.categories
+        }
+        self.fields = {
+            category: {
+                field: [re.compile(pattern, re.IGNORECASE) for pattern in rules[category].get(field, [])]
+                for field in ("author", "subject")
+            }
+            for category in self.categories
+        }
+        self.keyword_category = {
+            keyword: category
+            for category in self.categories
+            for keyword in rules[category].get("keywords", [])
+        }
+        self.keywords = AhoCorasick(list(self.keyword_category))
+
+    def classify(self, email_input: dict, labels: dict[str, Counter] | None = None) -> Router | None:
+        """The classification of an obvious email, None when the model has to decide.
+
+        Args:
+            email_input (dict): The email, with optional raw `headers` (dict).
+            labels (dict[str, Counter] | None): Sender reputations of the user, see `SenderReputation.get`.
+        """
+        evidence: dict[str, float] = defaultdict(float)
+        reasons: list[str] = []
+        headers = {name.lower(): value for name, value in (email_input.get("headers") or {}).items()}
+        for category in self.categories:
+            for name, pattern in self.headers[category].items():
+                if name in headers and pattern.search(str(headers[name])):
+                    evidence[category] += 1.0
+                    reasons.append(f"header {name}")
+            for field, patterns in self.fields[category].items():
+                for pattern in patterns:
+                    if pattern.search(email_input.get(field) or ""):
+                        evidence[category] += 1.0
+                        reasons.append(f"{field} matches {pattern.pattern}")
+        for keyword in self.keywords.find(email_input.get("email_thread") or ""):
+            evidence[self.keyword_category[keyword]] += 0.5
+            reasons.append(f"keyword '{keyword}'")
+        if self.reputation is not None and labels is not None:
+            verdict = self.reputation.verdict(labels, email_input.get("author") or "")
+            if verdict is not None:
+                label, share = verdict
+                evidence[label] += share
+                reasons.append(f"sender labelled {label} in {share:.0%} of the examples")
+
+        if len(evidence) != 1:
+            # nothing fired, or the rules disagree
+            return None
+        category, score = next(iter(evidence.items()))
+        if category not in self.categories or score < self.threshold:
+            return None
+        return Router(reasoning="Pre-triage: " + "; ".join(reasons), classification=category)
+
+def new_pre_triage() -> PreTriage:
+    """The pre-triage configured in config/triage.py."""
+    reputation = None
+    if triage_config.SENDER_REPUTATION:
+        reputation = SenderReputation(
+            min_count=triage_config.SENDER_REPUTATION_MIN_COUNT,
+            min_share=triage_config.SENDER_REPUTATION_MIN_SHARE,
+        )
+    return PreTriage(reputation=reputation, threshold=triage_config.PRE_TRIAGE_THRESHOLD)
@@ -1,18 +1,36 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
 from lang_graph_project.constants.prompt_templates import (
     agent_system_prompt_template, 
     agent_system_prompt_memory_template_without_profile,
-    agent_system_prompt_memory_template_with_profile
+    agent_system_prompt_memory_template_with_profile,
+    triage_system_prompt_template,
+    triage_system_prompt_cache_optimized_template
 )
 from lang_graph_project.constants.variables import prompt_instructions, profile
+from lang_graph_project.config import prompt as prompt_config
+from lang_graph_project.utils.formator import format_few_shot_examples_v1
+
+# System prompt templates of each layout, see config/prompt.py
+# the agent prompt already goes from role and tools to the instructions, then the conversation
+PROMPT_LAYOUTS = {
+    "default": {
+        "triage": triage_system_prompt_template,
+        "agent": agent_system_prompt_memory_template_without_profile,
+    },
+    "cache_optimized": {
+        "triage": triage_system_prompt_cache_optimized_template,
+        "agent": agent_system_prompt_memory_template_without_profile,
+    },
+}
 
 def create_prompt(state):
     return [
         {
             "role": "system",
-            "content": agent_system_prompt_template.format(
-                instructions=prompt_instructions['agent_instructions'],
-                **profile,
-            ),
+            "content": _static_system_prompt(agent_system_prompt_template),
         }
     ] + state['messages']
 
@@ -20,9 +38,125 @@ def create_prompt_with_memory(state):
     return [
         {
             "role": "system", 
-            "content": agent_system_prompt_memory_template_without_profile.format(
-                instructions=prompt_instructions["agent_instructions"], 
-                **profile
-            )
+            "content": _static_system_prompt(agent_system_prompt_memory_template_without_profile)
         }
-    ] + state['messages']
\ No newline at end of file
+    ] + state['messages']
+
+@lru_cache(maxsize=None)
+def _static_system_prompt(template: str) -> str:
+    # the default instructions and the profile never change, render once per process
+    return template.format(instructions=prompt_instructions['agent_instructions'], **profile)
+
+def split_template(template: str, field: str) -> tuple[str, str]:
+    """Split a template around its only `{field}`, e.g. the few-shot examples."""
+    placeholder = "{" + field + "}"
+    if template.count(placeholder) != 1:
+        raise ValueError(f"Template must contain {placeholder} exactly once")
+    prefix, suffix = template.split(placeholder)
+    return prefix, suffix
+
+class PromptRenderer:
+    """Renders the system prompts of a user, memoized per (user, prompt version).
+
+    Everything but the few-shot examples of the triage prompt only depends on the
+    profile and on the procedural prompts of the user, so it is rendered once per
+    version (see `ProceduralPromptCache`) and the examples are spliced in. Cached
+    prompts are reused as the same string, so the prefix sent to the model server is
+    byte-identical from one call to the next and its prefix/KV cache can hit.
+
+    Args:
+        layout (str): Key of `PROMPT_LAYOUTS`. With "cache_optimized" the examples are
+            also listed oldest first instead of by similarity, so emails that retrieve
+            the same examples share the whole prefix.
+        maxsize (int): Number of rendered (user, version) prompts kept, least recently
+            used first out.
+    """
+
+    def __init__(self, layout: str = prompt_config.PROMPT_LAYOUT, maxsize: int = 1024):
+        if layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"Invalid prompt layout: {layout}")
+        self.layout = layout
+        self.templates = PROMPT_LAYOUTS[layout]
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.triage_prefix, self.triage_suffix = split_template(
+            self.templates["triage"], "examples"
+        )
+        # (kind, user id, version) -> (inputs, rendered)
+        self.rendered: OrderedDict[tuple, tuple[tuple, object]] = OrderedDict()
+
+    def triage_system_prompt(self, 
+                             langgraph_user_id: str, 
+                             version: int, 
+                             ignore_prompt: str, 
+                             notify_prompt: str, 
+                             respond_prompt: str, 
+                             examples: list, 
+                             max_chars: int | None = 400) -> str:
+        """The triage template of the layout filled with the profile, the rules and the examples.
+
+        Args:
+            examples (list[Item]): Few-shot examples from the store, the only part rendered on every call.
+            max_chars (int | None): Characters kept of each example, None when they are already fitted
+                to a token budget.
+        """
+        prefix, suffix = self._memoize(
+            ("triage", langgraph_user_id, version),
+            (ignore_prompt, notify_prompt, respond_prompt),
+            lambda: self._render_triage(ignore_prompt, notify_prompt, respond_prompt),
+        )
+        return prefix + format_few_shot_examples_v1(self.order_examples(examples), max_chars) + suffix
+
+    def agent_system_prompt(self, langgraph_user_id: str, version: int, instructions: str) -> str:
+        """The agent template of the layout filled with the profile and the instructions."""
+        return self._memoize(
+            ("agent", langgraph_user_id, version),
+            (instructions, ),
+            lambda: self.templates["agent"].format(
+                instructions=instructions, 
+                **profile
+            ),
+        )
+
+    def order_examples(self, examples: list) -> list:
+        if self.layout != "cache_optimized":
+            return examples
+        # search results come by similarity, different for every email: a fixed order keeps
+        # the examples two emails have in common at the same place in the prompt
+        return sorted(examples, key=lambda item: (item.created_at, item.key))
+
+    def invalidate(self, langgraph_user_id: str | None = None) -> None:
+        with self.lock:
+            if langgraph_user_id is None:
+                self.rendered.clear()
+            else:
+                for key in [key for key in self.rendered if key[1] == langgraph_user_id]:
+                    del self.rendered[key]
+
+    # Helpers
+
+    def _render_triage(self, ignore_prompt: str, notify_prompt: str, respond_prompt: str) -> tuple[str, str]:
+        fields = dict(
+            full_name=profile['full_name'],
+            name=profile['name'],
+            user_profile_background=profile['user_profile_background'],
+            triage_no=ignore_prompt,
+            triage_notify=notify_prompt,
+            triage_email=respond_prompt,
+        )
+        return self.triage_prefix.format(**fields), self.triage_suffix.format(**fields)
+
+    def _memoize(self, key: tuple, inputs: tuple, render):
+        with self.lock:
+            cached = self.rendered.get(key)
+            # the inputs are checked too: a prompt written behind the cache keeps its version
+            if cached is not None and cached[0] == inputs:
+                self.rendered.move_to_end(key)
+                return cached[1]
+        rendered = render()
+        with self.lock:
+            self.rendered[key] = (inputs, rendered)
+            self.rendered.move_to_end(key)
+            if len(self.rendered) > self.maxsize:
+                self.rendered.popitem(last=False)
+        return rendered
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_openai import ChatOpenAI
+
+from lang_graph_project.agent.indexed_store import IndexedInMemoryStore
+from lang_graph_project.agent.prompt import PROMPT_LAYOUTS, PromptRenderer
+from lang_graph_project.agent.prompt_cache import ProceduralPromptCache
+from lang_graph_project.constants.prompt_templates import triage_user_prompt_template
+
+_TOKEN = re.compile(r"\w+|[^\w\s]|\s+")
+
+class PrefixCacheServer:
+    """Local stand-in for an OpenAI-compatible model server with automatic prefix caching.
+
+    Prompts are tokenized with a crude word/punctuation split and cached in blocks of
+    `block_size` tokens, each block keyed on the hash of the whole prefix up to it (the
+    scheme of vLLM and llama.cpp). A request reuses the leading blocks seen before and
+    reports them as `usage.prompt_tokens_details.cached_tokens`, like OpenAI does.
+
+    Args:
+        block_size (int): Tokens per cached block.
+        capacity (int): Number of blocks kept, least recently used first out.
+        port (int): Port to listen on, 0 for any free port.
+    """
+
+    def __init__(self, block_size: int = 16, capacity: int = 65536, port: int = 0):
+        self.block_size = block_size
+        self.capacity = capacity
+        self.blocks: OrderedDict[bytes, None] = OrderedDict()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "PrefixCacheServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "PrefixCacheServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def tokenize(self, messages: list[dict]) -> list[str]:
+        # a chat template: every message opens with its role
+        tokens = []
+        for message in messages:
+            tokens.append(f"<|{message['role']}|>")
+            tokens.extend(_TOKEN.findall(message.get("content") or ""))
+        return tokens
+
+    def cached_tokens(self, tokens: list[str]) -> int:
+        """Number of leading tokens already cached, the blocks of `tokens` are cached afterwards."""
+        cached, reusing = 0, True
+        digest = hashlib.sha256()
+        with self.lock:
+            for start in range(0, len(tokens) - self.block_size + 1, self.block_size):
+                digest.update("\0".join(tokens[start:start + self.block_size]).encode("utf-8"))
+                key = digest.copy().digest()
+                if reusing and key in self.blocks:
+                    cached += self.block_size
+                    self.blocks.move_to_end(key)
+                    continue
+                reusing = False
+                self.blocks[key] = None
+                if len(self.blocks) > self.capacity:
+                    self.blocks.popitem(last=False)
+        return cached
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                tokens = server.tokenize(request["messages"])
+                body = json.dumps({
+                    "id": "chatcmpl-stand-in",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stand-in"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "notify"},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(tokens),
+                        "completion_tokens": 1,
+                        "total_tokens": len(tokens) + 1,
+                        "prompt_tokens_details": {"cached_tokens": server.cached_tokens(tokens)},
+                    },
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def _synthetic_emails(count: int, rng: random.Random) -> list[dict]:
+    authors = ["Alice Smith <alice.smith@company.com>", "Bob Lee <bob@vendor.io>",
+               "Tech Newsletter <news@techweekly.com>", "CI <ci@company.com>",
+               "Sarah Chen <sarah.chen@company.com>"]
+    subjects = ["Quick question about API documentation", "Weekly tech digest",
+                "Build failed on main", "Out sick today", "Meeting request for Thursday",
+                "Critical bug in checkout", "Project status update"]
+    return [
+        {
+            "author": rng.choice(authors),
+            "to": "John Doe <john.doe@company.com>",
+            "subject": rng.choice(subjects),
+            "email_thread": " ".join(rng.choice(subjects) for _ in range(rng.randint(8, 30))),
+        }
+        for _ in range(count)
+    ]
+
+def run_benchmark(layout: str,
+                  users: int = 4,
+                  emails_per_user: int = 25,
+                  examples_per_user: int = 6,
+                  search_limit: int = 4,
+                  seed: int = 0) -> dict:
+    """Triage synthetic emails through a `PrefixCacheServer` with the prompts of one layout.
+
+    The examples and the prompts come from a store, as in the L6 EmailAgent, and the
+    rules of the first user are rewritten half-way through like the prompt optimizer does.
+
+    Returns:
+        dict: Prompt tokens sent and reused by the server.
+    """
+    rng = random.Random(seed)
+    store = IndexedInMemoryStore(index={"embed": DeterministicFakeEmbedding(size=64), "dims": 64})
+    prompts = ProceduralPromptCache()
+    renderer = PromptRenderer(layout=layout)
+    user_ids = [f"user-{i}" for i in range(users)]
+    for user_id in user_ids:
+        for i, email in enumerate(_synthetic_emails(examples_per_user, rng)):
+            store.put(
+                ("email_assistant", user_id, "examples"),
+                f"example-{i}",
+                {"email": email, "label": rng.choice(["ignore", "notify", "respond"])},
+            )
+    # emails of every user arrive interleaved
+    inbox = [(user_id, email) for user_id in user_ids for email in _synthetic_emails(emails_per_user, rng)]
+    rng.shuffle(inbox)
+
+    prompt_tokens = cached_tokens = 0
+    with PrefixCacheServer() as server:
+        llm = ChatOpenAI(model="stand-in", base_url=server.base_url, api_key="stand-in")
+        for n, (user_id, email) in enumerate(inbox):
+            if n == len(inbox) // 2:
+                prompts.update(store, user_ids[0], {"triage_ignore": "Marketing newsletters, spam emails"})
+            version, user_prompts = prompts.entry(store, user_id)
+            examples = store.search(
+                ("email_assistant", user_id, "examples"),
+                query=str({"email": email}),
+                limit=search_limit,
+            )
+            messages = [
+                {
+                    "role": "system",
+                    "content": renderer.triage_system_prompt(
+                        user_id,
+                        version,
+                        user_prompts["triage_ignore"],
+                        user_prompts["triage_notify"],
+                        user_prompts["triage_respond"],
+                        examples,
+                    ),
+                },
+                {"role": "user", "content": triage_user_prompt_template.format(**email)},
+            ]
+            usage = llm.invoke(messages).usage_metadata
+            prompt_tokens += usage["input_tokens"]
+            cached_tokens += usage["input_token_details"].get("cache_read", 0)
+    return {
+        "layout": layout,
+        "requests": len(inbox),
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "reuse": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
+
+if __name__ == "__main__":
+    for search_limit in (4, 10):
+        print(f"few-shot examples per prompt: up to {search_limit}")
+        for layout in PROMPT_LAYOUTS:
+            result = run_benchmark(layout, search_limit=search_limit)
+            print(
+                f"{result['layout']:>16}: {result['cached_tokens']:>6} / {result['prompt_tokens']:>6} "
+                f"prompt tokens reused ({result['reuse']:.1%}) over {result['requests']} requests"
+            )
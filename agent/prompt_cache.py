@@ -0,0 +1,122 @@
+import threading
+import time
+
+from langgraph.store.base import BaseStore, GetOp, PutOp
+
+from lang_graph_project.constants.variables import prompt_instructions
+
+VERSION_KEY = "prompt_version"
+
+def default_procedural_prompts() -> dict[str, str]:
+    """Procedural memory keys stored under `(langgraph_user_id,)` and their seed prompts."""
+    triage_rules = prompt_instructions["triage_rules"]
+    return {
+        "agent_instructions": prompt_instructions["agent_instructions"],
+        "triage_ignore": triage_rules["ignore"],
+        "triage_notify": triage_rules["notify"],
+        "triage_respond": triage_rules["respond"],
+    }
+
+class ProceduralPromptCache:
+    """Per-user cache of the procedural prompts, with versioning.
+
+    All the prompts of a user are read with one store batch the first time they are
+    needed (missing ones are seeded with their defaults in the same way), then served
+    from memory. Writers go through `update`, which stores the new prompts, bumps the
+    user's `prompt_version` item and drops the cached copy, so that the next call
+    reads the new version.
+
+    Args:
+        defaults (dict[str, str] | None): Prompt keys and their seed values,
+            `default_procedural_prompts()` if None.
+        ttl (float | None): Seconds after which the cached copy is read again,
+            for prompts updated by another process.
+            None trusts the cache until `update`/`invalidate`.
+    """
+
+    def __init__(self, defaults: dict[str, str] | None = None, ttl: float | None = None):
+        self.defaults = defaults or default_procedural_prompts()
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # user id -> (version, prompts, fetched at)
+        self.entries: dict[str, tuple[int, dict[str, str], float]] = {}
+
+    def get(self, store: BaseStore, langgraph_user_id: str) -> dict[str, str]:
+        return self.entry(store, langgraph_user_id)[1]
+
+    async def aget(self, store: BaseStore, langgraph_user_id: str) -> dict[str, str]:
+        return (await self.aentry(store, langgraph_user_id))[1]
+
+    def entry(self, store: BaseStore, langgraph_user_id: str) -> tuple[int, dict[str, str]]:
+        """The (version, prompts) of a user."""
+        entry = self._fresh(langgraph_user_id)
+        if entry is None:
+            entry, missing = self._parse(
+                langgraph_user_id, store.batch(self._get_ops(langgraph_user_id))
+            )
+            if missing:
+                store.batch(missing)
+        return entry[0], entry[1]
+
+    async def aentry(self, store: BaseStore, langgraph_user_id: str) -> tuple[int, dict[str, str]]:
+        entry = self._fresh(langgraph_user_id)
+        if entry is None:
+            entry, missing = self._parse(
+                langgraph_user_id, await store.abatch(self._get_ops(langgraph_user_id))
+            )
+            if missing:
+                await store.abatch(missing)
+        return entry[0], entry[1]
+
+    def update(self, store: BaseStore, langgraph_user_id: str, prompts: dict[str, str]) -> int:
+        """Store new prompts for a user, return the new version."""
+        namespace = (langgraph_user_id, )
+        version = self._read_version(store, langgraph_user_id) + 1
+        store.batch(
+            [PutOp(namespace, key, {"prompt": prompt}) for key, prompt in prompts.items()]
+            + [PutOp(namespace, VERSION_KEY, {"version": version})]
+        )
+        self.invalidate(langgraph_user_id)
+        return version
+
+    def invalidate(self, langgraph_user_id: str | None = None) -> None:
+        with self.lock:
+            if langgraph_user_id is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(langgraph_user_id, None)
+
+    # Helpers
+
+    def _fresh(self, langgraph_user_id: str):
+        with self.lock:
+            entry = self.entries.get(langgraph_user_id)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+            return None
+        return entry
+
+    def _get_ops(self, langgraph_user_id: str) -> list[GetOp]:
+        # the version and every prompt of the user in one store round-trip
+        namespace = (langgraph_user_id, )
+        return [GetOp(namespace, VERSION_KEY)] + [GetOp(namespace, key) for key in self.defaults]
+
+    def _parse(self, langgraph_user_id: str, results: list):
+        namespace = (langgraph_user_id, )
+        version = 0 if results[0] is None else results[0].value['version']
+        prompts, missing = {}, []
+        for key, result in zip(self.defaults, results[1:]):
+            if result is None:
+                prompts[key] = self.defaults[key]
+                missing.append(PutOp(namespace, key, {"prompt": self.defaults[key]}))
+            else:
+                prompts[key] = result.value['prompt']
+        entry = (version, prompts, time.monotonic())
+        with self.lock:
+            self.entries[langgraph_user_id] = entry
+        return entry, missing
+
+    def _read_version(self, store: BaseStore, langgraph_user_id: str) -> int:
+        result = store.get((langgraph_user_id, ), VERSION_KEY)
+        return 0 if result is None else result.value['version']
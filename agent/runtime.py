@@ -0,0 +1,392 @@
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator
+
+from lang_graph_project.config import runtime as runtime_config
+
+logger = logging.getLogger(__name__)
+
+class WorkerCrashed(RuntimeError):
+    """The worker process handling a request died, more times than the request may be retried."""
+
+class WorkerError(RuntimeError):
+    """A request failed in a worker with an exception that could not be sent back as is."""
+
+class TenantQuotas:
+    """Concurrency quota of every tenant (`langgraph_user_id`) within one event loop.
+
+    A tenant has at most `limit` emails in flight (or its own entry of `limits`), the others
+    wait for a slot, so one busy mailbox cannot take all the capacity of a worker. The
+    semaphore of a tenant only exists while it has emails in flight or waiting.
+
+    Args:
+        limit (int): Emails in flight per tenant.
+        limits (dict[str, int] | None): Per-tenant overrides of `limit`.
+    """
+
+    def __init__(self, limit: int = 4, limits: dict[str, int] | None = None):
+        self.limit = limit
+        self.limits = dict(limits or {})
+        # tenant -> (semaphore, emails in flight or waiting)
+        self.tenants: dict[str, tuple[asyncio.Semaphore, int]] = {}
+        self.waited = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tenant: str) -> AsyncIterator[None]:
+        semaphore, users = self.tenants.get(tenant) or (asyncio.Semaphore(self.limits.get(tenant, self.limit)), 0)
+        self.tenants[tenant] = (semaphore, users + 1)
+        try:
+            if semaphore.locked():
+                self.waited += 1
+            async with semaphore:
+                yield
+        finally:
+            semaphore, users = self.tenants[tenant]
+            if users == 1:
+                del self.tenants[tenant]
+            else:
+                self.tenants[tenant] = (semaphore, users - 1)
+
+    def stats(self) -> dict:
+        return {
+            "tenants": len(self.tenants),
+            "waited": self.waited,
+        }
+
+def route(tenant: str, workers: int) -> int:
+    """The worker of a tenant: stable across restarts, unlike `hash`."""
+    digest = hashlib.blake2b(tenant.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % workers
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.process: multiprocessing.Process | None = None
+        self.requests = None
+        self.in_flight: set[int] = set()
+        self.completed = 0
+        self.restarts = 0
+        self.started_at = 0.0
+        # deaths in a row shortly after a start, and when the next start is due
+        self.quick_deaths = 0
+        self.restart_at: float | None = None
+
+class WorkerPool:
+    """Prefork pool of worker processes, each serving every tenant with one email agent.
+
+    Each worker builds its agent once with `factory(*args)` (e.g. L6 `email_agent.new_email_agent`):
+    one compiled graph, one store and one set of HTTP clients per process, whatever the
+    number of users. The emails of a tenant always go to the same worker (see `route`), so
+    its prompt cache, near-duplicate cache and local classifier stay warm there, and its
+    `TenantQuotas` quota holds for the whole pool. Within a worker, emails run concurrently
+    on one event loop through `aprocess`, at most `max_concurrency` at a time.
+
+    Workers are started by `start_method`: with "forkserver", the modules of `factory` are
+    imported once in the fork server and every worker, including a restarted one, is forked
+    from it. A worker that dies is restarted, and the requests it had in flight are sent to
+    the new one, at most `max_retries` times; with a checkpointer and the tool journal
+    enabled, they resume where they stopped.
+
+    Args:
+        factory (Callable): Module-level function building the agent in a worker.
+        args (tuple): Arguments of `factory`.
+        processes (int): Worker processes.
+        max_concurrency (int): Emails in flight per worker.
+        tenant_limit (int): Emails in flight per tenant, see `TenantQuotas`.
+        tenant_limits (dict[str, int] | None): Per-tenant overrides of `tenant_limit`.
+        max_retries (int): Times a request is sent again after its worker died.
+        start_method (str | None): "forkserver", "fork" or "spawn", None for the platform's default.
+    """
+
+    def __init__(self,
+                 factory: Callable[..., Any],
+                 args: tuple = (),
+                 processes: int = 4,
+                 max_concurrency: int = 8,
+                 tenant_limit: int = 4,
+                 tenant_limits: dict[str, int] | None = None,
+                 max_retries: int = 1,
+                 start_method: str | None = "forkserver"):
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = None
+        self.context = multiprocessing.get_context(start_method)
+        if self.context.get_start_method() == "forkserver":
+            self.context.set_forkserver_preload([factory.__module__])
+        self.factory = factory
+        self.args = args
+        self.max_concurrency = max_concurrency
+        self.tenant_limit = tenant_limit
+        self.tenant_limits = dict(tenant_limits or {})
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        # request id -> future, request and attempts
+        self.pending: dict[int, tuple[Future, tuple, int]] = {}
+        self.tenants: dict[str, int] = {}
+        self.results = self.context.Queue()
+        self.workers = [_Worker(index) for index in range(processes)]
+        # closing stops the restarts, stopped the collector
+        self.closing = threading.Event()
+        self.stopped = threading.Event()
+        for worker in self.workers:
+            self._start(worker)
+        self.collector = threading.Thread(target=self._collect, name="worker-pool", daemon=True)
+        self.collector.start()
+
+    def submit(self, email_input: dict, config) -> Future:
+        """Process an email in the worker of its tenant.
+
+        Returns:
+            Future: The final graph state, see `EmailAgent.aprocess`.
+        """
+        if self.closing.is_set():
+            raise RuntimeError("the pool is closed")
+        tenant = config.get("configurable", {}).get("langgraph_user_id", "")
+        request_id = next(self.ids)
+        future = Future()
+        request = (request_id, email_input, config)
+        worker = self.workers[route(tenant, len(self.workers))]
+        with self.lock:
+            self.pending[request_id] = (future, request, 0)
+            self.tenants[tenant] = self.tenants.get(tenant, 0) + 1
+            worker.in_flight.add(request_id)
+            worker.requests.put(request)
+        return future
+
+    async def asubmit(self, email_input: dict, config) -> dict:
+        return await asyncio.wrap_future(self.submit(email_input, config))
+
+    def process_many(self,
+                     requests: Iterable[tuple[dict, dict]],
+                     max_in_flight: int | None = None) -> Iterator[tuple[dict, dict | BaseException]]:
+        """Process (email input, config) pairs of any tenants, keeping the pool busy.
+
+        At most `max_in_flight` requests are submitted at a time (by default what the
+        workers run at once), so a large backlog is read as fast as it is processed.
+        An email that fails doesn't stop the others.
+
+        Yields:
+            tuple[dict, dict | BaseException]: The email input and its final graph state or
+                the exception it raised, in completion order.
+        """
+        max_in_flight = max_in_flight or self.max_concurrency * len(self.workers)
+        iterator = iter(requests)
+        in_flight: dict[Future, dict] = {}
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < max_in_flight:
+                try:
+                    email_input, config = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                in_flight[self.submit(email_input, config)] = email_input
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                email_input = in_flight.pop(future)
+                error = future.exception()
+                if error is None:
+                    yield email_input, future.result()
+                else:
+                    logger.warning("processing an email failed: %r", error)
+                    yield email_input, error
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": [
+                    {
+                        "pid": worker.process.pid,
+                        "alive": worker.process.is_alive(),
+                        "in_flight": len(worker.in_flight),
+                        "completed": worker.completed,
+                        "restarts": worker.restarts,
+                    }
+                    for worker in self.workers
+                ],
+                "tenants_in_flight": dict(self.tenants),
+            }
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Let the workers finish their requests, then stop them."""
+        if self.closing.is_set():
+            return
+        self.closing.set()
+        for worker in self.workers:
+            worker.requests.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.stopped.set()
+        self.collector.join()
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future, _, _ in pending.values():
+            future.set_exception(RuntimeError("the pool was closed"))
+
+    # Helpers
+
+    def _start(self, worker: _Worker) -> None:
+        worker.started_at = time.monotonic()
+        worker.requests = self.context.Queue()
+        worker.process = self.context.Process(
+            target=_serve,
+            args=(
+                worker.index,
+                self.factory,
+                self.args,
+                worker.requests,
+                self.results,
+                self.max_concurrency,
+                self.tenant_limit,
+                self.tenant_limits,
+            ),
+            name=f"email-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _collect(self) -> None:
+        checked = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                request_id, ok, payload = self.results.get(timeout=0.5)
+            except queue.Empty:
+                request_id = None
+            if request_id is not None:
+                self._resolve(request_id, ok, payload)
+            if time.monotonic() - checked >= 0.5:
+                checked = time.monotonic()
+                self._check_workers()
+
+    def _resolve(self, request_id: int, ok: bool, payload: bytes) -> None:
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+            if entry is None:
+                return
+            future, (_, _, config), _ = entry
+            tenant = config.get("configurable", {}).get("langgraph_user_id", "")
+            self.tenants[tenant] -= 1
+            if not self.tenants[tenant]:
+                del self.tenants[tenant]
+            for worker in self.workers:
+                if request_id in worker.in_flight:
+                    worker.in_flight.discard(request_id)
+                    worker.completed += 1
+        try:
+            result = pickle.loads(payload)
+        except Exception as e:
+            result, ok = WorkerError(f"could not read the result of request {request_id}: {e!r}"), False
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(result)
+
+    def _check_workers(self) -> None:
+        for worker in self.workers:
+            if self.closing.is_set() or worker.process.is_alive():
+                continue
+            now = time.monotonic()
+            if worker.restart_at is None:
+                # a worker dying right after its start (e.g. `factory` fails) is restarted less and less often
+                worker.quick_deaths = worker.quick_deaths + 1 if now - worker.started_at < 10 else 0
+                delay = min(30.0, 0.5 * 2 ** worker.quick_deaths) if worker.quick_deaths else 0.0
+                worker.restart_at = now + delay
+                logger.warning(
+                    "worker %d (pid %s) died with exit code %s, restarting it in %gs",
+                    worker.index, worker.process.pid, worker.process.exitcode, delay,
+                )
+            if now < worker.restart_at:
+                continue
+            worker.restart_at = None
+            failed = []
+            with self.lock:
+                worker.restarts += 1
+                self._start(worker)
+                for request_id in sorted(worker.in_flight):
+                    future, request, attempts = self.pending[request_id]
+                    if attempts < self.max_retries:
+                        self.pending[request_id] = (future, request, attempts + 1)
+                        worker.requests.put(request)
+                    else:
+                        failed.append(request_id)
+            for request_id in failed:
+                self._resolve(request_id, False, pickle.dumps(
+                    WorkerCrashed(f"worker {worker.index} died {self.max_retries + 1} times on this request")
+                ))
+
+def _serve(index: int,
+           factory: Callable[..., Any],
+           args: tuple,
+           requests,
+           results,
+           max_concurrency: int,
+           tenant_limit: int,
+           tenant_limits: dict[str, int]) -> None:
+    """Main of a worker process."""
+    agent = factory(*args)
+    logger.info("worker %d (pid %d) ready", index, os.getpid())
+    asyncio.run(_serve_requests(agent, requests, results, max_concurrency, tenant_limit, tenant_limits))
+
+async def _serve_requests(agent,
+                          requests,
+                          results,
+                          max_concurrency: int,
+                          tenant_limit: int,
+                          tenant_limits: dict[str, int]) -> None:
+    loop = asyncio.get_running_loop()
+    quotas = TenantQuotas(tenant_limit, tenant_limits)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks: set[asyncio.Task] = set()
+
+    async def process(request_id: int, email_input: dict, config) -> None:
+        tenant = config.get("configurable", {}).get("langgraph_user_id", "")
+        try:
+            async with quotas.slot(tenant), semaphore:
+                response = await agent.aprocess(email_input, config)
+            payload, ok = pickle.dumps(response), True
+        except Exception as e:
+            try:
+                payload = pickle.dumps(e)
+            except Exception:
+                payload = pickle.dumps(WorkerError(repr(e)))
+            ok = False
+        results.put((request_id, ok, payload))
+
+    while True:
+        # the queue blocks, so it is read in a thread of the loop's executor
+        request = await loop.run_in_executor(None, requests.get)
+        if request is None:
+            break
+        task = asyncio.create_task(process(*request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+def new_worker_pool(factory: Callable[..., Any], args: tuple = ()) -> WorkerPool:
+    """The pool configured in config/runtime.py."""
+    return WorkerPool(
+        factory,
+        args,
+        processes=runtime_config.WORKER_PROCESSES,
+        max_concurrency=runtime_config.WORKER_MAX_CONCURRENCY,
+        tenant_limit=runtime_config.TENANT_CONCURRENCY,
+        tenant_limits=runtime_config.TENANT_CONCURRENCY_LIMITS,
+        max_retries=runtime_config.WORKER_MAX_RETRIES,
+        start_method=runtime_config.WORKER_START_METHOD,
+    )
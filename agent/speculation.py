@@ -0,0 +1,100 @@
+import asyncio
+import threading
+
+from lang_graph_project.agent.pre_triage import AhoCorasick
+from lang_graph_project.config import triage as triage_config
+from lang_graph_project.constants.variables import pre_triage_rules, respond_signals
+from lang_graph_project.utils.token_budget import strip_quoted
+
+class SpeculationCancelled(Exception):
+    """Triage didn't confirm the speculative response."""
+
+class SpeculationGate:
+    """Holds the side-effecting tool calls of a speculative response until triage decides.
+
+    Passed to the response agent as `config["configurable"]["speculation_gate"]`, see
+    `agent.tools.deferred_until_confirmed`.
+    """
+
+    def __init__(self):
+        self.decided = asyncio.Event()
+        self.confirmed = False
+        self.held = 0
+
+    def confirm(self) -> None:
+        self.confirmed = True
+        self.decided.set()
+
+    def cancel(self) -> None:
+        self.decided.set()
+
+    async def wait(self) -> None:
+        """Return once triage confirmed the response.
+
+        Raises:
+            SpeculationCancelled: triage classified the email as ignore or notify.
+        """
+        if not self.decided.is_set():
+            self.held += 1
+            await self.decided.wait()
+        if not self.confirmed:
+            raise SpeculationCancelled()
+
+class RespondPredictor:
+    """Cheap guess, before triage, of whether an email will be classified respond.
+
+    Each distinct phrase of `constants.variables.respond_signals` found in the new part of
+    the thread (quotes and signature stripped) adds its weight, a question adds 0.4; bulk
+    mail (the ignore headers and keywords of the pre-triage rules) scores 0. An email is
+    drafted speculatively when its score reaches `threshold`.
+
+    Args:
+        threshold (float): Score from which the response agent starts before triage.
+    """
+
+    def __init__(self, threshold: float = 0.6):
+        self.threshold = threshold
+        self.signals = AhoCorasick(list(respond_signals))
+        self.bulk_keywords = AhoCorasick(pre_triage_rules["ignore"]["keywords"])
+        self.bulk_headers = {name.lower() for name in pre_triage_rules["ignore"]["headers"]}
+        self.lock = threading.Lock()
+        self.speculated = 0
+        self.confirmed = 0
+        self.discarded = 0
+        self.held_tool_calls = 0
+
+    def score(self, email_input: dict) -> float:
+        headers = {name.lower() for name in (email_input.get("headers") or {})}
+        thread = email_input.get("email_thread") or ""
+        if headers & self.bulk_headers or self.bulk_keywords.find(thread):
+            return 0.0
+        text = strip_quoted(thread) + "\n" + (email_input.get("subject") or "")
+        score = sum(respond_signals[signal] for signal in self.signals.find(text))
+        if "?" in text:
+            score += 0.4
+        return min(score, 1.0)
+
+    def likely(self, email_input: dict) -> bool:
+        return self.score(email_input) >= self.threshold
+
+    def record(self, gate: SpeculationGate) -> None:
+        """Count the outcome of a speculative response."""
+        with self.lock:
+            self.speculated += 1
+            self.confirmed += gate.confirmed
+            self.discarded += not gate.confirmed
+            self.held_tool_calls += gate.held
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "speculated": self.speculated,
+                "confirmed": self.confirmed,
+                "discarded": self.discarded,
+                "precision": self.confirmed / self.speculated if self.speculated else 0.0,
+                "held_tool_calls": self.held_tool_calls,
+            }
+
+def new_respond_predictor() -> RespondPredictor:
+    """The predictor configured in config/triage.py."""
+    return RespondPredictor(threshold=triage_config.SPECULATION_THRESHOLD)
@@ -0,0 +1,491 @@
+import asyncio
+import logging
+import random
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from lang_graph_project.config import store as store_config
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    base_version TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+class SqliteCheckpointer(BaseCheckpointSaver[str]):
+    """SQLite-backed checkpointer, so a graph run interrupted by a crash or a restart resumes
+    from its last step instead of starting over.
+
+    - Like `InMemorySaver`, a checkpoint only references channel versions, and a channel
+      value is written once per version: the steps that don't touch the messages don't
+      copy them.
+    - A list channel (the messages) that only grew since the version this process wrote
+      before is stored as the appended items and a reference to that version, a full copy
+      every `snapshot_every` versions so that loading never follows long chains.
+    - Writes are serialized by the caller and committed by a background thread, every
+      `flush_interval` seconds in one transaction. A crash loses at most that window, the
+      run then resumes one step earlier. Reads flush first, so they always see every write.
+    - The database runs in WAL mode, readers never block the writer.
+
+    Args:
+        path (str): Database file, created if missing.
+        flush_interval (float): Seconds between commits, 0 to commit every write right away.
+        snapshot_every (int): Versions of a list channel stored as deltas between full copies.
+        maxsize (int): Threads whose last list values are remembered to compute deltas.
+    """
+
+    def __init__(self,
+                 path: str,
+                 *,
+                 flush_interval: float = 0.05,
+                 snapshot_every: int = 32,
+                 maxsize: int = 1024) -> None:
+        super().__init__()
+        self.path = path
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.maxsize = maxsize
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        # the connection, held while a batch is committed or a read runs
+        self.conn_lock = threading.Lock()
+        # the rows waiting for the next commit and the delta bookkeeping
+        self.lock = threading.Lock()
+        self.pending: list[tuple[str, tuple]] = []
+        # (thread_id, checkpoint_ns, channel) -> (version, items, deltas since the last full copy)
+        self.last: OrderedDict[tuple[str, str, str], tuple[str, list, int]] = OrderedDict()
+        self.checkpoints = 0
+        self.snapshots = 0
+        self.deltas = 0
+        self.bytes_written = 0
+        self.flushes = 0
+        self.stopped = threading.Event()
+        if flush_interval > 0:
+            # the thread only holds a weak reference, so an unused checkpointer can still be collected
+            threading.Thread(
+                target=_flush_loop, args=(weakref.ref(self), self.stopped, flush_interval),
+                name="checkpoint-flush", daemon=True,
+            ).start()
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.flush()
+        with self.conn_lock:
+            self.conn.close()
+
+    def flush(self) -> None:
+        """Commit the pending writes."""
+        with self.conn_lock:
+            self._flush()
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = (
+            "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+            " FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        )
+        params: tuple = (thread_id, checkpoint_ns)
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self.conn_lock:
+            self._flush()
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            return self._tuple(thread_id, checkpoint_ns, row)
+
+    def list(self,
+             config: RunnableConfig | None,
+             *,
+             filter: dict[str, Any] | None = None,
+             before: RunnableConfig | None = None,
+             limit: int | None = None) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,"
+            " metadata_type, metadata FROM checkpoints"
+        )
+        where, params = [], []
+        if config is not None:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+        with self.conn_lock:
+            self._flush()
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                return
+            metadata = self.serde.loads_typed((row[6], row[7]))
+            # metadata is serialized, so the filter is applied here rather than in SQL
+            if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self.conn_lock:
+                item = self._tuple(row[0], row[1], row[2:])
+            yield item
+
+    def put(self,
+            config: RunnableConfig,
+            checkpoint: Checkpoint,
+            metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        values: dict[str, Any] = saved.pop("channel_values")
+        rows = [
+            ("blob", self._blob(thread_id, checkpoint_ns, channel, str(version), values))
+            for channel, version in new_versions.items()
+        ]
+        type_, data = self.serde.dumps_typed(saved)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        rows.append(("checkpoint", (
+            thread_id,
+            checkpoint_ns,
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            type_,
+            data,
+            metadata_type,
+            metadata_data,
+        )))
+        size = len(data) + len(metadata_data) + sum(len(row[5] or b"") for _, row in rows[:-1])
+        self._enqueue(rows, size)
+        with self.lock:
+            self.checkpoints += 1
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self,
+                   config: RunnableConfig,
+                   writes: Sequence[tuple[str, Any]],
+                   task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special writes (errors, interrupts...) replace the previous ones, others are only written once
+        kind = "write_replace" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "write"
+        rows, size = [], 0
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            size += len(data)
+            rows.append((kind, (
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                data,
+                task_path,
+            )))
+        self._enqueue(rows, size)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.conn_lock:
+            self._flush()
+            self.conn.execute("BEGIN")
+            for table in ("checkpoints", "checkpoint_blobs", "checkpoint_writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("COMMIT")
+        with self.lock:
+            for key in [key for key in self.last if key[0] == thread_id]:
+                del self.last[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self,
+                    config: RunnableConfig | None,
+                    *,
+                    filter: dict[str, Any] | None = None,
+                    before: RunnableConfig | None = None,
+                    limit: int | None = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self,
+                   config: RunnableConfig,
+                   checkpoint: Checkpoint,
+                   metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        # only serializes and queues, the commit happens in the flush thread
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self,
+                          config: RunnableConfig,
+                          writes: Sequence[tuple[str, Any]],
+                          task_id: str,
+                          task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        # same format as InMemorySaver: sortable as text, unique across concurrent writers
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "checkpoints": self.checkpoints,
+                "snapshots": self.snapshots,
+                "deltas": self.deltas,
+                "bytes_written": self.bytes_written,
+                "flushes": self.flushes,
+                "pending": len(self.pending),
+            }
+
+    # Helpers
+
+    def _blob(self,
+              thread_id: str,
+              checkpoint_ns: str,
+              channel: str,
+              version: str,
+              values: dict[str, Any]) -> tuple:
+        """The row of one channel version: the value, or what was appended to a list since the last one."""
+        key = (thread_id, checkpoint_ns, channel)
+        if channel not in values:
+            with self.lock:
+                self.last.pop(key, None)
+            return (thread_id, checkpoint_ns, channel, version, "empty", None, None)
+        value = values[channel]
+        with self.lock:
+            last = self.last.get(key)
+        base, stored = None, value
+        if isinstance(value, list):
+            if last is not None and last[2] < self.snapshot_every and _extends(value, last[1]):
+                base, stored = last[0], value[len(last[1]):]
+            with self.lock:
+                self.last[key] = (version, list(value), 0 if base is None else last[2] + 1)
+                self.last.move_to_end(key)
+                while len(self.last) > self.maxsize:
+                    self.last.popitem(last=False)
+                if base is None:
+                    self.snapshots += 1
+                else:
+                    self.deltas += 1
+        elif last is not None:
+            with self.lock:
+                self.last.pop(key, None)
+        type_, data = self.serde.dumps_typed(stored)
+        return (thread_id, checkpoint_ns, channel, version, type_, data, base)
+
+    def _enqueue(self, rows: Sequence[tuple[str, tuple]], size: int) -> None:
+        with self.lock:
+            self.pending.extend(rows)
+            self.bytes_written += size
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def _flush(self) -> None:
+        # called with conn_lock held
+        with self.lock:
+            rows, self.pending = self.pending, []
+        if not rows:
+            return
+        by_kind: dict[str, list[tuple]] = {}
+        for kind, row in rows:
+            by_kind.setdefault(kind, []).append(row)
+        self.conn.execute("BEGIN")
+        try:
+            if "blob" in by_kind:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoint_blobs"
+                    " (thread_id, checkpoint_ns, channel, version, type, blob, base_version)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    by_kind["blob"],
+                )
+            if "checkpoint" in by_kind:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id,"
+                    " parent_checkpoint_id, type, checkpoint, metadata_type, metadata)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    by_kind["checkpoint"],
+                )
+            for kind, verb in (("write", "INSERT OR IGNORE"), ("write_replace", "INSERT OR REPLACE")):
+                if kind in by_kind:
+                    self.conn.executemany(
+                        f"{verb} INTO checkpoint_writes (thread_id, checkpoint_ns, checkpoint_id,"
+                        " task_id, idx, channel, type, blob, task_path)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        by_kind[kind],
+                    )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        with self.lock:
+            self.flushes += 1
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        # row: checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+        checkpoint_id, parent_checkpoint_id = row[0], row[1]
+        checkpoint = self.serde.loads_typed((row[2], row[3]))
+        checkpoint["channel_values"] = {
+            channel: value
+            for channel, version in checkpoint["channel_versions"].items()
+            if (value := self._load_blob(thread_id, checkpoint_ns, channel, str(version))) is not _MISSING
+        }
+        writes = self.conn.execute(
+            "SELECT task_id, channel, type, blob FROM checkpoint_writes"
+            " WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((row[4], row[5])),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, blob)))
+                for task_id, channel, type_, blob in writes
+            ],
+        )
+
+    def _load_blob(self, thread_id: str, checkpoint_ns: str, channel: str, version: str) -> Any:
+        # follows the deltas back to the last full copy
+        chain = []
+        while version is not None:
+            row = self.conn.execute(
+                "SELECT type, blob, base_version FROM checkpoint_blobs"
+                " WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, version),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                if chain:
+                    logger.warning("checkpoint blob %s/%s@%s is missing", thread_id, channel, version)
+                return _MISSING
+            chain.append(self.serde.loads_typed((row[0], row[1])))
+            version = row[2]
+        value = chain.pop()
+        while chain:
+            value = value + chain.pop()
+        return value
+
+_MISSING = object()
+
+def _extends(value: list, previous: list) -> bool:
+    """Whether `value` is `previous` with items appended, the items themselves unchanged."""
+    return len(value) >= len(previous) and all(a is b for a, b in zip(value, previous))
+
+def _flush_loop(checkpointer_ref, stopped: threading.Event, interval: float) -> None:
+    while not stopped.wait(interval):
+        checkpointer = checkpointer_ref()
+        if checkpointer is None:
+            return
+        try:
+            checkpointer.flush()
+        except sqlite3.ProgrammingError:
+            # closed meanwhile
+            return
+        except Exception:
+            logger.exception("checkpoint flush failed")
+        del checkpointer
+
+def new_checkpointer(path: str = store_config.CHECKPOINT_PATH) -> SqliteCheckpointer:
+    """The checkpointer configured in config/store.py."""
+    return SqliteCheckpointer(
+        path,
+        flush_interval=store_config.CHECKPOINT_FLUSH_INTERVAL,
+        snapshot_every=store_config.CHECKPOINT_SNAPSHOT_EVERY,
+    )
@@ -0,0 +1,401 @@
+import asyncio
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Iterable
+
+import numpy as np
+from langgraph.store.base import (
+    BaseStore,
+    GetOp,
+    IndexConfig,
+    Item,
+    ListNamespacesOp,
+    Op,
+    PutOp,
+    Result,
+    SearchItem,
+    SearchOp,
+    ensure_embeddings,
+    get_text_at_path,
+    tokenize_path,
+)
+
+from lang_graph_project.agent.vector_index import VectorIndexes
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS store (
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (prefix, key)
+);
+CREATE TABLE IF NOT EXISTS store_vectors (
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    field TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    PRIMARY KEY (prefix, key, field)
+);
+"""
+
+class SqliteStore(BaseStore):
+    """SQLite-backed store with optional vector search, a drop-in for `InMemoryStore`.
+
+    Items and their embeddings are persisted in one local file, so memories, few-shot
+    examples and learned prompts survive a restart without being re-embedded.
+
+    - The database runs in WAL mode, readers never block the writer.
+    - Every `batch` is one transaction: the puts it carries are embedded with a single
+      `embed_documents` call and written with `executemany`.
+    - Nothing is loaded at start-up. The vectors of a namespace are read into a
+      `IVFIndex` the first time that namespace is searched, and kept up to date by
+      later writes.
+
+    Args:
+        path (str): Database file, created if missing.
+        index (IndexConfig | None): Same as `InMemoryStore(index=...)`.
+        nprobe (int): Recall/latency knob of the vector indexes, see `IVFIndex`.
+        train_threshold (int): Namespace size from which the index stops being an exact scan.
+    """
+
+    def __init__(self,
+                 path: str,
+                 *,
+                 index: IndexConfig | None = None,
+                 nprobe: int = 8,
+                 train_threshold: int = 2048) -> None:
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        # graph nodes run on a thread pool, sqlite3 connections must not be shared concurrently
+        self.lock = threading.Lock()
+        # only holds the namespaces already searched
+        self.vector_indexes = VectorIndexes(nprobe=nprobe, train_threshold=train_threshold)
+        self.index_config = index
+        if self.index_config:
+            self.index_config = self.index_config.copy()
+            self.embeddings = ensure_embeddings(self.index_config.get("embed"))
+            self.index_config["__tokenized_fields"] = [
+                (p, tokenize_path(p)) if p != "$" else (p, p)
+                for p in (self.index_config.get("fields") or ["$"])
+            ]
+        else:
+            self.embeddings = None
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        queries = {op.query for op in ops if isinstance(op, SearchOp) and op.query}
+        query_vectors = {}
+        if queries and self.embeddings:
+            query_vectors = {query: self.embeddings.embed_query(query) for query in queries}
+        put_ops = self._dedupe_puts(ops)
+        to_embed = self._extract_texts(put_ops)
+        vectors = []
+        if to_embed:
+            vectors = self.embeddings.embed_documents(list(to_embed))
+        return self._apply(ops, put_ops, query_vectors, to_embed, vectors)
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        queries = {op.query for op in ops if isinstance(op, SearchOp) and op.query}
+        query_vectors = {}
+        if queries and self.embeddings:
+            queries = list(queries)
+            query_vectors = dict(zip(
+                queries,
+                await asyncio.gather(*(self.embeddings.aembed_query(q) for q in queries)),
+            ))
+        put_ops = self._dedupe_puts(ops)
+        to_embed = self._extract_texts(put_ops)
+        vectors = []
+        if to_embed:
+            vectors = await self.embeddings.aembed_documents(list(to_embed))
+        return await asyncio.to_thread(
+            self._apply, ops, put_ops, query_vectors, to_embed, vectors
+        )
+
+    # Helpers
+
+    def _apply(
+        self,
+        ops: list[Op],
+        put_ops: dict[tuple[tuple[str, ...], str], PutOp],
+        query_vectors: dict[str, list[float]],
+        to_embed: dict[str, list[tuple[tuple[str, ...], str, str]]],
+        vectors: list[list[float]],
+    ) -> list[Result]:
+        results: list[Result] = []
+        with self.lock:
+            for op in ops:
+                if isinstance(op, GetOp):
+                    results.append(self._get(op.namespace, op.key))
+                elif isinstance(op, SearchOp):
+                    results.append(self._search(op, query_vectors.get(op.query)))
+                elif isinstance(op, ListNamespacesOp):
+                    results.append(self._list_namespaces(op))
+                elif isinstance(op, PutOp):
+                    results.append(None)
+                else:
+                    raise ValueError(f"Unknown operation type: {type(op)}")
+            if put_ops:
+                self._write(put_ops, to_embed, vectors)
+        return results
+
+    def _get(self, namespace: tuple[str, ...], key: str) -> Item | None:
+        row = self.conn.execute(
+            "SELECT value, created_at, updated_at FROM store WHERE prefix = ? AND key = ?",
+            (_prefix(namespace), key),
+        ).fetchone()
+        if row is None:
+            return None
+        return Item(
+            value=json.loads(row[0]),
+            key=key,
+            namespace=namespace,
+            created_at=row[1],
+            updated_at=row[2],
+        )
+
+    def _search(self, op: SearchOp, query_vector: list[float] | None) -> list[SearchItem]:
+        prefix = _prefix(op.namespace_prefix)
+        where = " WHERE prefix = ? OR prefix LIKE ? ESCAPE '\\'"
+        params = (prefix, _like_escape(prefix) + ".%" if prefix else "%")
+        if op.query and query_vector is not None and not op.filter:
+            namespaces = [
+                tuple(row[0].split("."))
+                for row in self.conn.execute("SELECT DISTINCT prefix FROM store" + where, params)
+            ]
+            for namespace in namespaces:
+                self._load_index(namespace)
+            found = self.vector_indexes.search(
+                namespaces, query_vector, op.offset + op.limit
+            )[op.offset:]
+            kept = []
+            for score, namespace, key in found:
+                item = self._get(namespace, key)
+                if item is not None:
+                    kept.append(SearchItem(
+                        namespace=item.namespace,
+                        key=item.key,
+                        value=item.value,
+                        created_at=item.created_at,
+                        updated_at=item.updated_at,
+                        score=score,
+                    ))
+            if len(kept) == op.limit:
+                return kept
+            # same corner case as InMemoryStore: fill with items that were never embedded
+            scoreless = [
+                item for item in self._select(where, params)
+                if item.key not in self.vector_indexes.keys(item.namespace)
+            ]
+            return kept + scoreless[:op.limit - len(kept)]
+
+        items = self._select(where, params)
+        if op.filter:
+            items = [item for item in items if _matches(item.value, op.filter)]
+        if not (op.query and query_vector is not None):
+            return items[op.offset:op.offset + op.limit]
+
+        scored, scoreless = [], []
+        for item in items:
+            self._load_index(item.namespace)
+            # max pooling over the embedded fields of an item
+            item.score = self.vector_indexes.score(item.namespace, item.key, query_vector)
+            if item.score is None:
+                scoreless.append(item)
+            else:
+                scored.append(item)
+        scored.sort(key=lambda item: item.score, reverse=True)
+        kept = scored[op.offset:op.offset + op.limit]
+        if len(kept) < op.limit:
+            kept.extend(scoreless[:op.limit - len(kept)])
+        return kept
+
+    def _select(self, where: str, params: tuple) -> list[SearchItem]:
+        rows = self.conn.execute(
+            "SELECT prefix, key, value, created_at, updated_at FROM store" + where, params
+        ).fetchall()
+        return [
+            SearchItem(
+                namespace=tuple(row[0].split(".")),
+                key=row[1],
+                value=json.loads(row[2]),
+                created_at=row[3],
+                updated_at=row[4],
+            )
+            for row in rows
+        ]
+
+    def _load_index(self, namespace: tuple[str, ...]) -> None:
+        if namespace in self.vector_indexes:
+            return
+        rows, vectors = [], []
+        for key, field, blob in self.conn.execute(
+            "SELECT key, field, embedding FROM store_vectors WHERE prefix = ?",
+            (_prefix(namespace),),
+        ):
+            rows.append((key, field))
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self.vector_indexes.namespace(namespace)
+        if rows:
+            self.vector_indexes.add(namespace, rows, vectors)
+
+    def _list_namespaces(self, op: ListNamespacesOp) -> list[tuple[str, ...]]:
+        namespaces = [
+            tuple(row[0].split("."))
+            for row in self.conn.execute("SELECT DISTINCT prefix FROM store")
+        ]
+        if op.match_conditions:
+            namespaces = [
+                ns for ns in namespaces
+                if all(_does_match(condition, ns) for condition in op.match_conditions)
+            ]
+        if op.max_depth is not None:
+            namespaces = sorted({ns[:op.max_depth] for ns in namespaces})
+        else:
+            namespaces = sorted(namespaces)
+        return namespaces[op.offset:op.offset + op.limit]
+
+    def _write(
+        self,
+        put_ops: dict[tuple[tuple[str, ...], str], PutOp],
+        to_embed: dict[str, list[tuple[tuple[str, ...], str, str]]],
+        vectors: list[list[float]],
+    ) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        keys = [(_prefix(ns), key) for ns, key in put_ops]
+        upserts = [
+            (_prefix(ns), key, json.dumps(op.value), now, now)
+            for (ns, key), op in put_ops.items()
+            if op.value is not None
+        ]
+        embedded = []
+        for vector, (ns, key, path) in zip(
+            vectors, [index for indices in to_embed.values() for index in indices]
+        ):
+            vector = np.asarray(vector, dtype=np.float32)
+            # store unit vectors so that search is a plain dot product
+            vector /= np.linalg.norm(vector) or 1.0
+            embedded.append((ns, key, path, vector))
+
+        self.conn.execute("BEGIN")
+        try:
+            # a put replaces every vector of the item, a delete removes them
+            self.conn.executemany(
+                "DELETE FROM store_vectors WHERE prefix = ? AND key = ?", keys
+            )
+            self.conn.executemany(
+                "DELETE FROM store WHERE prefix = ? AND key = ?",
+                [k for k, op in zip(keys, put_ops.values()) if op.value is None],
+            )
+            self.conn.executemany(
+                "INSERT INTO store (prefix, key, value, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (prefix, key) DO UPDATE SET"
+                " value = excluded.value, updated_at = excluded.updated_at",
+                upserts,
+            )
+            self.conn.executemany(
+                "INSERT INTO store_vectors (prefix, key, field, embedding) VALUES (?, ?, ?, ?)",
+                [(_prefix(ns), key, path, v.tobytes()) for ns, key, path, v in embedded],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        # keep the indexes of namespaces already in RAM in sync
+        for ns, key in put_ops:
+            self.vector_indexes.remove(ns, key)
+        rows = defaultdict(list)
+        for ns, key, path, vector in embedded:
+            if ns in self.vector_indexes:
+                rows[ns].append(((key, path), vector))
+        for ns, ns_rows in rows.items():
+            self.vector_indexes.add(ns, [row for row, _ in ns_rows], [v for _, v in ns_rows])
+
+    def _dedupe_puts(self, ops: list[Op]) -> dict[tuple[tuple[str, ...], str], PutOp]:
+        put_ops: dict[tuple[tuple[str, ...], str], PutOp] = {}
+        for op in ops:
+            if isinstance(op, PutOp):
+                put_ops[(op.namespace, op.key)] = op
+        return put_ops
+
+    def _extract_texts(
+        self, put_ops: dict[tuple[tuple[str, ...], str], PutOp]
+    ) -> dict[str, list[tuple[tuple[str, ...], str, str]]]:
+        to_embed = defaultdict(list)
+        if not (self.index_config and self.embeddings):
+            return to_embed
+        for op in put_ops.values():
+            if op.value is None or op.index is False:
+                continue
+            if op.index is None:
+                paths = self.index_config["__tokenized_fields"]
+            else:
+                paths = [(ix, tokenize_path(ix)) for ix in op.index]
+            for path, field in paths:
+                texts = get_text_at_path(op.value, field)
+                if len(texts) > 1:
+                    for i, text in enumerate(texts):
+                        to_embed[text].append((op.namespace, op.key, f"{path}.{i}"))
+                elif texts:
+                    to_embed[texts[0]].append((op.namespace, op.key, path))
+        return to_embed
+
+def _prefix(namespace: tuple[str, ...]) -> str:
+    # labels can't contain "." (see langgraph.store.base._validate_namespace)
+    return ".".join(namespace)
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _does_match(match_condition, namespace: tuple[str, ...]) -> bool:
+    path = match_condition.path
+    if len(namespace) < len(path):
+        return False
+    if match_condition.match_type == "prefix":
+        labels = namespace[:len(path)]
+    elif match_condition.match_type == "suffix":
+        labels = namespace[len(namespace) - len(path):]
+    else:
+        raise ValueError(f"Unsupported match type: {match_condition.match_type}")
+    return all(p == "*" or p == label for label, p in zip(labels, path))
+
+_OPERATORS = {
+    "$eq": lambda actual, operand: actual == operand,
+    "$ne": lambda actual, operand: actual != operand,
+    "$gt": lambda actual, operand: actual is not None and float(actual) > float(operand),
+    "$gte": lambda actual, operand: actual is not None and float(actual) >= float(operand),
+    "$lt": lambda actual, operand: actual is not None and float(actual) < float(operand),
+    "$lte": lambda actual, operand: actual is not None and float(actual) <= float(operand),
+}
+
+def _matches(value: Any, filter: dict[str, Any]) -> bool:
+    """Whether an item value matches a search filter, with the same semantics as `InMemoryStore`."""
+    for key, expected in filter.items():
+        actual = value.get(key) if isinstance(value, dict) else None
+        if isinstance(expected, dict) and any(k.startswith("$") for k in expected):
+            for operator, operand in expected.items():
+                if operator not in _OPERATORS:
+                    raise ValueError(f"Unsupported operator: {operator}")
+                if not _OPERATORS[operator](actual, operand):
+                    return False
+        elif isinstance(expected, dict):
+            if not isinstance(actual, dict) or not _matches(actual, expected):
+                return False
+        elif actual != expected:
+            return False
+    return True
@@ -0,0 +1,227 @@
+import asyncio
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+from lang_graph_project.config import tools as tools_config
+
+logger = logging.getLogger(__name__)
+
+# idempotency key of the tool call being made, for the external API behind the tool
+current_idempotency_key: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_idempotency_key", default=None
+)
+
+def args_hash(name: str, args: dict) -> str:
+    return hashlib.sha256(
+        json.dumps({"tool": name, "args": args}, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()[:16]
+
+class ToolJournal:
+    """Append-only log of tool calls, so that a retried or resumed call is not made twice.
+
+    Every call is keyed by (thread id, tool call id, args hash) and logged as "started",
+    then "done" with its result or "failed". A call is made only once per key: after a
+    crash, a resume from a checkpoint or a retry after a timeout, a done call returns its
+    recorded result, and a call still running (e.g. past its timeout) is waited for instead
+    of being made again. A call with the same tool and arguments as one already done in the
+    same thread, under another tool call id (the conversation was run again), returns the
+    recorded result as well.
+
+    A call that started but never finished (the process died during it) may or may not have
+    had its effect; it is made again with the same `current_idempotency_key`, which the
+    tool should pass to the external API to have it deduplicate the call.
+
+    Args:
+        path (str): JSON Lines file, created if missing and read back at start.
+        fsync (bool): Sync the file after each record, slower but survives a power loss.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        # (thread_id, tool_call_id, args_hash) -> last record
+        self.entries: dict[tuple[str, str, str], dict] = {}
+        # (thread_id, args_hash) -> key of the done call
+        self.done: dict[tuple[str, str], tuple[str, str, str]] = {}
+        # key or (thread_id, args_hash) -> the call being made
+        self.in_flight: dict[tuple, Future] = {}
+        self.executed = 0
+        self.replayed = 0
+        self.deduplicated = 0
+        self.joined = 0
+        self.failed = 0
+        self._load()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def call(self,
+             thread_id: str,
+             tool_call_id: str,
+             name: str,
+             args: dict,
+             func: Callable[[], Any]) -> Any:
+        """`func()` unless the call is already in the journal, its result either way."""
+        key = (thread_id, tool_call_id, args_hash(name, args))
+        found, future = self._claim(key, name)
+        if found is not None:
+            return found["result"]
+        if future is not None:
+            return future.result()
+        return self._run(key, name, func)
+
+    async def acall(self,
+                    thread_id: str,
+                    tool_call_id: str,
+                    name: str,
+                    args: dict,
+                    func: Callable[[], Awaitable[Any]]) -> Any:
+        key = (thread_id, tool_call_id, args_hash(name, args))
+        found, future = self._claim(key, name)
+        if found is not None:
+            return found["result"]
+        if future is not None:
+            return await asyncio.wrap_future(future)
+        future = self.in_flight[key]
+        token = current_idempotency_key.set(_idempotency_key(key))
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, name, future, error=e)
+            raise
+        finally:
+            current_idempotency_key.reset(token)
+        self._finish(key, name, future, result=result)
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "executed": self.executed,
+                "replayed": self.replayed,
+                "deduplicated": self.deduplicated,
+                "joined": self.joined,
+                "failed": self.failed,
+                "in_flight": len({id(future) for future in self.in_flight.values()}),
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+    # Helpers
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line cut by a crash
+                    continue
+                key = (record["thread_id"], record["tool_call_id"], record["args_hash"])
+                self.entries[key] = record
+                if record["event"] == "done":
+                    self.done[(key[0], key[2])] = key
+
+    def _claim(self, key: tuple[str, str, str], name: str) -> tuple[dict | None, Future | None]:
+        """The recorded call or the one running, or neither after marking the call as started."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["event"] == "done":
+                self.replayed += 1
+                return entry, None
+            same = self.done.get((key[0], key[2]))
+            if same is not None:
+                self.deduplicated += 1
+                logger.info("%s already done in thread %s as call %s", name, key[0], same[1])
+                return self.entries[same], None
+            future = self.in_flight.get(key) or self.in_flight.get((key[0], key[2]))
+            if future is not None:
+                self.joined += 1
+                return None, future
+            if entry is not None and entry["event"] == "started":
+                logger.warning("%s call %s was interrupted, making it again", name, key[1])
+            future = Future()
+            self.in_flight[key] = self.in_flight[(key[0], key[2])] = future
+            self._append({"event": "started", "tool": name}, key)
+            return None, None
+
+    def _run(self, key: tuple[str, str, str], name: str, func: Callable[[], Any]) -> Any:
+        future = self.in_flight[key]
+        token = current_idempotency_key.set(_idempotency_key(key))
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, name, future, error=e)
+            raise
+        finally:
+            current_idempotency_key.reset(token)
+        self._finish(key, name, future, result=result)
+        return result
+
+    def _finish(self,
+                key: tuple[str, str, str],
+                name: str,
+                future: Future,
+                result: Any = None,
+                error: BaseException | None = None) -> None:
+        with self.lock:
+            if error is None:
+                self.executed += 1
+                self._append({"event": "done", "tool": name, "result": result}, key)
+                self.done[(key[0], key[2])] = key
+            else:
+                self.failed += 1
+                self._append({"event": "failed", "tool": name, "error": repr(error)}, key)
+            self.in_flight.pop(key, None)
+            self.in_flight.pop((key[0], key[2]), None)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _append(self, record: dict, key: tuple[str, str, str]) -> None:
+        # called with the lock held
+        record = {
+            "thread_id": key[0],
+            "tool_call_id": key[1],
+            "args_hash": key[2],
+            "ts": time.time(),
+            **record,
+        }
+        self.entries[key] = record
+        self.file.write(json.dumps(record, default=str) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+def _idempotency_key(key: tuple[str, str, str]) -> str:
+    # same for every call of a tool with the same arguments in a thread, whatever its call id
+    return hashlib.sha256(f"{key[0]}:{key[2]}".encode("utf-8")).hexdigest()[:32]
+
+_journals: dict[str, ToolJournal] = {}
+_journals_lock = threading.Lock()
+
+def get_tool_journal(path: str = tools_config.TOOL_JOURNAL_PATH) -> ToolJournal:
+    """The process-wide journal of `path`, configured in config/tools.py.
+
+    Shared by every agent of the process, so that the calls they make are deduplicated
+    against each other.
+    """
+    path = os.path.abspath(path)
+    with _journals_lock:
+        if path not in _journals:
+            _journals[path] = ToolJournal(path, fsync=tools_config.TOOL_JOURNAL_FSYNC)
+            atexit.register(_journals[path].close)
+        return _journals[path]
@@ -1,4 +1,14 @@
-from langchain_core.tools import tool
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Annotated
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, InjectedToolCallId, StructuredTool, tool
+from pydantic import create_model
+
+from lang_graph_project.agent.tool_journal import ToolJournal, get_tool_journal
+from lang_graph_project.config import tools as tools_config
 
 @tool
 def write_email(to: str, subject: str, content: str) -> str:
@@ -22,3 +32,168 @@ def check_calendar_availability(day: str) -> str:
     """Check calendar availability for a given day."""
     # Placeholder response - in real app would check actual calendar
     return f"Available times on {day}: 9:00 AM, 2:00 PM, 4:00 PM"
+
+class ToolTimeoutError(TimeoutError):
+    """A tool call ran past its timeout."""
+
+def with_timeout(wrapped: BaseTool, timeout: float, executor: ThreadPoolExecutor) -> BaseTool:
+    """`wrapped` under a timeout, same name, description and arguments.
+
+    Sync calls run on `executor` with the caller's context (langgraph's config and store);
+    a call that times out keeps its thread (or, async, its task) until it returns, but the
+    agent moves on.
+
+    Raises:
+        ToolTimeoutError: from the call, turned into an error message for the model by ToolNode.
+    """
+    def run(config: RunnableConfig, **kwargs):
+        context = contextvars.copy_context()
+        future = executor.submit(context.run, _invoke, wrapped, kwargs, config)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ToolTimeoutError(f"{wrapped.name} did not answer within {timeout:g} seconds")
+
+    async def arun(config: RunnableConfig, **kwargs):
+        # shielded like a sync call keeps its thread: a journaled call that times out still
+        # records its result, and a retry joins it instead of making it again
+        task = asyncio.ensure_future(_ainvoke(wrapped, kwargs, config))
+        task.add_done_callback(_retrieve_exception)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise ToolTimeoutError(f"{wrapped.name} did not answer within {timeout:g} seconds")
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=wrapped.name,
+        description=wrapped.description,
+        args_schema=wrapped.args_schema,
+    )
+
+def journaled(wrapped: BaseTool, journal: ToolJournal) -> BaseTool:
+    """`wrapped` made at most once per thread and tool call, see agent/tool_journal.py.
+
+    The tool call id is injected by ToolNode (the model never sees it) and passed down as a
+    full tool call by the wrappers of this module, so the journal sits right around the tool:
+    a call that timed out still records its result when it returns. Calls without a
+    `thread_id` in the configurable are not journaled.
+    """
+    args_schema = create_model(
+        wrapped.args_schema.__name__,
+        __base__=wrapped.args_schema,
+        tool_call_id=(Annotated[str, InjectedToolCallId], ...),
+    )
+
+    def run(config: RunnableConfig, tool_call_id: str, **kwargs):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return wrapped.invoke(kwargs, config)
+        return journal.call(
+            thread_id, tool_call_id, wrapped.name, kwargs, lambda: wrapped.invoke(kwargs, config)
+        )
+
+    async def arun(config: RunnableConfig, tool_call_id: str, **kwargs):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return await wrapped.ainvoke(kwargs, config)
+        return await journal.acall(
+            thread_id, tool_call_id, wrapped.name, kwargs, lambda: wrapped.ainvoke(kwargs, config)
+        )
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=wrapped.name,
+        description=wrapped.description,
+        args_schema=args_schema,
+    )
+
+def deferred_until_confirmed(wrapped: BaseTool) -> BaseTool:
+    """`wrapped` held back while its response is speculative, see agent/speculation.py.
+
+    A call made with a `speculation_gate` in the configurable waits for triage to confirm
+    the response, and is never made if it doesn't. Speculation only runs in the async API,
+    sync calls go straight through.
+    """
+    def run(config: RunnableConfig, **kwargs):
+        return _invoke(wrapped, kwargs, config)
+
+    async def arun(config: RunnableConfig, **kwargs):
+        gate = config.get("configurable", {}).get("speculation_gate")
+        if gate is not None:
+            await gate.wait()
+        return await _ainvoke(wrapped, kwargs, config)
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=wrapped.name,
+        description=wrapped.description,
+        args_schema=wrapped.args_schema,
+    )
+
+def with_side_effects_deferred(tools: list[BaseTool]) -> list[BaseTool]:
+    """The tools of config/tools.py:SIDE_EFFECT_TOOLS wrapped in `deferred_until_confirmed`."""
+    return [
+        deferred_until_confirmed(wrapped) if wrapped.name in tools_config.SIDE_EFFECT_TOOLS else wrapped
+        for wrapped in tools
+    ]
+
+def with_journal(tools: list[BaseTool]) -> list[BaseTool]:
+    """The tools of config/tools.py:SIDE_EFFECT_TOOLS wrapped in `journaled`, if the journal is enabled."""
+    if not tools_config.TOOL_JOURNAL:
+        return tools
+    journal = get_tool_journal()
+    return [
+        journaled(wrapped, journal) if wrapped.name in tools_config.SIDE_EFFECT_TOOLS else wrapped
+        for wrapped in tools
+    ]
+
+def with_timeouts(tools: list[BaseTool]) -> list[BaseTool]:
+    """The tools under the timeouts of config/tools.py, unchanged if they are disabled."""
+    if tools_config.TOOL_TIMEOUT is None:
+        return tools
+    executor = ThreadPoolExecutor(
+        max_workers=tools_config.TOOL_MAX_WORKERS, thread_name_prefix="tool"
+    )
+    return [
+        with_timeout(
+            wrapped,
+            tools_config.TOOL_TIMEOUTS.get(wrapped.name, tools_config.TOOL_TIMEOUT),
+            executor,
+        )
+        for wrapped in tools
+    ]
+
+# Helpers
+
+def _tool_call(wrapped: BaseTool, kwargs: dict) -> dict | None:
+    """`kwargs` as a full tool call, if `wrapped` takes an injected tool call id (see `journaled`).
+
+    langchain only injects the id when a tool is invoked with a tool call, not with plain arguments.
+    """
+    if "tool_call_id" not in kwargs or "tool_call_id" in wrapped.tool_call_schema.model_fields:
+        return None
+    args = {key: value for key, value in kwargs.items() if key != "tool_call_id"}
+    return {"type": "tool_call", "id": kwargs["tool_call_id"], "name": wrapped.name, "args": args}
+
+def _invoke(wrapped: BaseTool, kwargs: dict, config: RunnableConfig):
+    call = _tool_call(wrapped, kwargs)
+    if call is None:
+        return wrapped.invoke(kwargs, config)
+    # a tool call returns a ToolMessage, the outer tool makes its own
+    return wrapped.invoke(call, config).content
+
+async def _ainvoke(wrapped: BaseTool, kwargs: dict, config: RunnableConfig):
+    call = _tool_call(wrapped, kwargs)
+    if call is None:
+        return await wrapped.ainvoke(kwargs, config)
+    return (await wrapped.ainvoke(call, config)).content
+
+def _retrieve_exception(task: asyncio.Future) -> None:
+    # the error of a call nobody waits for anymore (it timed out) is not worth a warning
+    if not task.cancelled():
+        task.exception()
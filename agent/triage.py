@@ -0,0 +1,297 @@
+import json
+import threading
+import time
+from collections import deque
+from typing import Any
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from lang_graph_project.config import triage as triage_config
+from lang_graph_project.constants.prompt_templates import (
+    triage_batch_user_prompt_template,
+    triage_batch_email_template,
+)
+from lang_graph_project.schemas.router import Router
+from lang_graph_project.utils.open_ai import new_structured_output
+from lang_graph_project.utils.response_cache import CachedStructuredOutput
+
+def pack_triage_messages(batch_messages: list[list[dict]]) -> list[dict]:
+    """Pack several single-email triage requests that share one system prompt into one request.
+
+    Args:
+        batch_messages (list[list[dict]]): Triage requests, each one being
+            `[{"role": "system", ...}, {"role": "user", ...}]`. All of them
+            must carry the same system prompt.
+
+    Returns:
+        list[dict]: The system prompt followed by one user message listing every
+            email as `< Email N >`, N being the position in `batch_messages`.
+    """
+    emails = "".join(
+        triage_batch_email_template.format(index=index, user_prompt=messages[1]["content"])
+        for index, messages in enumerate(batch_messages)
+    )
+    return [
+        batch_messages[0][0],
+        {
+            "role": "user",
+            "content": triage_batch_user_prompt_template.format(
+                count=len(batch_messages),
+                emails=emails,
+            ),
+        },
+    ]
+
+def route_batch(
+    llm_router,
+    batch_messages: list[list[dict]],
+    max_concurrency: int = 8,
+    llm_batch_router=None,
+    pack_size: int = 1,
+) -> list[Router]:
+    """Classify many emails with as few sequential model round-trips as possible.
+
+    Emails are either packed `pack_size` at a time into one structured-output request
+    (only emails sharing the same system prompt are packed together), or fanned out
+    through `llm_router.batch` with at most `max_concurrency` requests in flight.
+    Any email the model fails to classify is retried on its own with `llm_router.invoke`.
+    Identical requests are sent once, and with a `CachedStructuredOutput` router the
+    cached emails are not sent at all.
+
+    Args:
+        llm_router: Structured-output runnable returning a `Router`.
+        batch_messages (list[list[dict]]): One `[system, user]` triage request per email.
+        max_concurrency (int): Upper bound of concurrent requests to the model server.
+        llm_batch_router: Structured-output runnable returning a `BatchRouter`,
+            required when `pack_size` is greater than 1.
+        pack_size (int): Number of emails packed into one request, 1 disables packing.
+
+    Returns:
+        list[Router]: One classification per email, in input order.
+    """
+    # identical requests, e.g. one announcement sent to many aliases, are classified once
+    positions: dict[str, list[int]] = {}
+    for i, messages in enumerate(batch_messages):
+        positions.setdefault(json.dumps(messages, sort_keys=True, default=str), []).append(i)
+    requests = [batch_messages[indices[0]] for indices in positions.values()]
+
+    if isinstance(llm_router, CachedStructuredOutput):
+        results: list[Router | None] = llm_router.lookup(requests)
+    else:
+        results = [None] * len(requests)
+    todo = [i for i, result in enumerate(results) if result is None]
+
+    if todo and pack_size > 1 and llm_batch_router is not None:
+        groups: dict[str, list[int]] = {}
+        for i in todo:
+            groups.setdefault(requests[i][0]["content"], []).append(i)
+        chunks = [
+            indices[start:start + pack_size]
+            for indices in groups.values()
+            for start in range(0, len(indices), pack_size)
+        ]
+        packed = llm_batch_router.batch(
+            [pack_triage_messages([requests[i] for i in chunk]) for chunk in chunks],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for chunk, batch in zip(chunks, packed):
+            if isinstance(batch, Exception) or batch is None:
+                continue
+            for i, result in zip(chunk, _unpack(batch, len(chunk))):
+                results[i] = result
+        tiered = tiered_router(llm_router)
+        if tiered is not None:
+            # packed answers come from the small model
+            escalated = [i for i in todo if results[i] is not None and tiered.needs_escalation(results[i])]
+            if escalated:
+                for i, result in zip(escalated, tiered.escalate([requests[i] for i in escalated], max_concurrency)):
+                    if not isinstance(result, Exception):
+                        results[i] = result
+        if isinstance(llm_router, CachedStructuredOutput):
+            llm_router.remember([requests[i] for i in todo], [results[i] for i in todo])
+    elif todo:
+        cached = isinstance(llm_router, CachedStructuredOutput)
+        # the cache was already read above, go straight to the model
+        fanned_out = (llm_router.runnable if cached else llm_router).batch(
+            [requests[i] for i in todo],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for i, result in zip(todo, fanned_out):
+            if not isinstance(result, Exception):
+                results[i] = result
+        if cached:
+            llm_router.remember([requests[i] for i in todo], [results[i] for i in todo])
+
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = llm_router.invoke(requests[i])
+
+    routed: list[Router | None] = [None] * len(batch_messages)
+    for indices, result in zip(positions.values(), results):
+        for i in indices:
+            routed[i] = result
+    return routed
+
+def _unpack(batch, size: int) -> list[Router | None]:
+    """Map a `BatchRouter` answer back to its emails, `None` for each email left unclassified."""
+    results: list[Router | None] = [None] * size
+    counts = [0] * size
+    for route in batch.routes:
+        if 0 <= route.index < size:
+            counts[route.index] += 1
+            results[route.index] = Router(
+                reasoning=route.reasoning,
+                classification=route.classification,
+                confidence=route.confidence,
+            )
+    # can't tell which answer belongs to an email classified more than once
+    return [result if count == 1 else None for result, count in zip(results, counts)]
+
+class TieredRouter(Runnable):
+    """Two-tier triage: a small fast model classifies, a larger one is only asked when needed.
+
+    An answer of the small model is escalated to the large one when its `confidence` is
+    missing or under `threshold`, or when it is "respond" and `escalate_respond` is set,
+    answering an email being the costly mistake. `batch`/`abatch` run `invoke`/`ainvoke`
+    concurrently (`Runnable` defaults), so every email is timed and escalated on its own.
+
+    Args:
+        small (Runnable): Structured-output runnable of the small model, returning a `Router`.
+        large (Runnable): Structured-output runnable of the large model, returning a `Router`.
+        threshold (float): Confidence under which an answer is escalated.
+        escalate_respond (bool): Escalate every "respond" answer.
+        window (int): Number of latencies per tier kept for the percentiles of `stats`.
+    """
+
+    def __init__(self,
+                 small: Runnable,
+                 large: Runnable,
+                 threshold: float = 0.8,
+                 escalate_respond: bool = True,
+                 window: int = 1000):
+        self.small = small
+        self.large = large
+        self.threshold = threshold
+        self.escalate_respond = escalate_respond
+        self.lock = threading.Lock()
+        self.calls = {"small": 0, "large": 0}
+        self.errors = {"small": 0, "large": 0}
+        self.latencies = {"small": deque(maxlen=window), "large": deque(maxlen=window)}
+        self.escalations = 0
+
+    def needs_escalation(self, result: Router) -> bool:
+        if result.confidence is None or result.confidence < self.threshold:
+            return True
+        return self.escalate_respond and result.classification == "respond"
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Router:
+        result = self._timed("small", lambda: self.small.invoke(input, config, **kwargs))
+        if not self.needs_escalation(result):
+            return result
+        self._escalated(1)
+        return self._timed("large", lambda: self.large.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> Router:
+        result = await self._atimed("small", self.small.ainvoke(input, config, **kwargs))
+        if not self.needs_escalation(result):
+            return result
+        self._escalated(1)
+        return await self._atimed("large", self.large.ainvoke(input, config, **kwargs))
+
+    def escalate(self, inputs: list, max_concurrency: int = 8) -> list:
+        """Answers of the large model for inputs the small one already answered, e.g. packed.
+
+        Failed requests come back as exceptions.
+        """
+        self._escalated(len(inputs))
+        start = time.perf_counter()
+        results = self.large.batch(
+            inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True
+        )
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            # concurrent requests: the wall time of the batch bounds each of them
+            for result in results:
+                self.calls["large"] += 1
+                self.errors["large"] += isinstance(result, Exception)
+                self.latencies["large"].append(elapsed)
+        return results
+
+    def stats(self) -> dict:
+        """Calls, errors and latency percentiles (seconds) per tier, and the escalation rate."""
+        with self.lock:
+            stats = {}
+            for tier in ("small", "large"):
+                latencies = sorted(self.latencies[tier])
+                stats[tier] = {
+                    "calls": self.calls[tier],
+                    "errors": self.errors[tier],
+                    "p50": latencies[len(latencies) // 2] if latencies else 0.0,
+                    "p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                    "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+                }
+            stats["escalations"] = self.escalations
+            stats["escalation_rate"] = (
+                self.escalations / self.calls["small"] if self.calls["small"] else 0.0
+            )
+            return stats
+
+    # Helpers
+
+    def _timed(self, tier: str, call):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = call()
+            failed = False
+            return result
+        finally:
+            self._record(tier, start, failed)
+
+    async def _atimed(self, tier: str, call):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await call
+            failed = False
+            return result
+        finally:
+            self._record(tier, start, failed)
+
+    def _record(self, tier: str, start: float, failed: bool) -> None:
+        with self.lock:
+            self.calls[tier] += 1
+            self.errors[tier] += failed
+            self.latencies[tier].append(time.perf_counter() - start)
+
+    def _escalated(self, count: int) -> None:
+        with self.lock:
+            self.escalations += count
+
+def tiered_router(llm_router) -> TieredRouter | None:
+    """The `TieredRouter` behind a triage router, cached or not, None when it isn't tiered."""
+    if isinstance(llm_router, CachedStructuredOutput):
+        llm_router = llm_router.runnable
+    return llm_router if isinstance(llm_router, TieredRouter) else None
+
+def new_triage_router(chat, escalation_chat=None):
+    """The router of the triage agents: `chat` alone, or `chat` escalating to `escalation_chat`.
+
+    Either way the answers are cached when config/open_ai.py:RESPONSE_CACHE is set.
+    """
+    if escalation_chat is None:
+        return new_structured_output(chat, Router)
+    tiered = TieredRouter(
+        chat.with_structured_output(Router),
+        escalation_chat.with_structured_output(Router),
+        threshold=triage_config.ESCALATION_THRESHOLD,
+        escalate_respond=triage_config.ESCALATE_RESPOND,
+    )
+    return new_structured_output(
+        chat,
+        Router,
+        runnable=tiered,
+        llm_string=chat._get_llm_string() + escalation_chat._get_llm_string(),
+    )
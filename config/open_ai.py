@@ -14,4 +14,44 @@
 # https://github.com/jmorganca/ollama/blob
 
 BASE_URL="http://127.0.0.1:11434/v1"
-API_KEY="ollama"
\ No newline at end of file
+API_KEY="ollama"
+
+# HTTP clients shared by every model and embedding client of the process, see utils/clients.py:ClientRegistry
+# one keep-alive pool per BASE_URL; HTTP2 is negotiated with TLS servers only, and needs httpx[http2]
+HTTP_MAX_CONNECTIONS=64
+HTTP_MAX_KEEPALIVE=32
+HTTP_KEEPALIVE_EXPIRY=60.0
+HTTP_TIMEOUT=120.0
+HTTP_CONNECT_TIMEOUT=5.0
+HTTP2=True
+
+# Replicas of the model server, see utils/balancer.py:EndpointPool
+# requests go to the replica with the fewest requests in flight and are retried on another one after a
+# connection error or a 502/503/504 (ENDPOINT_RETRIES times); a replica failing EJECT_AFTER times in a row,
+# or its /models probe every PROBE_INTERVAL seconds, is ejected for EJECT_SECONDS. Chat and embedding
+# traffic can go to different replicas
+CHAT_ENDPOINTS=[BASE_URL]
+EMBEDDING_ENDPOINTS=[BASE_URL]
+ENDPOINT_RETRIES=2
+ENDPOINT_EJECT_AFTER=3
+ENDPOINT_EJECT_SECONDS=30.0
+ENDPOINT_PROBE_INTERVAL=10.0
+
+# Embedding cache, see utils/embeddings.py:CachedEmbeddings
+# EMBEDDING_CACHE_PATH=None keeps the cache in process memory only
+EMBEDDING_CACHE=True
+EMBEDDING_CACHE_SIZE=10000
+EMBEDDING_CACHE_PATH=None
+
+# Triage response cache, see utils/response_cache.py:CachedStructuredOutput
+# identical emails under the same prompts are classified once, results expire after RESPONSE_CACHE_TTL seconds (a week)
+RESPONSE_CACHE=False
+RESPONSE_CACHE_PATH="triage_cache.sqlite"
+RESPONSE_CACHE_TTL=604800
+RESPONSE_CACHE_SIZE=100000
+
+# Near-duplicate triage, see agent/near_duplicates.py:NearDuplicateCache
+# an email this similar (cosine) to one of the last NEAR_DUPLICATE_WINDOW classified emails of the user
+# gets the same classification without calling the model, e.g. 0.97. None disables it
+NEAR_DUPLICATE_THRESHOLD=None
+NEAR_DUPLICATE_WINDOW=1000
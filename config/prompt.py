@@ -0,0 +1,27 @@
+# Layout of the system prompts, see agent/prompt.py:PromptRenderer
+# "default": the layout of the course
+# "cache_optimized": most stable parts first and few-shot examples in a fixed order,
+#   so that servers with prefix caching (llama.cpp, Ollama, vLLM) reuse more of each prompt
+PROMPT_LAYOUT="default"
+
+# Token budget of the triage prompts, see utils/token_budget.py:TokenBudget
+# quoted replies and signatures are stripped, then the email thread and the contents of all the
+# few-shot examples are truncated to their budget (tokens of TOKENIZER_ENCODING, tiktoken)
+TOKEN_BUDGET=False
+TOKEN_BUDGET_EMAIL=1500
+TOKEN_BUDGET_EXAMPLES=1200
+TOKENIZER_ENCODING="o200k_base"
+
+# Message-history compaction of the response agent, see agent/compaction.py:MessageCompactor
+# past MAX_TOKENS of history, tool results older than the last KEEP_TURNS model turns are cut down to
+# SUMMARY_TOKENS (summarized by the agent's model if SUMMARIZE, truncated otherwise), then dropped
+COMPACTION=False
+COMPACTION_MAX_TOKENS=2000
+COMPACTION_KEEP_TURNS=2
+COMPACTION_SUMMARY_TOKENS=60
+COMPACTION_SUMMARIZE=False
+
+# Procedural prompts cached per user, see agent/prompt_cache.py:ProceduralPromptCache
+# read again from the store after TTL seconds, so that every worker process sees the prompts
+# updated by another one (None keeps them until updated by this process)
+PROMPT_CACHE_TTL=60.0
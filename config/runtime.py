@@ -0,0 +1,13 @@
+# Multi-tenant worker pool, see agent/runtime.py:WorkerPool
+# each worker process builds one email agent (one compiled graph, store and set of HTTP clients) for all
+# tenants; a tenant's emails always go to the same worker, so its caches stay warm there.
+# START_METHOD "forkserver" imports the agent's modules once and forks every worker from that process
+WORKER_PROCESSES=4
+WORKER_MAX_CONCURRENCY=8
+WORKER_MAX_RETRIES=1
+WORKER_START_METHOD="forkserver"
+
+# emails of one tenant (langgraph_user_id) in flight at most, see agent/runtime.py:TenantQuotas
+# TENANT_CONCURRENCY_LIMITS overrides it per tenant
+TENANT_CONCURRENCY=4
+TENANT_CONCURRENCY_LIMITS={}
@@ -0,0 +1,18 @@
+# Backend of the memory store shared by the agents, see agent/memory.py:new_store
+# "memory": langgraph InMemoryStore, everything is lost when the process exits
+# "sqlite": agent/sqlite_store.SqliteStore, items and embeddings persisted in STORE_PATH
+STORE_KIND="memory"
+STORE_PATH="email_assistant.sqlite"
+
+# Per-namespace vector indexes used by semantic search, see agent/vector_index.py:IVFIndex
+# NPROBE is the recall/latency knob, TRAIN_THRESHOLD the namespace size below which search stays exact
+VECTOR_INDEX_NPROBE=8
+VECTOR_INDEX_TRAIN_THRESHOLD=2048
+
+# Checkpoints of the email graph, see agent/sqlite_checkpointer.py:SqliteCheckpointer
+# An email whose run was interrupted (crash, restart) resumes from its last step, see EmailAgent.resume
+# FLUSH_INTERVAL is the seconds of writes a crash may lose, SNAPSHOT_EVERY the message deltas between full copies
+CHECKPOINTER=False
+CHECKPOINT_PATH="email_assistant_checkpoints.sqlite"
+CHECKPOINT_FLUSH_INTERVAL=0.05
+CHECKPOINT_SNAPSHOT_EVERY=32
@@ -0,0 +1,21 @@
+# Timeouts of the response agent's tools, in seconds, see agent/tools.py:with_timeouts
+# the tool calls of one model turn already run concurrently (langgraph's ToolNode); a call that doesn't
+# answer in time is reported to the model as an error instead of holding up the whole turn.
+# TOOL_TIMEOUTS overrides TOOL_TIMEOUT per tool name, None disables the timeouts
+TOOL_TIMEOUT=30.0
+TOOL_TIMEOUTS={
+    "write_email": 60.0,
+    "schedule_meeting": 60.0,
+}
+# worker threads running sync tool calls under a timeout
+TOOL_MAX_WORKERS=16
+
+# tools with effects outside the agent, held back while a response is drafted speculatively,
+# see agent/tools.py:deferred_until_confirmed
+SIDE_EFFECT_TOOLS=("write_email", "schedule_meeting", "manage_memory")
+
+# journal of the SIDE_EFFECT_TOOLS calls, see agent/tool_journal.py:ToolJournal
+# a call retried after a timeout or replayed by a resume returns its recorded result instead of being made again
+TOOL_JOURNAL=False
+TOOL_JOURNAL_PATH="tool_journal.jsonl"
+TOOL_JOURNAL_FSYNC=False
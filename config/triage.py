@@ -0,0 +1,32 @@
+# Rule-based pre-triage ahead of the triage model, see agent/pre_triage.py:PreTriage
+# obvious ignore/notify emails (bulk mail headers, newsletters, build notifications) never reach the model
+PRE_TRIAGE=False
+PRE_TRIAGE_THRESHOLD=1.0
+
+# Sender reputations learned from the few-shot examples of each user, see agent/pre_triage.py:SenderReputation
+# a sender is trusted once it has MIN_COUNT examples, MIN_SHARE of them with the same label
+SENDER_REPUTATION=True
+SENDER_REPUTATION_MIN_COUNT=3
+SENDER_REPUTATION_MIN_SHARE=0.9
+
+# Per-user classifier over email embeddings trained from the few-shot examples, see agent/local_classifier.py
+# classifies locally at CONFIDENCE or above once a user has MIN_EXAMPLES examples, defers to the model otherwise;
+# SHADOW_RATE of the confident emails still go to the model to measure agreement
+LOCAL_CLASSIFIER=False
+LOCAL_CLASSIFIER_CONFIDENCE=0.9
+LOCAL_CLASSIFIER_MIN_EXAMPLES=30
+LOCAL_CLASSIFIER_SHADOW_RATE=0.05
+
+# Tiered triage, see agent/triage.py:TieredRouter
+# the driver's model classifies first; answers under ESCALATION_THRESHOLD confidence (or without one), and
+# respond answers when ESCALATE_RESPOND, are asked again to ESCALATION_MODEL. None disables the cascade
+ESCALATION_MODEL=None
+ESCALATION_THRESHOLD=0.8
+ESCALATE_RESPOND=True
+
+# Speculative response drafting, async API only, see agent/speculation.py:RespondPredictor
+# emails scoring SPECULATION_THRESHOLD or more (questions, requests, meetings) start the response agent while
+# triage runs; its side-effecting tools (config/tools.py:SIDE_EFFECT_TOOLS) wait for triage to answer respond,
+# anything else cancels it
+SPECULATION=False
+SPECULATION_THRESHOLD=0.6
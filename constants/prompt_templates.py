@@ -104,10 +104,60 @@ Emails that are worth responding to:
 </ Few shot examples >
 """
 
+# Triage prompt ordered from the most to the least stable part, for model servers with prefix caching:
+# the instructions are the same for everyone, then the user's background, then the rules that
+# the prompt optimizer rewrites, then the few-shot examples that change with every email
+triage_system_prompt_cache_optimized_template = """
+< Role >
+You are {full_name}'s executive assistant. You are a top-notch executive assistant who cares about {name} performing as well as possible.
+</ Role >
+
+< Instructions >
+
+{name} gets lots of emails. Your job is to categorize each email into one of three categories:
+
+1. IGNORE - Emails that are not worth responding to or tracking
+2. NOTIFY - Important information that {name} should know about but doesn't require a response
+3. RESPOND - Emails that need a direct response from {name}
+
+Classify the below email into one of these categories.
+
+</ Instructions >
+
+< Background >
+{user_profile_background}. 
+</ Background >
+
+< Rules >
+Emails that are not worth responding to:
+{triage_no}
+
+There are also other things that {name} should know about, but don't require an email response. For these, you should notify {name} (using the `notify` response). Examples of this include:
+{triage_notify}
+
+Emails that are worth responding to:
+{triage_email}
+</ Rules >
+
+< Few shot examples >
+{examples}
+</ Few shot examples >
+"""
+
 triage_user_prompt_template = """
 Please determine how to handle the below email thread:
 
 From: {author}
 To: {to}
 Subject: {subject}
-{email_thread}"""
\ No newline at end of file
+{email_thread}"""
+
+# Triage prompt for several emails packed into one request
+triage_batch_user_prompt_template = """
+Please determine how to handle each of the below {count} email threads.
+Classify every email on its own and return one result per email, using the email number as its index.
+{emails}"""
+
+triage_batch_email_template = """
+< Email {index} >{user_prompt}
+</ Email {index} >"""
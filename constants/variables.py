@@ -11,4 +11,71 @@ prompt_instructions = {
         "respond": "Direct questions from team members, meeting requests, critical bug reports",
     },
     "agent_instructions": "Use these tools when appropriate to help manage John's tasks efficiently."
-}
\ No newline at end of file
+}
+
+# Rules of the rule-based pre-triage, see agent/pre_triage.py:PreTriage
+# only the obvious cases of the ignore and notify triage_rules above, everything else goes to the model
+# "headers": raw header name -> regex of its value, "author"/"subject": regexes, "keywords": phrases of the thread
+pre_triage_rules = {
+    "ignore": {
+        "headers": {
+            "List-Unsubscribe": r".",
+            "Precedence": r"^\s*(bulk|list|junk)\s*$",
+        },
+        "author": [
+            r"\b(newsletters?|marketing|promo(tions)?|offers|deals)@",
+        ],
+        "subject": [
+            r"\bnewsletter\b",
+            r"\b(weekly|monthly) digest\b",
+            r"\b\d{1,2}% off\b",
+        ],
+        "keywords": [
+            "unsubscribe",
+            "view this email in your browser",
+            "manage your email preferences",
+            "limited time offer",
+            "special offer",
+            "you are receiving this email because",
+        ],
+    },
+    "notify": {
+        "headers": {},
+        "author": [
+            r"\b(ci|jenkins|builds?|buildkite|circleci|github-actions|gitlab)@",
+        ],
+        "subject": [
+            r"\b(build|pipeline|workflow) (failed|succeeded|passed|fixed|broken)\b",
+            r"\bout sick\b",
+        ],
+        "keywords": [
+            "build failed",
+            "build succeeded",
+            "pipeline failed",
+            "pipeline succeeded",
+            "out sick",
+            "sick today",
+            "status update",
+        ],
+    },
+}
+
+# Signals of an email that will need an answer, see agent/speculation.py:RespondPredictor
+# each distinct phrase found in the new part of the thread adds its weight
+respond_signals = {
+    "can you": 0.3,
+    "could you": 0.3,
+    "would you": 0.3,
+    "let me know": 0.3,
+    "please confirm": 0.4,
+    "are you available": 0.5,
+    "your availability": 0.5,
+    "meeting": 0.3,
+    "schedule": 0.3,
+    "call": 0.2,
+    "review": 0.2,
+    "feedback": 0.2,
+    "deadline": 0.2,
+    "urgent": 0.3,
+    "asap": 0.3,
+}
@@ -0,0 +1,49 @@
+from typing import Any, Union
+
+from pydantic import BaseModel, Field
+from typing_extensions import Literal
+
+
+class TriageEvent(BaseModel):
+    """The triage decision, sent as soon as it is made."""
+
+    type: Literal["triage"] = "triage"
+    classification: Literal["ignore", "respond", "notify"]
+    reasoning: str
+    confidence: float | None = None
+
+
+class TokenEvent(BaseModel):
+    """A piece of text generated by the response agent's model."""
+
+    type: Literal["token"] = "token"
+    delta: str
+
+
+class ToolCallStarted(BaseModel):
+    """The response agent called a tool."""
+
+    type: Literal["tool_start"] = "tool_start"
+    id: str
+    name: str
+    args: dict[str, Any] = Field(default_factory=dict)
+
+
+class ToolCallFinished(BaseModel):
+    """A tool call of the response agent returned."""
+
+    type: Literal["tool_end"] = "tool_end"
+    id: str
+    name: str
+    content: str
+    status: Literal["success", "error"] = "success"
+
+
+class DraftEvent(BaseModel):
+    """The final answer of the response agent."""
+
+    type: Literal["draft"] = "draft"
+    content: str
+
+
+EmailEvent = Union[TriageEvent, TokenEvent, ToolCallStarted, ToolCallFinished, DraftEvent]
@@ -13,3 +13,25 @@ class Router(BaseModel):
         "'notify' for important information that doesn't need a response, "
         "'respond' for emails that need a reply",
     )
+    confidence: float | None = Field(
+        default=None,
+        ge=0.0,
+        le=1.0,
+        description="How sure you are of the classification, from 0 (guessing) to 1 (certain).",
+    )
+
+
+class IndexedRouter(Router):
+    """Routing decision for one email of a packed batch."""
+
+    index: int = Field(
+        description="The number of the email being classified, as given in its `< Email N >` header."
+    )
+
+
+class BatchRouter(BaseModel):
+    """Analyze each of the unread emails and route every one of them according to its content."""
+
+    routes: list[IndexedRouter] = Field(
+        description="One routing decision per email, in the same order as the emails."
+    )
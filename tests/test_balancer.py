@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from lang_graph_project.utils.balancer import AsyncBalancedTransport, BalancedTransport, EndpointPool
+
+URLS = ["http://replica-a/v1", "http://replica-b/v1"]
+
+def _pool(**kwargs) -> EndpointPool:
+    return EndpointPool(URLS, probe_interval=None, **kwargs)
+
+def _client(pool: EndpointPool, handlers: dict, retries: int = 2) -> httpx.Client:
+    """A client of `pool` whose replicas are answered by `handlers(request)`, by URL."""
+    transports = {url: httpx.MockTransport(handlers[url]) for url in URLS}
+    return httpx.Client(base_url=URLS[0], transport=BalancedTransport(pool, transports, retries=retries))
+
+def _answer(status: int, body: bytes = b"{}") -> httpx.Response:
+    # streamed like a server's answer: httpx closes (and the balancer releases) it once read
+    return httpx.Response(status, stream=httpx.ByteStream(body))
+
+def _replica(hits: list, status: int = 200):
+    def handle(request: httpx.Request) -> httpx.Response:
+        hits.append(request.url.host)
+        return _answer(status, json.dumps({"host": request.url.host}).encode())
+    return handle
+
+def test_least_outstanding_replica_is_picked():
+    pool = _pool()
+
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    third = pool.acquire()
+
+    assert first is not second
+    assert third is first
+    assert [stats["in_flight"] for stats in pool.stats().values()] == [1, 1]
+
+def test_requests_are_sent_to_the_picked_replica_and_released():
+    pool = _pool()
+    hits = []
+    client = _client(pool, {url: _replica(hits) for url in URLS})
+
+    for _ in range(4):
+        response = client.get("/models")
+        assert response.json()["host"] == hits[-1]
+
+    assert sorted(set(hits)) == ["replica-a", "replica-b"]
+    assert all(stats["in_flight"] == 0 for stats in pool.stats().values())
+
+@pytest.mark.parametrize("status", [502, 503, 504])
+def test_failed_request_is_retried_on_another_replica(status):
+    pool = _pool()
+    hits = []
+    failing = []
+
+    def fail_first(request: httpx.Request) -> httpx.Response:
+        hits.append(request.url.host)
+        if not failing:
+            failing.append(request.url.host)
+            return _answer(status)
+        return _answer(200)
+
+    client = _client(pool, {url: fail_first for url in URLS})
+
+    assert client.get("/chat/completions").status_code == 200
+    assert hits[0] != hits[1]
+    assert pool.stats()[f"http://{failing[0]}/v1"]["failures"] == 1
+    assert all(stats["in_flight"] == 0 for stats in pool.stats().values())
+
+def test_failing_replica_is_ejected():
+    pool = _pool(eject_after=2)
+    hits = []
+    client = _client(pool, {URLS[0]: _replica([], status=503), URLS[1]: _replica(hits)}, retries=1)
+
+    # idle replicas are picked at random, send requests until the failing one was tried twice
+    for _ in range(100):
+        assert client.get("/models").status_code == 200
+        if pool.stats()[URLS[0]]["ejected"]:
+            break
+    stats = pool.stats()
+    ejected_hits = len(hits)
+    for _ in range(4):
+        assert client.get("/models").status_code == 200
+
+    assert stats[URLS[0]]["ejected"]
+    assert stats[URLS[0]]["failures"] == 2
+    assert not stats[URLS[1]]["ejected"]
+    assert len(hits) == ejected_hits + 4
+    assert pool.stats()[URLS[0]]["requests"] == stats[URLS[0]]["requests"]
+
+def test_cancelled_request_is_released():
+    pool = _pool()
+
+    async def hang(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(10)
+        return _answer(200)
+
+    async def cancel_requests():
+        transports = {url: httpx.MockTransport(hang) for url in URLS}
+        async with httpx.AsyncClient(
+            base_url=URLS[0], transport=AsyncBalancedTransport(pool, transports)
+        ) as client:
+            for _ in range(3):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(client.get("/models"), 0.05)
+
+    asyncio.run(cancel_requests())
+
+    for stats in pool.stats().values():
+        assert stats["in_flight"] == 0
+        assert stats["failures"] == 0
+        assert not stats["ejected"]
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.tools import tool
+from langgraph.prebuilt import ToolNode
+
+from lang_graph_project.agent.tool_journal import ToolJournal
+from lang_graph_project.agent.tools import deferred_until_confirmed, journaled, with_timeout
+
+CONFIG = {"configurable": {"thread_id": "thread-1"}}
+
+@pytest.fixture
+def sent():
+    return []
+
+@pytest.fixture
+def new_tool_node(tmp_path, sent):
+    """Factory of ToolNodes over a journaled `write_email` taking `delay` seconds, under `timeout`."""
+    journal = ToolJournal(str(tmp_path / "journal.jsonl"))
+    executor = ThreadPoolExecutor(max_workers=2)
+
+    def new(delay: float = 0.0, timeout: float = 5.0) -> ToolNode:
+        @tool
+        def write_email(to: str, subject: str, content: str) -> str:
+            """Write and send an email."""
+            time.sleep(delay)
+            sent.append(to)
+            return f"Email sent to {to}"
+
+        wrapped = journaled(write_email, journal)
+        return ToolNode([deferred_until_confirmed(with_timeout(wrapped, timeout, executor))])
+
+    yield new
+    executor.shutdown()
+    journal.close()
+
+@pytest.fixture
+def tool_node(new_tool_node):
+    return new_tool_node()
+
+def _request(tool_call_id: str) -> dict:
+    return {"messages": [AIMessage("", tool_calls=[{
+        "name": "write_email",
+        "args": {"to": "bob@company.com", "subject": "Hi", "content": "Hello"},
+        "id": tool_call_id,
+    }])]}
+
+def test_wrapped_tool_runs_under_tool_node(tool_node, sent):
+    message = tool_node.invoke(_request("call-1"), CONFIG)["messages"][0]
+
+    assert message.status == "success"
+    assert message.tool_call_id == "call-1"
+    assert message.content == "Email sent to bob@company.com"
+    assert sent == ["bob@company.com"]
+
+def test_retried_call_is_replayed_from_the_journal(tool_node, sent):
+    first = tool_node.invoke(_request("call-1"), CONFIG)["messages"][0]
+    again = asyncio.run(tool_node.ainvoke(_request("call-1"), CONFIG))["messages"][0]
+
+    assert again.status == "success"
+    assert again.content == first.content
+    assert sent == ["bob@company.com"]
+
+def test_retry_after_async_timeout_joins_the_running_call(new_tool_node, sent):
+    tool_node = new_tool_node(delay=0.5, timeout=0.2)
+
+    async def timeout_then_retry():
+        timed_out = (await tool_node.ainvoke(_request("call-1"), CONFIG))["messages"][0]
+        # the call goes on after its timeout, the retry finds it done
+        await asyncio.sleep(0.5)
+        retried = (await tool_node.ainvoke(_request("call-1"), CONFIG))["messages"][0]
+        return timed_out, retried
+
+    timed_out, retried = asyncio.run(timeout_then_retry())
+
+    assert timed_out.status == "error"
+    assert "did not answer within" in timed_out.content
+    assert retried.status == "success"
+    assert retried.content == "Email sent to bob@company.com"
+    assert sent == ["bob@company.com"]
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+async def bounded_as_completed(
+    items: AsyncIterable[T],
+    func: Callable[[T], Awaitable[R]],
+    limit: int,
+) -> AsyncIterator[R]:
+    """Apply an async function to a stream, with at most `limit` calls in flight.
+
+    The source is only pulled when a slot frees up, so a slow consumer or a slow
+    model server applies backpressure all the way to the producer.
+
+    Args:
+        items (AsyncIterable[T]): Source stream.
+        func (Callable[[T], Awaitable[R]]): Coroutine function applied to every item.
+        limit (int): Maximum number of concurrent calls of `func`.
+
+    Yields:
+        R: Results of `func`, in completion order.
+    """
+    iterator = aiter(items)
+    pending: set[asyncio.Task] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < limit:
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    exhausted = True
+                    break
+                pending.add(asyncio.ensure_future(func(item)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def iterate_in_thread(items: Iterable[T], maxsize: int = 64) -> AsyncIterator[T]:
+    """Iterate a blocking iterable (file reads, parsing) in a worker thread.
+
+    The thread stays at most `maxsize` items ahead of the consumer: once the queue is
+    full it waits for a slot, so memory stays bounded whatever the size of the source.
+    It stops as soon as the consumer does.
+
+    Args:
+        items (Iterable[T]): Source iterable, only ever touched by the worker thread.
+        maxsize (int): Maximum number of items read ahead.
+
+    Yields:
+        T: Items of the source, in order.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(maxsize)
+    stopped = threading.Event()
+    done = object()
+
+    def send(kind: object, value: object) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        except RuntimeError:
+            # the loop is closed, nobody is listening any more
+            stopped.set()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                while not slots.acquire(timeout=0.1):
+                    if stopped.is_set():
+                        return
+                if stopped.is_set():
+                    return
+                send(None, item)
+            send(done, None)
+        except BaseException as e:
+            send(done, e)
+
+    threading.Thread(target=produce, name="iterate_in_thread", daemon=True).start()
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind is done:
+                if value is not None:
+                    raise value
+                return
+            slots.release()
+            yield value
+    finally:
+        stopped.set()
@@ -0,0 +1,282 @@
+import logging
+import random
+import threading
+import time
+import weakref
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# answers worth retrying on another replica
+RETRY_STATUSES = (502, 503, 504)
+
+class Endpoint:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        # consecutive failures, reset by a success
+        self.streak = 0
+        self.ejected_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+class EndpointPool:
+    """Replicas of one OpenAI-compatible server, picked by least outstanding requests.
+
+    A replica failing `eject_after` times in a row (connection errors, 502/503/504) is
+    ejected for `eject_seconds`. Every `probe_interval` seconds a daemon thread asks each
+    replica for `/models`: a replica that answers is put back, one that doesn't is ejected.
+    When every replica is ejected, the one coming back first is used anyway.
+
+    Args:
+        urls (list[str]): Base URLs of the replicas, e.g. "http://10.0.0.2:11434/v1".
+        eject_after (int): Consecutive failures that eject a replica.
+        eject_seconds (float): Seconds an ejected replica gets no traffic.
+        probe_interval (float | None): Seconds between health probes, None to disable them.
+        probe_timeout (float): Timeout of a health probe.
+    """
+
+    def __init__(self,
+                 urls: list[str],
+                 eject_after: int = 3,
+                 eject_seconds: float = 30.0,
+                 probe_interval: float | None = 10.0,
+                 probe_timeout: float = 2.0):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        if probe_interval is not None and len(self.endpoints) > 1:
+            # the thread only holds a weak reference, so an unused pool can still be collected
+            threading.Thread(
+                target=_probe_loop, args=(weakref.ref(self), self.stopped, probe_interval),
+                name="endpoint-probe", daemon=True,
+            ).start()
+
+    def acquire(self, exclude: set[str] = frozenset()) -> Endpoint:
+        """The replica to send the next request to, counted in flight until `release`."""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [e for e in self.endpoints if e.url not in exclude] or self.endpoints
+            available = [e for e in candidates if e.available(now)]
+            if available:
+                fewest = min(e.in_flight for e in available)
+                endpoint = random.choice([e for e in available if e.in_flight == fewest])
+            else:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint) -> None:
+        with self.lock:
+            endpoint.in_flight -= 1
+
+    def succeeded(self, endpoint: Endpoint) -> None:
+        with self.lock:
+            endpoint.streak = 0
+
+    def failed(self, endpoint: Endpoint, reason: str) -> None:
+        with self.lock:
+            endpoint.failures += 1
+            endpoint.streak += 1
+            if endpoint.streak >= self.eject_after and endpoint.available(time.monotonic()):
+                self._eject(endpoint, reason)
+
+    def probe(self) -> None:
+        """Check every replica once."""
+        for endpoint in self.endpoints:
+            try:
+                healthy = httpx.get(endpoint.url + "/models", timeout=self.probe_timeout).status_code < 500
+            except httpx.HTTPError:
+                healthy = False
+            with self.lock:
+                if healthy:
+                    if not endpoint.available(time.monotonic()):
+                        logger.info("endpoint %s is back", endpoint.url)
+                    endpoint.ejected_until, endpoint.streak = 0.0, 0
+                elif endpoint.available(time.monotonic()):
+                    self._eject(endpoint, "health probe failed")
+
+    def stats(self) -> dict[str, dict]:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                e.url: {
+                    "in_flight": e.in_flight,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "ejected": not e.available(now),
+                }
+                for e in self.endpoints
+            }
+
+    def close(self) -> None:
+        self.stopped.set()
+
+    # Helpers
+
+    def _eject(self, endpoint: Endpoint, reason: str) -> None:
+        endpoint.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning("endpoint %s ejected for %gs: %s", endpoint.url, self.eject_seconds, reason)
+
+def _probe_loop(pool_ref, stopped: threading.Event, interval: float) -> None:
+    while not stopped.wait(interval):
+        pool = pool_ref()
+        if pool is None:
+            return
+        pool.probe()
+        del pool
+
+def _rewrite(request: httpx.Request, base_url: str, endpoint: Endpoint) -> httpx.Request:
+    """`request`, made against `base_url`, sent to `endpoint` instead."""
+    url = str(request.url)
+    if url.startswith(base_url):
+        url = endpoint.url + url[len(base_url):]
+    headers = [(name, value) for name, value in request.headers.raw if name.lower() != b"host"]
+    return httpx.Request(
+        request.method, url, headers=headers, content=request.content, extensions=request.extensions
+    )
+
+class _ReleasingStream(httpx.SyncByteStream):
+    # a response is in flight until its body is closed, not when its headers arrive
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.release()
+            self.release = lambda: None
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self.stream.aclose()
+        finally:
+            self.release()
+            self.release = lambda: None
+
+class BalancedTransport(httpx.BaseTransport):
+    """httpx transport spreading the requests of one client over an `EndpointPool`.
+
+    The client is built with the first replica as its base URL; each request is sent to
+    the replica picked by the pool, and retried on another one after a connection error
+    or a 502/503/504, `retries` times at most.
+
+    Args:
+        pool (EndpointPool): The replicas.
+        transports (dict[str, httpx.BaseTransport]): Connection pool of every replica, by URL.
+        retries (int): Other replicas tried after a failure.
+    """
+
+    def __init__(self, pool: EndpointPool, transports: dict[str, httpx.BaseTransport], retries: int = 2):
+        self.pool = pool
+        self.transports = transports
+        self.retries = retries
+        self.base_url = pool.endpoints[0].url
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        tried: set[str] = set()
+        for attempt in range(self.retries + 1):
+            endpoint = self.pool.acquire(exclude=tried)
+            tried.add(endpoint.url)
+            last = attempt == self.retries
+            try:
+                response = self.transports[endpoint.url].handle_request(
+                    _rewrite(request, self.base_url, endpoint)
+                )
+            except httpx.TransportError as e:
+                self.pool.release(endpoint)
+                self.pool.failed(endpoint, repr(e))
+                if last:
+                    raise
+                continue
+            except BaseException:
+                # cancelled or interrupted, not the replica's fault
+                self.pool.release(endpoint)
+                raise
+            if response.status_code in RETRY_STATUSES:
+                self.pool.failed(endpoint, f"status {response.status_code}")
+                if not last:
+                    try:
+                        response.close()
+                    finally:
+                        self.pool.release(endpoint)
+                    continue
+            else:
+                self.pool.succeeded(endpoint)
+            response.stream = _ReleasingStream(response.stream, lambda e=endpoint: self.pool.release(e))
+            return response
+
+    def close(self) -> None:
+        for transport in self.transports.values():
+            transport.close()
+
+class AsyncBalancedTransport(httpx.AsyncBaseTransport):
+    """Async `BalancedTransport`, sharing the `EndpointPool` of the sync one."""
+
+    def __init__(self, pool: EndpointPool, transports: dict[str, httpx.AsyncBaseTransport], retries: int = 2):
+        self.pool = pool
+        self.transports = transports
+        self.retries = retries
+        self.base_url = pool.endpoints[0].url
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        tried: set[str] = set()
+        for attempt in range(self.retries + 1):
+            endpoint = self.pool.acquire(exclude=tried)
+            tried.add(endpoint.url)
+            last = attempt == self.retries
+            try:
+                response = await self.transports[endpoint.url].handle_async_request(
+                    _rewrite(request, self.base_url, endpoint)
+                )
+            except httpx.TransportError as e:
+                self.pool.release(endpoint)
+                self.pool.failed(endpoint, repr(e))
+                if last:
+                    raise
+                continue
+            except BaseException:
+                # cancelled or interrupted, not the replica's fault
+                self.pool.release(endpoint)
+                raise
+            if response.status_code in RETRY_STATUSES:
+                self.pool.failed(endpoint, f"status {response.status_code}")
+                if not last:
+                    try:
+                        await response.aclose()
+                    finally:
+                        self.pool.release(endpoint)
+                    continue
+            else:
+                self.pool.succeeded(endpoint)
+            response.stream = _AsyncReleasingStream(response.stream, lambda e=endpoint: self.pool.release(e))
+            return response
+
+    async def aclose(self) -> None:
+        for transport in self.transports.values():
+            await transport.aclose()
@@ -0,0 +1,199 @@
+import atexit
+import importlib.util
+import logging
+import threading
+
+import httpx
+
+from lang_graph_project.config import open_ai as open_ai_config
+from lang_graph_project.utils.balancer import AsyncBalancedTransport, BalancedTransport, EndpointPool
+
+logger = logging.getLogger(__name__)
+
+class ClientRegistry:
+    """Process-wide HTTP clients of the model and embedding clients, one pool per server.
+
+    Every chat model and embeddings object built by utils/open_ai.py for the same server
+    shares one sync and one async `httpx` client, so their keep-alive connections are
+    reused across agents and workers instead of each opening its own pool. Several
+    replicas of a server are balanced by `utils.balancer.BalancedTransport`, each replica
+    with its own connection pool.
+
+    Args:
+        max_connections (int): Connections open at most per pool.
+        max_keepalive (int): Idle connections kept alive per pool.
+        keepalive_expiry (float): Seconds an idle connection is kept.
+        timeout (float): Read/write/pool timeout of a request, in seconds.
+        connect_timeout (float): Timeout of opening a connection, in seconds.
+        http2 (bool): Negotiate HTTP/2 with TLS servers, when the `h2` package is installed.
+        retries (int): Other replicas tried after a failure, see `BalancedTransport`.
+        eject_after (int): Consecutive failures that eject a replica, see `EndpointPool`.
+        eject_seconds (float): Seconds an ejected replica gets no traffic.
+        probe_interval (float | None): Seconds between health probes of the replicas.
+    """
+
+    def __init__(self,
+                 max_connections: int = 64,
+                 max_keepalive: int = 32,
+                 keepalive_expiry: float = 60.0,
+                 timeout: float = 120.0,
+                 connect_timeout: float = 5.0,
+                 http2: bool = True,
+                 retries: int = 2,
+                 eject_after: int = 3,
+                 eject_seconds: float = 30.0,
+                 probe_interval: float | None = 10.0):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.http2:
+            logger.info("h2 is not installed, model clients use HTTP/1.1 (pip install httpx[http2])")
+        self.retries = retries
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.probe_interval = probe_interval
+        self.lock = threading.Lock()
+        # (kind, urls) -> client, the transport of each replica and the number of requests sent
+        self.clients: dict[tuple[str, str], httpx.Client | httpx.AsyncClient] = {}
+        self.transports: dict[tuple[str, str], dict[str, httpx.BaseTransport | httpx.AsyncBaseTransport]] = {}
+        self.requests: dict[tuple[str, str], int] = {}
+        # urls -> replicas, shared by the sync and async clients
+        self.pools: dict[str, EndpointPool] = {}
+
+    def client(self, endpoints: str | list[str]) -> httpx.Client:
+        """The sync client of a server, or of a list of replicas of it."""
+        urls = self._urls(endpoints)
+        key = ("sync", ",".join(urls))
+        with self.lock:
+            if key not in self.clients:
+                transports = {
+                    url: httpx.HTTPTransport(limits=self.limits, http2=self.http2) for url in urls
+                }
+                transport = transports[urls[0]]
+                if len(urls) > 1:
+                    transport = BalancedTransport(self._pool(urls), transports, self.retries)
+                self.transports[key] = transports
+                self.requests[key] = 0
+                self.clients[key] = httpx.Client(
+                    transport=transport,
+                    timeout=self.timeout,
+                    event_hooks={"request": [lambda request: self._count(key)]},
+                )
+            return self.clients[key]
+
+    def async_client(self, endpoints: str | list[str]) -> httpx.AsyncClient:
+        """The async client of a server, or of a list of replicas of it."""
+        urls = self._urls(endpoints)
+        key = ("async", ",".join(urls))
+        with self.lock:
+            if key not in self.clients:
+                transports = {
+                    url: httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2) for url in urls
+                }
+                transport = transports[urls[0]]
+                if len(urls) > 1:
+                    transport = AsyncBalancedTransport(self._pool(urls), transports, self.retries)
+
+                async def count(request: httpx.Request) -> None:
+                    self._count(key)
+
+                self.transports[key] = transports
+                self.requests[key] = 0
+                self.clients[key] = httpx.AsyncClient(
+                    transport=transport,
+                    timeout=self.timeout,
+                    event_hooks={"request": [count]},
+                )
+            return self.clients[key]
+
+    def stats(self) -> dict[str, dict]:
+        """Utilization of every pool, keyed by "kind url".
+
+        `active` connections are serving a request, `idle` ones are kept alive for the next;
+        `utilization` is active / max_connections, near 1 when workers queue for a connection.
+        `requests` counts the requests of the whole client, over all its replicas.
+        """
+        with self.lock:
+            entries = list(self.transports.items())
+            requests = dict(self.requests)
+        stats = {}
+        for key, transports in entries:
+            for url, transport in transports.items():
+                # httpcore's pool behind the httpx transport
+                connections = list(getattr(getattr(transport, "_pool", None), "connections", []))
+                idle = sum(1 for connection in connections if connection.is_idle())
+                stats[f"{key[0]} {url}"] = {
+                    "requests": requests[key],
+                    "connections": len(connections),
+                    "active": len(connections) - idle,
+                    "idle": idle,
+                    "max_connections": self.limits.max_connections,
+                    "utilization": (len(connections) - idle) / self.limits.max_connections,
+                }
+        return stats
+
+    def endpoint_stats(self) -> dict[str, dict]:
+        """Requests in flight, failures and ejection of the replicas of every balanced server."""
+        with self.lock:
+            pools = list(self.pools.values())
+        return {url: stats for pool in pools for url, stats in pool.stats().items()}
+
+    def close(self) -> None:
+        """Close the sync clients; async ones are closed by their event loop's shutdown."""
+        with self.lock:
+            for key, client in list(self.clients.items()):
+                if isinstance(client, httpx.Client):
+                    client.close()
+                    del self.clients[key], self.transports[key], self.requests[key]
+            for pool in self.pools.values():
+                pool.close()
+
+    # Helpers
+
+    def _urls(self, endpoints: str | list[str]) -> list[str]:
+        urls = [endpoints] if isinstance(endpoints, str) else list(endpoints)
+        if not urls:
+            raise ValueError("at least one endpoint is needed")
+        return [url.rstrip("/") for url in urls]
+
+    def _pool(self, urls: list[str]) -> EndpointPool:
+        key = ",".join(urls)
+        if key not in self.pools:
+            self.pools[key] = EndpointPool(
+                urls,
+                eject_after=self.eject_after,
+                eject_seconds=self.eject_seconds,
+                probe_interval=self.probe_interval,
+            )
+        return self.pools[key]
+
+    def _count(self, key: tuple[str, str]) -> None:
+        with self.lock:
+            self.requests[key] += 1
+
+_registry: ClientRegistry | None = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> ClientRegistry:
+    """The process-wide registry, configured in config/open_ai.py."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry(
+                max_connections=open_ai_config.HTTP_MAX_CONNECTIONS,
+                max_keepalive=open_ai_config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=open_ai_config.HTTP_KEEPALIVE_EXPIRY,
+                timeout=open_ai_config.HTTP_TIMEOUT,
+                connect_timeout=open_ai_config.HTTP_CONNECT_TIMEOUT,
+                http2=open_ai_config.HTTP2,
+                retries=open_ai_config.ENDPOINT_RETRIES,
+                eject_after=open_ai_config.ENDPOINT_EJECT_AFTER,
+                eject_seconds=open_ai_config.ENDPOINT_EJECT_SECONDS,
+                probe_interval=open_ai_config.ENDPOINT_PROBE_INTERVAL,
+            )
+            atexit.register(_registry.close)
+        return _registry
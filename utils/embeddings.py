@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+def normalize_text(text: str) -> str:
+    # the same mail re-sent or re-quoted often differs only in unicode form and whitespace
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that never embeds the same text twice.
+
+    Vectors are keyed on (model, sha256 of the normalized text) and kept in an
+    in-process LRU, optionally backed by a SQLite file shared across restarts.
+    Queries and documents share the cache: OpenAI-compatible endpoints embed both
+    the same way.
+
+    Args:
+        embeddings (Embeddings): The wrapped embeddings, only called on cache misses.
+        model (str): Model name, part of the cache key.
+        maxsize (int): Number of vectors kept in the in-process LRU.
+        path (str | None): SQLite file of the on-disk layer, None to disable it.
+    """
+
+    def __init__(self,
+                 embeddings: Embeddings,
+                 model: str,
+                 maxsize: int = 10000,
+                 path: str | None = None):
+        self.embeddings = embeddings
+        self.model = model
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.lru: OrderedDict[str, list[float]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        if path is not None:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.model}\0{normalize_text(text)}".encode("utf-8")
+        ).hexdigest()
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.lru),
+            }
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            embedded = self.embeddings.embed_documents([texts[i] for i in missing.values()])
+            self._store(missing, embedded)
+            vectors.update(zip(missing, embedded))
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys, vectors, missing = self._lookup(texts)
+        if missing:
+            embedded = await self.embeddings.aembed_documents([texts[i] for i in missing.values()])
+            self._store(missing, embedded)
+            vectors.update(zip(missing, embedded))
+        return [vectors[key] for key in keys]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    # Helpers
+
+    def _lookup(self, texts: list[str]) -> tuple[list[str], dict[str, list[float]], dict[str, int]]:
+        """Split texts into cached vectors and the (deduplicated) keys still to embed."""
+        keys = [self.cache_key(text) for text in texts]
+        vectors: dict[str, list[float]] = {}
+        missing: dict[str, int] = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in vectors or key in missing:
+                    # duplicate inside the same call, embedded once
+                    self.hits += 1
+                    continue
+                vector = self.lru.get(key)
+                if vector is not None:
+                    self.lru.move_to_end(key)
+                elif self.conn is not None:
+                    row = self.conn.execute(
+                        "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                        self._remember(key, vector)
+                if vector is None:
+                    self.misses += 1
+                    missing[key] = i
+                else:
+                    self.hits += 1
+                    vectors[key] = vector
+        return keys, vectors, missing
+
+    def _store(self, missing: dict[str, int], embedded: list[list[float]]) -> None:
+        with self.lock:
+            for key, vector in zip(missing, embedded):
+                self._remember(key, vector)
+            if self.conn is not None:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        [
+                            (key, np.asarray(vector, dtype=np.float32).tobytes())
+                            for key, vector in zip(missing, embedded)
+                        ],
+                    )
+
+    def _remember(self, key: str, vector: list[float]) -> None:
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
@@ -9,7 +9,7 @@ Email Content:
 > Triage Result: {result}"""
 
 # Format list of few shots
-def format_few_shot_examples_v1(examples):
+def format_few_shot_examples_v1(examples, max_chars: int | None = 400):
     strs = ["Here are some previous examples:"]
     for eg in examples:
         strs.append(
@@ -17,7 +17,7 @@ def format_few_shot_examples_v1(examples):
                 subject=eg.value["email"]["subject"],
                 to_email=eg.value["email"]["to"],
                 from_email=eg.value["email"]["author"],
-                content=eg.value["email"]["email_thread"][:400],
+                content=eg.value["email"]["email_thread"][:max_chars],
                 result=eg.value["label"],
             )
         )
@@ -0,0 +1,203 @@
+import html
+import json
+import os
+import re
+from email import policy
+from email.parser import BytesHeaderParser, BytesParser
+from typing import AsyncIterator, Callable, Iterable, Iterator
+
+from lang_graph_project.utils.aio import iterate_in_thread
+
+# raw headers kept in email_input["headers"], the ones the pre-triage rules look at
+KEPT_HEADERS = ("List-Unsubscribe", "List-Id", "Precedence", "Auto-Submitted")
+# larger header blocks are truncated, so that one broken message can't blow the memory
+MAX_HEADER_BYTES = 256 * 1024
+
+class InboxMessage:
+    """One email of a mailbox: headers parsed up front, body only read when asked for.
+
+    Args:
+        id (str): Message-ID, or the position of the email in its source.
+        headers (dict[str, str]): Decoded headers, first occurrence of each name.
+        load_body (Callable[[], str]): Reads and decodes the body.
+    """
+
+    def __init__(self, id: str, headers: dict[str, str], load_body: Callable[[], str]):
+        self.id = id
+        self.headers = headers
+        self.load_body = load_body
+
+    @property
+    def author(self) -> str:
+        return self.headers.get("From", "")
+
+    @property
+    def to(self) -> str:
+        return self.headers.get("To", "")
+
+    @property
+    def subject(self) -> str:
+        return self.headers.get("Subject", "")
+
+    def body(self) -> str:
+        return self.load_body()
+
+    def to_email_input(self) -> dict:
+        """The `email_input` dict the agents take."""
+        email_input = {
+            "id": self.id,
+            "author": self.author,
+            "to": self.to,
+            "subject": self.subject,
+            "email_thread": self.body(),
+        }
+        headers = {name: self.headers[name] for name in KEPT_HEADERS if name in self.headers}
+        if headers:
+            email_input["headers"] = headers
+        return email_input
+
+def read_mbox(path: str) -> Iterator[InboxMessage]:
+    """Stream the emails of an mbox file, one message in memory at a time.
+
+    The file is scanned line by line for `From ` separators; only the header block of
+    each message is kept, its body is read back from the file on demand.
+    """
+    with open(path, "rb") as f:
+        offset, index = 0, 0
+        start = body_start = None
+        header = bytearray()
+        previous_blank = True
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if start is not None:
+                    yield _mbox_message(path, index, bytes(header), body_start, offset)
+                    index += 1
+                start, body_start = offset + len(line), None
+                header = bytearray()
+            elif start is not None and body_start is None:
+                if line.strip() == b"":
+                    body_start = offset + len(line)
+                elif len(header) < MAX_HEADER_BYTES:
+                    header += line
+            previous_blank = line.strip() == b""
+            offset += len(line)
+        if start is not None:
+            yield _mbox_message(path, index, bytes(header), body_start, offset)
+
+def read_maildir(path: str) -> Iterator[InboxMessage]:
+    """Stream the emails of a Maildir (its `new` and `cur` folders), reading headers only."""
+    for folder in ("new", "cur"):
+        directory = os.path.join(path, folder)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith("."):
+                    continue
+                with open(entry.path, "rb") as f:
+                    header = bytearray()
+                    for line in f:
+                        if line.strip() == b"":
+                            break
+                        if len(header) < MAX_HEADER_BYTES:
+                            header += line
+                    body_start = f.tell()
+                # the unique part of a Maildir name stops at the flags
+                yield _file_message(entry.path, entry.name.split(":")[0], bytes(header), body_start)
+
+def read_jsonl(path: str) -> Iterator[InboxMessage]:
+    """Stream the emails of a JSON Lines file.
+
+    Each line is an object in the `email_input` shape, or with `from`/`body` instead of
+    `author`/`email_thread` like the examples of the triage agents.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for index, line in enumerate(f):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            headers = dict(record.get("headers") or {})
+            headers.update({
+                "From": record.get("author", record.get("from", "")),
+                "To": record.get("to", ""),
+                "Subject": record.get("subject", ""),
+            })
+            body = record.get("email_thread", record.get("body", ""))
+            yield InboxMessage(
+                str(record.get("id", index)),
+                headers,
+                lambda body=body: body,
+            )
+
+def open_inbox(path: str) -> Iterator[InboxMessage]:
+    """`read_maildir`, `read_jsonl` or `read_mbox`, depending on what `path` is."""
+    if os.path.isdir(path):
+        return read_maildir(path)
+    if path.endswith((".jsonl", ".ndjson")):
+        return read_jsonl(path)
+    return read_mbox(path)
+
+def email_inputs(messages: Iterable[InboxMessage]) -> Iterator[dict]:
+    for message in messages:
+        yield message.to_email_input()
+
+def stream_inbox(path: str, maxsize: int = 64) -> AsyncIterator[dict]:
+    """The emails of a mailbox as `email_input` dicts, for `EmailAgent.aprocess_stream`.
+
+    Files are read in a worker thread that stays at most `maxsize` emails ahead of the
+    consumer, so a mailbox of any size is processed in constant memory.
+    """
+    return iterate_in_thread(email_inputs(open_inbox(path)), maxsize=maxsize)
+
+# Helpers
+
+def _parse_headers(header: bytes, fallback_id: str) -> tuple[str, dict[str, str]]:
+    message = BytesHeaderParser(policy=policy.default).parsebytes(header)
+    headers = {}
+    for name, value in message.items():
+        headers.setdefault(name, str(value))
+    id = headers.get("Message-ID", "").strip().strip("<>") or fallback_id
+    return id, headers
+
+def _mbox_message(path: str, index: int, header: bytes, body_start: int | None, end: int) -> InboxMessage:
+    id, headers = _parse_headers(header, f"{os.path.basename(path)}:{index}")
+
+    def load_body() -> str:
+        if body_start is None:
+            return ""
+        with open(path, "rb") as f:
+            f.seek(body_start)
+            body = f.read(end - body_start)
+        # mboxrd: ">From " in a body was escaped on write
+        body = re.sub(rb"(?m)^>(>*From )", rb"\1", body)
+        return _decode_body(header, body)
+
+    return InboxMessage(id, headers, load_body)
+
+def _file_message(path: str, name: str, header: bytes, body_start: int) -> InboxMessage:
+    id, headers = _parse_headers(header, name)
+
+    def load_body() -> str:
+        with open(path, "rb") as f:
+            f.seek(body_start)
+            return _decode_body(header, f.read())
+
+    return InboxMessage(id, headers, load_body)
+
+def _decode_body(header: bytes, body: bytes) -> str:
+    """Text of a raw MIME body: the plain part if any, else the HTML one stripped of its tags."""
+    message = BytesParser(policy=policy.default).parsebytes(header + b"\n" + body)
+    part = message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except (LookupError, ValueError):
+        # unknown charset or broken encoding
+        content = part.get_payload(decode=True).decode("utf-8", errors="replace")
+    if not isinstance(content, str):
+        return ""
+    if part.get_content_subtype() == "html":
+        content = html.unescape(re.sub(r"(?s)<(script|style).*?</\1>|<[^>]+>", " ", content))
+        content = re.sub(r"[ \t]+", " ", content)
+    return content.strip()
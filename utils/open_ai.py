@@ -1,7 +1,12 @@
 from langchain.chat_models import init_chat_model
+from langchain_core.embeddings import Embeddings
 from langchain_openai import OpenAIEmbeddings
+from pydantic import BaseModel
 
 from lang_graph_project.config import open_ai as open_ai_config
+from lang_graph_project.utils.clients import get_registry
+from lang_graph_project.utils.embeddings import CachedEmbeddings
+from lang_graph_project.utils.response_cache import CachedStructuredOutput, ResponseCache
 
 def get_base_url() -> str:
     return open_ai_config.BASE_URL
@@ -9,20 +14,71 @@ def get_base_url() -> str:
 def get_api_key() -> str:
     return open_ai_config.API_KEY
 
-def create_model(model: str, temperature: float = 0.0, model_provider: str = "openai"):
+def create_model(model: str, 
+                 temperature: float = 0.0, 
+                 model_provider: str = "openai", 
+                 endpoints: list[str] | None = None):
+    # every model of the process talks to the servers through the same connection pools,
+    # balanced over the replicas of config/open_ai.py
+    endpoints = endpoints or open_ai_config.CHAT_ENDPOINTS
+    registry = get_registry()
     chat_model = init_chat_model(
         model=model,
         model_provider=model_provider,
-        base_url=get_base_url(),
+        base_url=endpoints[0],
         api_key=get_api_key(),
+        http_client=registry.client(endpoints),
+        http_async_client=registry.async_client(endpoints),
+        timeout=open_ai_config.HTTP_TIMEOUT,
         # temperature=temperature,
     )
     return chat_model
 
-def new_embbedings(model: str) -> OpenAIEmbeddings:
-    return OpenAIEmbeddings(
-        base_url=get_base_url(),
+def new_embbedings(model: str, 
+                   cache: bool = open_ai_config.EMBEDDING_CACHE, 
+                   endpoints: list[str] | None = None) -> Embeddings:
+    endpoints = endpoints or open_ai_config.EMBEDDING_ENDPOINTS
+    registry = get_registry()
+    embeddings = OpenAIEmbeddings(
+        base_url=endpoints[0],
         api_key=get_api_key(),
+        http_client=registry.client(endpoints),
+        http_async_client=registry.async_client(endpoints),
+        timeout=open_ai_config.HTTP_TIMEOUT,
         model=model,
         check_embedding_ctx_length=False # check_embedding_ctx_length must be set to False for local testing, otherwise it will fail with a 400 error.
-    )
\ No newline at end of file
+    )
+    if not cache:
+        return embeddings
+    # the same email body or search query is embedded again and again, don't pay for it twice
+    return CachedEmbeddings(
+        embeddings,
+        model=model,
+        maxsize=open_ai_config.EMBEDDING_CACHE_SIZE,
+        path=open_ai_config.EMBEDDING_CACHE_PATH,
+    )
+
+def new_structured_output(chat, 
+                          schema: type[BaseModel], 
+                          cache: bool = open_ai_config.RESPONSE_CACHE, 
+                          runnable=None, 
+                          llm_string: str | None = None):
+    """`chat.with_structured_output(schema)`, or `runnable`, cached when `cache` is set.
+
+    `llm_string` identifies the model(s) behind the answers in the cache keys, the
+    settings of `chat` if None.
+    """
+    llm = runnable or chat.with_structured_output(schema)
+    if not cache:
+        return llm
+    # a mail storm (the same announcement sent to every alias) is classified once
+    return CachedStructuredOutput(
+        llm,
+        schema,
+        ResponseCache(
+            open_ai_config.RESPONSE_CACHE_PATH,
+            ttl=open_ai_config.RESPONSE_CACHE_TTL,
+            maxsize=open_ai_config.RESPONSE_CACHE_SIZE,
+        ),
+        llm_string=llm_string or chat._get_llm_string(),
+    )
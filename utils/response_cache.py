@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from langchain_core.messages import HumanMessage, convert_to_messages
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import BaseModel
+
+class ResponseCache:
+    """SQLite key/value store of model responses, with expiry and a size bound.
+
+    Args:
+        path (str): Database file, ":memory:" for a process-local cache.
+        ttl (float | None): Seconds a response stays valid, None to keep it until evicted.
+        maxsize (int): Number of responses kept, least recently used first out.
+    """
+
+    def __init__(self, path: str, ttl: float | None = None, maxsize: int = 100000):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self.size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """The fresh responses stored under `keys`, missing and expired keys are left out."""
+        now = time.time()
+        unique = list(dict.fromkeys(keys))
+        found: dict[str, str] = {}
+        with self.lock:
+            # stay below SQLITE_MAX_VARIABLE_NUMBER
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, value, created_at FROM responses "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, value, created_at in rows:
+                    if self.ttl is None or now - created_at <= self.ttl:
+                        found[key] = value
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def put_many(self, items: dict[str, str]) -> None:
+        if not items:
+            return
+        now = time.time()
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in items.items()],
+                )
+            # an upper bound: replaced keys are counted again until the next eviction
+            self.size += len(items)
+            if self.size > self.maxsize:
+                self._evict(now)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": self.size,
+            }
+
+    def clear(self) -> None:
+        with self.lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM responses")
+            self.size = 0
+
+    # Helpers
+
+    def _evict(self, now: float) -> None:
+        with self.conn:
+            if self.ttl is not None:
+                self.conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+        self.size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+class CachedStructuredOutput(Runnable):
+    """Structured-output runnable that never asks the model the same question twice.
+
+    Results are keyed on the exact input messages, the model and its settings and the
+    output schema, and stored in a `ResponseCache`. Identical inputs of one `batch`
+    call, or concurrent `ainvoke` calls, reach the model only once.
+
+    Args:
+        runnable (Runnable): `chat.with_structured_output(schema)`.
+        schema (type[BaseModel]): The output schema, used to rebuild cached results.
+        cache (ResponseCache): Where the results are stored.
+        llm_string (str): Model name and settings, `chat._get_llm_string()`.
+    """
+
+    def __init__(self,
+                 runnable: Runnable,
+                 schema: type[BaseModel],
+                 cache: ResponseCache,
+                 llm_string: str):
+        self.runnable = runnable
+        self.schema = schema
+        self.cache = cache
+        self.llm_string = llm_string
+        # cache key -> future of the request in flight, see ainvoke
+        self.pending: dict[str, asyncio.Future] = {}
+
+    def cache_key(self, input: Any) -> str:
+        if hasattr(input, "to_messages"):
+            messages = input.to_messages()
+        elif isinstance(input, str):
+            messages = [HumanMessage(content=input)]
+        else:
+            messages = convert_to_messages(input)
+        return hashlib.sha256(
+            json.dumps(
+                [self.llm_string, self.schema.__name__, [[m.type, m.content] for m in messages]],
+                ensure_ascii=False,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def lookup(self, inputs: list) -> list[BaseModel | None]:
+        """The cached result of each input, None for misses."""
+        keys = [self.cache_key(input) for input in inputs]
+        found = self.cache.get_many(keys)
+        return [
+            self.schema.model_validate_json(found[key]) if key in found else None
+            for key in keys
+        ]
+
+    def remember(self, inputs: list, results: list) -> None:
+        """Store results computed elsewhere, e.g. by a packed batch request."""
+        self.cache.put_many({
+            self.cache_key(input): result.model_dump_json()
+            for input, result in zip(inputs, results)
+            if isinstance(result, self.schema)
+        })
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> BaseModel:
+        cached = self.lookup([input])[0]
+        if cached is not None:
+            return cached
+        result = self.runnable.invoke(input, config, **kwargs)
+        self.remember([input], [result])
+        return result
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs: Any) -> BaseModel:
+        key = self.cache_key(input)
+        pending = self.pending.get(key)
+        if pending is not None:
+            # the same messages are already being classified, e.g. one mail sent to many aliases
+            return await asyncio.shield(pending)
+        cached = (await asyncio.to_thread(self.lookup, [input]))[0]
+        if cached is not None:
+            return cached
+        pending = self.pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            result = await self.runnable.ainvoke(input, config, **kwargs)
+            await asyncio.to_thread(self.remember, [input], [result])
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # nobody else may be waiting for it
+            future.exception()
+            raise
+        finally:
+            del self.pending[key]
+
+    def batch(self,
+              inputs: list,
+              config: RunnableConfig | list[RunnableConfig] | None = None,
+              *,
+              return_exceptions: bool = False,
+              **kwargs: Any) -> list:
+        results, unique = self._prepare(inputs)
+        if unique:
+            computed = self.runnable.batch(
+                [inputs[positions[0]] for positions in unique.values()],
+                self._first_config(config),
+                return_exceptions=return_exceptions,
+                **kwargs,
+            )
+            self._fill(inputs, results, unique, computed)
+        return results
+
+    async def abatch(self,
+                     inputs: list,
+                     config: RunnableConfig | list[RunnableConfig] | None = None,
+                     *,
+                     return_exceptions: bool = False,
+                     **kwargs: Any) -> list:
+        results, unique = await asyncio.to_thread(self._prepare, inputs)
+        if unique:
+            computed = await self.runnable.abatch(
+                [inputs[positions[0]] for positions in unique.values()],
+                self._first_config(config),
+                return_exceptions=return_exceptions,
+                **kwargs,
+            )
+            await asyncio.to_thread(self._fill, inputs, results, unique, computed)
+        return results
+
+    # Helpers
+
+    def _prepare(self, inputs: list):
+        keys = [self.cache_key(input) for input in inputs]
+        found = self.cache.get_many(keys)
+        results: list = [None] * len(inputs)
+        # cache key -> positions of the inputs still to classify
+        unique: dict[str, list[int]] = {}
+        for i, key in enumerate(keys):
+            if key in found:
+                results[i] = self.schema.model_validate_json(found[key])
+            else:
+                unique.setdefault(key, []).append(i)
+        return results, unique
+
+    def _fill(self, inputs: list, results: list, unique: dict[str, list[int]], computed: list) -> None:
+        for positions, result in zip(unique.values(), computed):
+            for i in positions:
+                results[i] = result
+        self.remember([inputs[positions[0]] for positions in unique.values()], computed)
+
+    def _first_config(self, config):
+        # inputs are deduplicated, so per-input configs can't be kept apart
+        if isinstance(config, list):
+            return config[0] if config else None
+        return config
@@ -0,0 +1,214 @@
+import logging
+import re
+import threading
+
+from langgraph.store.base import Item
+
+from lang_graph_project.config import prompt as prompt_config
+
+logger = logging.getLogger(__name__)
+
+# "On Mon, 3 Jun 2024 at 10:00, Jane <jane@x.com> wrote:", possibly wrapped on two lines,
+# followed by the quoted reply or nothing
+ATTRIBUTION = re.compile(
+    r"^On\b[^\n]{0,200}?\n?[^\n]{0,200}?\bwrote:[ \t]*$(?=\s*(>|\Z))", re.MULTILINE
+)
+# Outlook and forwarded history blocks
+HISTORY = re.compile(
+    r"^(-{2,}\s*(Original Message|Forwarded message)\s*-{2,}|_{10,})\s*$|^From:.*\n(.*\n){0,3}?(Sent|Date):",
+    re.MULTILINE | re.IGNORECASE,
+)
+# "-- " signature delimiter and mobile footers
+SIGNATURE = re.compile(r"^(-- ?|Sent from my \w+.*)$", re.MULTILINE)
+
+def strip_quoted(text: str) -> str:
+    """The new part of an email: quoted replies, older history and the signature removed.
+
+    A thread that is nothing but quotes (a bare forward) is kept, only unquoted.
+    """
+    cut = len(text)
+    for pattern in (ATTRIBUTION, HISTORY, SIGNATURE):
+        match = pattern.search(text)
+        if match and match.start() < cut:
+            cut = match.start()
+    lines = [line for line in text[:cut].splitlines() if not line.lstrip().startswith(">")]
+    stripped = "\n".join(lines).strip()
+    if stripped:
+        return stripped
+    return "\n".join(line.lstrip("> ") for line in text.splitlines()).strip()
+
+def dedupe_paragraphs(text: str) -> str:
+    """`text` without the paragraphs it already contains, e.g. history pasted twice in a chain."""
+    seen, paragraphs = set(), []
+    for paragraph in re.split(r"\n\s*\n", text):
+        key = " ".join(paragraph.split()).lower()
+        if key and key in seen:
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs)
+
+def clean_thread(text: str) -> str:
+    return dedupe_paragraphs(strip_quoted(text))
+
+class TokenCounter:
+    """Counts tokens locally with tiktoken, approximately when its encoding can't be loaded.
+
+    tiktoken downloads its encodings on first use, so an offline machine falls back to
+    counting word pieces of at most 4 characters, which overestimates real BPE counts:
+    budgets are then kept with some margin.
+
+    Args:
+        encoding (str): tiktoken encoding name.
+    """
+
+    # approximation: ~4 characters per token for words, 1 per punctuation sign
+    pieces = re.compile(r"\w{1,4}|[^\w\s]")
+
+    def __init__(self, encoding: str = "o200k_base"):
+        self.encoding_name = encoding
+        self.encoding = None
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        encoding = self._encoding()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        return sum(1 for _ in self.pieces.finditer(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The first `max_tokens` tokens of `text`."""
+        encoding = self._encoding()
+        if encoding is not None:
+            tokens = encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+        for i, match in enumerate(self.pieces.finditer(text)):
+            if i == max_tokens:
+                # don't leave half a word
+                return re.sub(r"\w+$", "", text[:match.start()])
+        return text
+
+    # Helpers
+
+    def _encoding(self):
+        if self.loaded:
+            return self.encoding
+        with self.lock:
+            if not self.loaded:
+                try:
+                    import tiktoken
+                    self.encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    logger.warning("tiktoken encoding %s unavailable, counting tokens approximately: %s",
+                                   self.encoding_name, e)
+                self.loaded = True
+        return self.encoding
+
+class TokenBudget:
+    """Fits the email thread and the few-shot examples of a prompt into token budgets.
+
+    Threads are cleaned first (`clean_thread`: quoted replies, history and signatures
+    out, repeated paragraphs once), then truncated to their budget. The examples share
+    `example_tokens`: short ones take what they need and leave the rest to the longer
+    ones. Every call logs the tokens it saved against the untrimmed texts, `stats` sums them.
+
+    Args:
+        email_tokens (int): Budget of the email thread.
+        example_tokens (int): Budget of the contents of all the few-shot examples.
+        counter (TokenCounter | None): Tokenizer, tiktoken's o200k_base if None.
+    """
+
+    def __init__(self,
+                 email_tokens: int = 1500,
+                 example_tokens: int = 1200,
+                 counter: TokenCounter | None = None):
+        self.email_tokens = email_tokens
+        self.example_tokens = example_tokens
+        self.counter = counter or TokenCounter()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def fit(self, email_input: dict, examples: list) -> tuple[dict, list, int]:
+        """The email and the examples of one triage prompt within budget.
+
+        Args:
+            email_input (dict): The email to classify.
+            examples (list[Item]): Its few-shot examples, from the store.
+
+        Returns:
+            tuple[dict, list[Item], int]: Copies of the email and the examples with their
+                threads fitted, and the number of tokens saved.
+        """
+        thread, before, after = self._fit(email_input.get("email_thread") or "", self.email_tokens)
+        fitted_examples = []
+        texts = [clean_thread(item.value["email"].get("email_thread") or "") for item in examples]
+        originals = [self.counter.count(item.value["email"].get("email_thread") or "") for item in examples]
+        needs = [self.counter.count(text) for text in texts]
+        budgets = self._share(needs, self.example_tokens)
+        for item, text, need, budget, original in zip(examples, texts, needs, budgets, originals):
+            if need > budget:
+                text = self.counter.truncate(text, budget) + " [...]"
+            before += original
+            after += min(need, budget)
+            fitted_examples.append(Item(
+                value={**item.value, "email": {**item.value["email"], "email_thread": text}},
+                key=item.key,
+                namespace=tuple(item.namespace),
+                created_at=item.created_at,
+                updated_at=item.updated_at,
+            ))
+        return {**email_input, "email_thread": thread}, fitted_examples, self._report(before, after)
+
+    def fit_email(self, email_input: dict) -> dict:
+        """A copy of the email with its thread within `email_tokens`."""
+        thread, before, after = self._fit(email_input.get("email_thread") or "", self.email_tokens)
+        self._report(before, after)
+        return {**email_input, "email_thread": thread}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": self.tokens_before - self.tokens_after,
+            }
+
+    # Helpers
+
+    def _fit(self, text: str, budget: int) -> tuple[str, int, int]:
+        before = self.counter.count(text)
+        cleaned = clean_thread(text)
+        after = self.counter.count(cleaned)
+        if after > budget:
+            cleaned, after = self.counter.truncate(cleaned, budget) + " [...]", budget
+        return cleaned, before, after
+
+    def _share(self, needs: list[int], budget: int) -> list[int]:
+        # smallest first: whatever a short example leaves is split among the longer ones
+        shares = [0] * len(needs)
+        order = sorted(range(len(needs)), key=needs.__getitem__)
+        for rank, i in enumerate(order):
+            shares[i] = min(needs[i], budget // (len(needs) - rank))
+            budget -= shares[i]
+        return shares
+
+    def _report(self, before: int, after: int) -> int:
+        saved = max(before - after, 0)
+        with self.lock:
+            self.calls += 1
+            self.tokens_before += before
+            self.tokens_after += after
+        logger.info("token budget: %d -> %d tokens, %d saved", before, after, saved)
+        return saved
+
+def new_token_budget() -> TokenBudget:
+    """The token budget configured in config/prompt.py."""
+    return TokenBudget(
+        email_tokens=prompt_config.TOKEN_BUDGET_EMAIL,
+        example_tokens=prompt_config.TOKEN_BUDGET_EXAMPLES,
+        counter=TokenCounter(prompt_config.TOKENIZER_ENCODING),
+    )